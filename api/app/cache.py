@@ -0,0 +1,202 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+from fastapi import Request, Response
+from app.columnar import MEDIA_TYPES, negotiate_format
+from app.cred_manager import get_key
+from app.logger_utility import get_my_logger
+
+logger = get_my_logger("Response Cache", [])
+
+# Seconds a cached response lives before it is rebuilt, e.g. CACHE_TTL=300
+CACHE_TTL = int(get_key("cache", "ttl", "300"))
+
+
+class LRUResponseCache:
+    """
+    In-process response cache used when Redis is not configured. Entries are grouped
+    by the table they were read from so a write to that table drops all of them.
+
+    Each table's invalidations are counted, so a body loaded while one arrived can be
+    recognised and left out of the cache rather than served stale for the TTL. With
+    a single worker, its own change listener sees every invalidation.
+    """
+    def __init__(self, max_entries: int = 256) -> None:
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self._all_generation = 0
+        self._generations = {}
+
+    async def generation(self, table: str) -> Optional[tuple]:
+        return self._all_generation, self._generations.get(table, 0)
+
+    async def get(self, table: str, key: str) -> Optional[tuple]:
+        entry = self.entries.get((table, key))
+        if entry is None:
+            return None
+        expires_at, etag, body = entry
+        if expires_at < time.monotonic():
+            del self.entries[(table, key)]
+            return None
+        self.entries.move_to_end((table, key))
+        return etag, body
+
+    async def set(self, table: str, key: str, etag: str, body: bytes, ttl: int, generation: Optional[tuple]) -> None:
+        if generation is None or generation != await self.generation(table):
+            return
+        self.entries[(table, key)] = (time.monotonic() + ttl, etag, body)
+        self.entries.move_to_end((table, key))
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def invalidate(self, table: str) -> None:
+        if table == "*":
+            self._all_generation += 1
+            self.entries.clear()
+            return
+        self._generations[table] = self._generations.get(table, 0) + 1
+        for cached in [k for k in self.entries if k[0] == table]:
+            del self.entries[cached]
+
+
+# Stores an entry only if neither generation counter has moved since the body was loaded.
+# A missing counter reads as "" on both sides, so an entry can be cached before the first invalidation.
+SET_IF_CURRENT = """
+if (redis.call('GET', KEYS[1]) or '') == ARGV[1] and (redis.call('GET', KEYS[2]) or '') == ARGV[2] then
+    redis.call('SET', KEYS[3], ARGV[3], 'EX', ARGV[4])
+    return 1
+end
+return 0
+"""
+
+
+class RedisResponseCache:
+    """
+    Response cache shared by every API worker through Redis. Each entry is stored as
+    "<etag>\\n<body>" under cache:<table>:<key> with the TTL set by Redis.
+
+    Invalidations are counted in Redis too, under cache:gen:<table> (cache:gen:* for
+    all tables), so a worker notices one that another worker's listener handled
+    while its body was loading. The count is checked and the entry stored by one
+    script, so no invalidation can land in between.
+    """
+    def __init__(self, redis) -> None:
+        self.redis = redis
+        self._set_if_current = redis.register_script(SET_IF_CURRENT)
+
+    async def generation(self, table: str) -> Optional[tuple]:
+        try:
+            return tuple(value or b"" for value in await self.redis.mget("cache:gen:*", f"cache:gen:{table}"))
+        except Exception as e:
+            logger.warning(f"Redis read failed, response will not be cached: {e}")
+            return None
+
+    async def get(self, table: str, key: str) -> Optional[tuple]:
+        try:
+            value = await self.redis.get(f"cache:{table}:{key}")
+        except Exception as e:
+            logger.warning(f"Redis read failed, treating as a cache miss: {e}")
+            return None
+        if value is None:
+            return None
+        etag, _, body = value.partition(b"\n")
+        return etag.decode("ascii"), body
+
+    async def set(self, table: str, key: str, etag: str, body: bytes, ttl: int, generation: Optional[tuple]) -> None:
+        if generation is None:
+            return
+        try:
+            await self._set_if_current(
+                keys=["cache:gen:*", f"cache:gen:{table}", f"cache:{table}:{key}"],
+                args=[*generation, etag.encode("ascii") + b"\n" + body, ttl],
+            )
+        except Exception as e:
+            logger.warning(f"Redis write failed, response not cached: {e}")
+
+    async def invalidate(self, table: str) -> None:
+        try:
+            # Counted before the entries go, so a body loaded before the change can't be stored after it
+            await self.redis.incr(f"cache:gen:{table}")
+            keys = [
+                key async for key in self.redis.scan_iter(match=f"cache:{table}:*", count=500)
+                if not key.startswith(b"cache:gen:")
+            ]
+            if keys:
+                await self.redis.unlink(*keys)
+        except Exception as e:
+            logger.warning(f"Redis invalidation of {table} failed: {e}")
+
+
+async def create_response_cache(app) -> None:
+    """
+    Attach a response cache to app.state, using Redis when it is configured and
+    reachable and an in-process LRU otherwise.
+    """
+    app.state.redis_pool = None
+    try:
+        from app.database.configuration import RedisDatabaseConfiguration
+        redis_config = RedisDatabaseConfiguration().get_config()
+    except Exception:
+        logger.info("Redis is not configured; using the in-process LRU response cache.")
+        app.state.response_cache = LRUResponseCache()
+        return
+
+    try:
+        import redis.asyncio as redis
+        pool = redis.Redis(host=redis_config["host"], port=int(redis_config["port"]), password=redis_config["password"])
+        await pool.ping()
+    except Exception as e:
+        logger.warning(f"Redis is unreachable ({e}); using the in-process LRU response cache.")
+        app.state.response_cache = LRUResponseCache()
+        return
+
+    logger.info("Using the Redis response cache.")
+    app.state.redis_pool = pool
+    app.state.response_cache = RedisResponseCache(pool)
+
+
+async def close_response_cache(app) -> None:
+    if app.state.redis_pool is not None:
+        await app.state.redis_pool.aclose()
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+async def cached_response(
+    request: Request,
+    table: str,
+    loader: Callable[[str], Awaitable[bytes]],
+    ttl: int = CACHE_TTL,
+) -> Response:
+    """
+    Serve a body from the response cache, calling loader(format) to build it on a miss.
+
+    The format (json, arrow or parquet) is negotiated from the Accept header and is
+    part of the cache key. Responses carry a strong ETag; a matching If-None-Match
+    is answered with 304. A body loaded while its table was invalidated is served
+    but not cached, since it may predate the change.
+    """
+    cache = request.app.state.response_cache
+    format = negotiate_format(request)
+    key = request.url.path if not request.url.query else f"{request.url.path}?{request.url.query}"
+    key = f"{format}:{key}"
+
+    cached = await cache.get(table, key)
+    if cached is None:
+        generation = await cache.generation(table)
+        body = await loader(format)
+        etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        await cache.set(table, key, etag, body, ttl, generation)
+    else:
+        etag, body = cached
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type=MEDIA_TYPES[format], headers=headers)
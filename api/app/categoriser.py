@@ -0,0 +1,289 @@
+import re
+from decimal import Decimal
+from functools import lru_cache
+from typing import NamedTuple, Optional
+from uuid import UUID
+from asyncpg.pool import PoolConnectionProxy
+from app.database.postgres.queries import fetch_registered, register_query
+from app.metrics import db_timer
+from app.logger_utility import get_my_logger
+
+logger = get_my_logger("Categoriser", [])
+
+BATCH_SIZE = 50_000
+# Distinct (merchant, description) pairs whose pattern hits are remembered; ledgers repeat them heavily
+TEXT_CACHE_SIZE = 65_536
+
+ACTIVE_RULES = register_query("categorisation_rules.active", """
+    SELECT rule_id, category_id, merchant_pattern, description_pattern, min_amount, max_amount,
+           account_id, transaction_type::text AS transaction_type, priority
+    FROM categorisation_rules
+    WHERE is_active
+    ORDER BY priority, created_at, rule_id
+""")
+
+
+class _Rule(NamedTuple):
+    rule_id: UUID
+    category_id: UUID
+    merchant_pattern: Optional[str]
+    description_pattern: Optional[str]
+    min_amount: Optional[Decimal]
+    max_amount: Optional[Decimal]
+    account_id: Optional[UUID]
+    transaction_type: Optional[str]
+
+
+# A global flag group such as (?i) at the very start of a pattern
+GLOBAL_FLAGS = re.compile(r"\(\?([aiLmsux]+)\)")
+
+
+def compile_pattern(pattern: str) -> re.Pattern:
+    """
+    Compile a rule pattern the way the categoriser uses it, raising re.error if it is
+    invalid on its own or in the form it takes inside the combined regex.
+    """
+    compiled = re.compile(pattern, re.IGNORECASE)
+    if _combinable(compiled):
+        _combine({0: pattern})
+    return compiled
+
+
+def _scoped(pattern: str) -> str:
+    """
+    Turn leading global flags into scoped ones, (?i)amazon into (?i:amazon), since
+    global flags are only allowed at the start of the whole combined regex.
+    """
+    flags = GLOBAL_FLAGS.match(pattern)
+    if flags is None:
+        return pattern
+    # In verbose mode a trailing comment would swallow the closing parenthesis
+    end = "\n)" if "x" in flags.group(1) else ")"
+    return f"(?{flags.group(1)}:{pattern[flags.end():]}{end}"
+
+
+def _combinable(compiled: re.Pattern) -> bool:
+    """
+    Whether a pattern can share the combined regex. One that refers to its own groups
+    (numbered or named backreferences, named groups, conditionals) cannot: its groups
+    are renumbered there, and its names could clash with another rule's.
+    """
+    if compiled.groupindex:
+        return False
+    pattern, i, in_class = compiled.pattern, 0, False
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\":
+            if not in_class and pattern[i + 1:i + 2].isdigit() and pattern[i + 1] != "0":
+                return False
+            i += 2
+        elif in_class:
+            in_class = char != "]"
+            i += 1
+        elif char == "[":
+            # A ] straight after [ or [^ is a literal, not the end of the class
+            i += 2 if pattern[i + 1:i + 2] == "^" else 1
+            i += 1 if pattern[i:i + 1] == "]" else 0
+            in_class = True
+        elif pattern.startswith("(?(", i):
+            return False
+        else:
+            i += 1
+    return True
+
+
+def _combine(patterns: dict) -> Optional[tuple]:
+    """
+    Fold many patterns into one regex that reports every pattern found in a text.
+
+    Each pattern sits in its own optional lookahead anchored at the start, so a single
+    match() call tries all of them without consuming input, and the named group of
+    every pattern that occurs somewhere in the text is set afterwards.
+
+    :param patterns: rule index -> pattern, none of which refers to its own groups
+    :return: (compiled regex, [(group name, rule index)]) or None when there are no patterns
+    """
+    if not patterns:
+        return None
+    parts = [f"(?:(?=[\\s\\S]*?(?P<r{index}>{_scoped(pattern)})))?" for index, pattern in patterns.items()]
+    groups = [(f"r{index}", index) for index in patterns]
+    return re.compile("".join(parts), re.IGNORECASE), groups
+
+
+def _hits(combined: Optional[tuple], separate: dict, text: Optional[str]) -> frozenset:
+    if not text:
+        return frozenset()
+    hits = {index for index, regex in separate.items() if regex.search(text)}
+    if combined is not None:
+        regex, groups = combined
+        match = regex.match(text)
+        hits.update(index for name, index in groups if match.group(name) is not None)
+    return frozenset(hits)
+
+
+class Categoriser:
+    """
+    All active categorisation rules compiled into one in-memory matcher.
+
+    Merchant and description patterns are each combined into a single regex, so a
+    transaction's text takes one regex call per field however many rules there are
+    (though every rule's lookahead still scans the text from the start). Patterns that
+    refer to their own groups cannot be combined and are searched for one by one. The
+    remaining conditions (amount range, account, type) are plain comparisons. Rules are
+    kept in priority order and the first one whose conditions all hold wins.
+    """
+    def __init__(self, rows) -> None:
+        self.rules = []
+        merchant_patterns, description_patterns = {}, {}
+        self._separate_merchant, self._separate_description = {}, {}
+        for row in rows:
+            try:
+                compiled = {
+                    field: compile_pattern(row[field])
+                    for field in ("merchant_pattern", "description_pattern") if row[field] is not None
+                }
+            except re.error as e:
+                logger.warning(f"Skipping categorisation rule {row['rule_id']}: invalid pattern ({e}).")
+                continue
+
+            index = len(self.rules)
+            self.rules.append(_Rule(
+                row["rule_id"], row["category_id"], row["merchant_pattern"], row["description_pattern"],
+                row["min_amount"], row["max_amount"], row["account_id"], row["transaction_type"],
+            ))
+            for field, combined, separate in (
+                ("merchant_pattern", merchant_patterns, self._separate_merchant),
+                ("description_pattern", description_patterns, self._separate_description),
+            ):
+                if field not in compiled:
+                    continue
+                if _combinable(compiled[field]):
+                    combined[index] = row[field]
+                else:
+                    separate[index] = compiled[field]
+
+        self._merchant = _combine(merchant_patterns)
+        self._description = _combine(description_patterns)
+        self._text_hits = lru_cache(maxsize=TEXT_CACHE_SIZE)(self._compute_text_hits)
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def _compute_text_hits(self, merchant_name: Optional[str], description: Optional[str]) -> tuple:
+        return (
+            _hits(self._merchant, self._separate_merchant, merchant_name),
+            _hits(self._description, self._separate_description, description),
+        )
+
+    def match(
+        self,
+        account_id: UUID,
+        amount: Decimal,
+        transaction_type: str,
+        merchant_name: Optional[str],
+        description: Optional[str],
+    ) -> Optional[UUID]:
+        """
+        Category of the highest-priority rule matching a transaction, or None.
+        """
+        if not self.rules:
+            return None
+        merchant_hits, description_hits = self._text_hits(merchant_name, description)
+        for index, rule in enumerate(self.rules):
+            if rule.merchant_pattern is not None and index not in merchant_hits:
+                continue
+            if rule.description_pattern is not None and index not in description_hits:
+                continue
+            if rule.min_amount is not None and amount < rule.min_amount:
+                continue
+            if rule.max_amount is not None and amount > rule.max_amount:
+                continue
+            if rule.account_id is not None and account_id != rule.account_id:
+                continue
+            if rule.transaction_type is not None and transaction_type != rule.transaction_type:
+                continue
+            return rule.category_id
+        return None
+
+    @classmethod
+    async def load(cls, pool) -> "Categoriser":
+        async with pool.acquire() as con:
+            rows = await fetch_registered(ACTIVE_RULES, con)
+        categoriser = cls(rows)
+        logger.info(f"Loaded {len(categoriser)} categorisation rules.")
+        return categoriser
+
+
+async def refresh_categoriser(app, change: dict) -> None:
+    """
+    Change listener callback: recompile the rules when categorisation_rules is written.
+    """
+    if change["table"] in ("categorisation_rules", "*"):
+        app.state.categoriser = await Categoriser.load(app.state.pg_pool)
+
+
+async def categorise_transactions(
+    categoriser: Categoriser,
+    con: PoolConnectionProxy,
+    everything: bool = False,
+    batch_size: int = BATCH_SIZE,
+) -> dict:
+    """
+    Apply the rules to the ledger in batches inside one transaction.
+
+    Rows are read through a server-side cursor over a sequential scan and matched in
+    memory; each batch is written back with a single UPDATE joined to unnest()ed
+    arrays, so the database sees one statement per batch rather than one per row.
+    The UPDATE matches on the full primary key, date included, so each row is looked
+    up in its own month's partition only.
+
+    :param everything: re-evaluate every transaction instead of only uncategorised ones;
+        transactions no rule matches keep their current category
+    :return: counts of transactions scanned and categorised
+    """
+    select = f"""
+        SELECT transaction_id, transaction_date, account_id, description, amount,
+               transaction_type::text AS transaction_type, merchant_name, category_id
+        FROM transactions
+        {"" if everything else "WHERE category_id IS NULL"}
+    """
+    update = f"""
+        UPDATE transactions t
+        SET category_id = u.category_id
+        FROM unnest($1::uuid[], $2::date[], $3::uuid[]) AS u(transaction_id, transaction_date, category_id)
+        WHERE t.transaction_id = u.transaction_id
+          AND t.transaction_date = u.transaction_date
+          AND {"t.category_id IS DISTINCT FROM u.category_id" if everything else "t.category_id IS NULL"}
+    """
+
+    result = {"scanned": 0, "categorised": 0, "rules": len(categoriser)}
+    if not len(categoriser):
+        return result
+
+    async with con.transaction():
+        cursor = await con.cursor(select)
+        while True:
+            with db_timer():
+                rows = await cursor.fetch(batch_size)
+            if not rows:
+                break
+            result["scanned"] += len(rows)
+
+            transaction_ids, transaction_dates, category_ids = [], [], []
+            for row in rows:
+                category_id = categoriser.match(
+                    row["account_id"], row["amount"], row["transaction_type"], row["merchant_name"], row["description"]
+                )
+                # Only rows whose category actually changes are sent back
+                if category_id is not None and category_id != row["category_id"]:
+                    transaction_ids.append(row["transaction_id"])
+                    transaction_dates.append(row["transaction_date"])
+                    category_ids.append(category_id)
+
+            if transaction_ids:
+                with db_timer():
+                    status = await con.execute(update, transaction_ids, transaction_dates, category_ids)
+                result["categorised"] += int(status.split()[-1])
+
+    logger.info(f"Categorised {result['categorised']} of {result['scanned']} transactions scanned.")
+    return result
@@ -0,0 +1,114 @@
+from typing import Dict, FrozenSet, Optional, Tuple
+from uuid import UUID
+from app.database.postgres.queries import fetch_registered, register_query
+from app.logger_utility import get_my_logger
+
+logger = get_my_logger("Category Tree", [])
+
+CATEGORY_HIERARCHY = register_query(
+    "categories.hierarchy",
+    "SELECT category_id, parent_category_id, category_name FROM categories",
+)
+
+
+class CategoryTree:
+    """
+    Immutable in-memory index of the categories hierarchy.
+
+    Ancestor paths and descendant sets are precomputed when the tree is built, so
+    subtree questions are dictionary lookups instead of recursive SQL. A refresh
+    builds a new tree and swaps it in rather than mutating this one.
+    """
+    def __init__(self, rows) -> None:
+        self.names: Dict[UUID, str] = {}
+        self.parents: Dict[UUID, Optional[UUID]] = {}
+        for row in rows:
+            self.names[row["category_id"]] = row["category_name"]
+            self.parents[row["category_id"]] = row["parent_category_id"]
+
+        self._children: Dict[Optional[UUID], list] = {}
+        for category_id, parent_id in self.parents.items():
+            # Categories whose parent no longer exists are treated as roots
+            self._children.setdefault(parent_id if parent_id in self.parents else None, []).append(category_id)
+
+        self._ancestors: Dict[UUID, Tuple[UUID, ...]] = {}
+        for category_id in self.parents:
+            self._ancestors[category_id] = self._walk_up(category_id)
+
+        descendants = {category_id: {category_id} for category_id in self.parents}
+        for category_id, path in self._ancestors.items():
+            for ancestor_id in path:
+                descendants[ancestor_id].add(category_id)
+        self._descendants: Dict[UUID, FrozenSet[UUID]] = {k: frozenset(v) for k, v in descendants.items()}
+
+        # Flattened (category, member of its subtree) pairs for handing to SQL as two arrays
+        self.subtree_pairs = (
+            [category_id for category_id, members in self._descendants.items() for _ in members],
+            [member for members in self._descendants.values() for member in members],
+        )
+
+    def _walk_up(self, category_id: UUID) -> Tuple[UUID, ...]:
+        path, seen = [], {category_id}
+        parent_id = self.parents.get(category_id)
+        while parent_id is not None and parent_id in self.parents and parent_id not in seen:
+            path.append(parent_id)
+            seen.add(parent_id)
+            parent_id = self.parents[parent_id]
+        if parent_id in seen:
+            logger.warning(f"Category {category_id} is part of a parent_category_id cycle.")
+        path.reverse()
+        return tuple(path)
+
+    def __contains__(self, category_id: UUID) -> bool:
+        return category_id in self.parents
+
+    def __len__(self) -> int:
+        return len(self.parents)
+
+    def ancestors(self, category_id: UUID) -> Tuple[UUID, ...]:
+        """
+        Ancestors of a category from the root down to its direct parent.
+        """
+        return self._ancestors[category_id]
+
+    def descendants(self, category_id: UUID, include_self: bool = True) -> FrozenSet[UUID]:
+        """
+        Every category in the subtree under a category.
+        """
+        members = self._descendants[category_id]
+        return members if include_self else members - {category_id}
+
+    def children(self, category_id: Optional[UUID]) -> list:
+        """
+        Direct children of a category, or the root categories when None.
+        """
+        return self._children.get(category_id, [])
+
+    def as_nested(self, category_id: Optional[UUID] = None) -> list:
+        """
+        The (sub)tree as nested dicts, starting from the roots when no category is given.
+        """
+        return [
+            {
+                "category_id": child_id,
+                "category_name": self.names[child_id],
+                "children": self.as_nested(child_id),
+            }
+            for child_id in sorted(self.children(category_id), key=self.names.get)
+        ]
+
+    @classmethod
+    async def load(cls, pool) -> "CategoryTree":
+        async with pool.acquire() as con:
+            rows = await fetch_registered(CATEGORY_HIERARCHY, con)
+        tree = cls(rows)
+        logger.info(f"Loaded category tree with {len(tree)} categories.")
+        return tree
+
+
+async def refresh_category_tree(app, change: dict) -> None:
+    """
+    Change listener callback: rebuild the tree when the categories table is written.
+    """
+    if change["table"] in ("categories", "*"):
+        app.state.category_tree = await CategoryTree.load(app.state.pg_pool)
@@ -0,0 +1,111 @@
+import io
+from typing import TYPE_CHECKING, Iterable, Literal
+import orjson
+from asyncpg import Record
+from fastapi import Request
+from app.metrics import serialization_timer
+from app.responses import ENCODERS, encode_records
+
+# pyarrow is imported on the first Arrow or Parquet response, not when a worker starts
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+PARQUET = "application/vnd.apache.parquet"
+JSON = "application/json"
+
+Format = Literal["json", "arrow", "parquet"]
+
+MEDIA_TYPES = {"json": JSON, "arrow": ARROW_STREAM, "parquet": PARQUET}
+_FORMATS = {media_type: format for format, media_type in MEDIA_TYPES.items()}
+
+
+def negotiate_format(request: Request) -> Format:
+    """
+    Pick the response format from the Accept header, preferring the highest q-value
+    and falling back to JSON for anything else (including */*).
+    """
+    best, best_q = "json", 0.0
+    for item in request.headers.get("accept", "").split(","):
+        media_type, *params = [part.strip() for part in item.split(";")]
+        format = _FORMATS.get(media_type.lower())
+        if format is None:
+            continue
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if q > best_q:
+            best, best_q = format, q
+    return best
+
+
+def records_to_table(records: list) -> "pa.Table":
+    """
+    Build an Arrow table from asyncpg Records, one typed column at a time.
+
+    pyarrow infers the column types from the values, so NUMERIC stays a decimal128,
+    DATE a date32, TIMESTAMPTZ a UTC timestamp and UUID the arrow.uuid extension type.
+    Decimals are widened to the full 38 digits so every page of a result shares a schema.
+    """
+    import pyarrow as pa
+
+    if not records:
+        return pa.table({})
+    columns = {}
+    for index, name in enumerate(records[0].keys()):
+        values = [record[index] for record in records]
+        try:
+            column = pa.array(values)
+            if pa.types.is_decimal128(column.type):
+                column = column.cast(pa.decimal128(38, column.type.scale))
+            columns[name] = column
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Types pyarrow cannot infer go through the same encoders as JSON
+            columns[name] = pa.array([_encode_value(value) for value in values])
+    return pa.table(columns)
+
+
+def _encode_value(value):
+    if value is None:
+        return None
+    for cls in type(value).__mro__:
+        encoder = ENCODERS.get(cls)
+        if encoder is not None:
+            return encoder(value)
+    return str(value)
+
+
+def encode_records_as(records: Iterable[Record], format: Format) -> bytes:
+    """
+    Encode asyncpg Records as a JSON array, an Arrow IPC stream or a Parquet file.
+    """
+    if format == "json":
+        return encode_records(records)
+
+    with serialization_timer():
+        table = records_to_table(list(records))
+        sink = io.BytesIO()
+        if format == "arrow":
+            import pyarrow.ipc
+
+            with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+        else:
+            import pyarrow.parquet
+
+            pyarrow.parquet.write_table(table, sink)
+        return sink.getvalue()
+
+
+def empty_body(format: Format, message: str) -> bytes:
+    """
+    Body for an empty result: the usual message object for JSON, or a table with no
+    rows for the columnar formats.
+    """
+    if format == "json":
+        return orjson.dumps({"message": message})
+    return encode_records_as([], format)
@@ -0,0 +1,301 @@
+"""
+Content-Encoding negotiation for response bodies.
+
+CompressionMiddleware compresses JSON, NDJSON, CSV, Arrow IPC and other text bodies
+with the best encoding both sides support: zstd and br when the zstandard and brotli
+packages are installed, gzip always. Bodies under COMPRESSION_MIN_SIZE bytes are sent
+as they are. Streaming responses are compressed chunk by chunk, each flushed so it
+reaches the client as soon as it is written; Server-Sent Events and Parquet (which
+compresses itself) are left alone.
+"""
+import asyncio
+import time
+import zlib
+from collections import OrderedDict
+from functools import lru_cache
+from importlib.util import find_spec
+from typing import Optional
+from starlette.datastructures import Headers, MutableHeaders
+from app.columnar import ARROW_STREAM
+from app.cred_manager import get_key
+from app.metrics import COMPRESSION_BYTES, COMPRESSION_TIME
+from app.logger_utility import get_my_logger
+
+logger = get_my_logger("Compression", [])
+
+# Bodies smaller than this many bytes are not worth compressing, e.g. COMPRESSION_MIN_SIZE=1024
+MIN_SIZE = int(get_key("compression", "min_size", "1024"))
+# Encodings to offer, most preferred first, e.g. COMPRESSION_ENCODINGS=zstd,br,gzip
+PREFERENCE = [e.strip() for e in get_key("compression", "encodings", "zstd,br,gzip").split(",") if e.strip()]
+# Bodies (or streamed chunks) at least this large are compressed on a worker thread
+# rather than on the event loop; every codec here releases the GIL while it works
+THREAD_SIZE = 256 * 1024
+# Compressed copies of bodies with a strong ETag, kept until they add up to this many bytes
+CACHE_BYTES = 32 * 1024 * 1024
+
+# Levels that compress API bodies to within a few percent of the maximum at several times the speed
+GZIP_LEVEL = 4
+BROTLI_QUALITY = 4
+ZSTD_LEVEL = 3
+
+COMPRESSIBLE = {"application/json", "application/x-ndjson", "application/xml", ARROW_STREAM}
+NOT_COMPRESSIBLE = {"text/event-stream"}
+
+
+class GzipEncoding:
+    name = "gzip"
+
+    def compress(self, body: bytes) -> bytes:
+        return zlib.compress(body, GZIP_LEVEL, wbits=31)
+
+    def stream(self):
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        return (
+            lambda chunk: compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH),
+            compressor.flush,
+        )
+
+
+class BrotliEncoding:
+    name = "br"
+
+    def __init__(self) -> None:
+        import brotli
+        self.brotli = brotli
+
+    def compress(self, body: bytes) -> bytes:
+        return self.brotli.compress(body, quality=BROTLI_QUALITY)
+
+    def stream(self):
+        compressor = self.brotli.Compressor(quality=BROTLI_QUALITY)
+        return lambda chunk: compressor.process(chunk) + compressor.flush(), compressor.finish
+
+
+class ZstdEncoding:
+    name = "zstd"
+
+    def __init__(self) -> None:
+        import zstandard
+        self.zstandard = zstandard
+
+    def compress(self, body: bytes) -> bytes:
+        # Compressors are not thread-safe, and cheap to make
+        return self.zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+
+    def stream(self):
+        compressor = self.zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        flush_block = self.zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        return lambda chunk: compressor.compress(chunk) + compressor.flush(flush_block), compressor.flush
+
+
+# Encodings whose package is installed; each is only imported when first used
+_MODULES = {"gzip": "zlib", "br": "brotli", "zstd": "zstandard"}
+_ENCODINGS = {"gzip": GzipEncoding, "br": BrotliEncoding, "zstd": ZstdEncoding}
+AVAILABLE = [name for name in PREFERENCE if name in _MODULES and find_spec(_MODULES[name]) is not None]
+
+
+@lru_cache(maxsize=None)
+def get_encoding(name: str):
+    return _ENCODINGS[name]()
+
+
+@lru_cache(maxsize=256)
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Pick the encoding from an Accept-Encoding header: the highest q-value among the
+    available encodings, ties going to the server's preference. None means identity.
+    """
+    weights = {}
+    for item in accept_encoding.split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        weights[coding.lower()] = q
+
+    best, best_q = None, 0.0
+    for name in AVAILABLE:
+        q = weights.get(name, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def is_compressible(content_type: str) -> bool:
+    media_type = content_type.split(";")[0].strip().lower()
+    if media_type in NOT_COMPRESSIBLE:
+        return False
+    return media_type in COMPRESSIBLE or media_type.startswith("text/")
+
+
+class CompressedBodyCache:
+    """
+    Compressed bodies by (ETag, encoding), least recently used dropped first once they
+    add up to `max_bytes`. A strong ETag names exact bytes, so entries never go stale;
+    response-cache hits are then sent without being compressed again.
+    """
+    def __init__(self, max_bytes: int = CACHE_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+
+    def get(self, key: tuple) -> Optional[bytes]:
+        body = self.entries.get(key)
+        if body is not None:
+            self.entries.move_to_end(key)
+        return body
+
+    def set(self, key: tuple, body: bytes) -> None:
+        if len(body) > self.max_bytes or key in self.entries:
+            return
+        self.entries[key] = body
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            _, dropped = self.entries.popitem(last=False)
+            self.size -= len(dropped)
+
+
+async def _run(function, data: bytes, encoding: str) -> bytes:
+    started = time.perf_counter()
+    if len(data) >= THREAD_SIZE:
+        result = await asyncio.to_thread(function, data)
+    else:
+        result = function(data)
+    COMPRESSION_TIME.labels(encoding).inc(time.perf_counter() - started)
+    COMPRESSION_BYTES.labels(encoding, "in").inc(len(data))
+    COMPRESSION_BYTES.labels(encoding, "out").inc(len(result))
+    return result
+
+
+class CompressionMiddleware:
+    """
+    Compress response bodies with the encoding negotiated from Accept-Encoding.
+
+    Written as plain ASGI so a streaming body is compressed as it goes instead of
+    being collected first. Whole bodies are compressed in one go and sent with their
+    new Content-Length; a streamed body is held back only until it reaches
+    `minimum_size`, so a short stream is still sent uncompressed. Compressible
+    responses always get Vary: Accept-Encoding, and a strong ETag is sent weak once
+    the body is compressed (304 revalidation still matches it).
+    """
+    def __init__(self, app, minimum_size: int = MIN_SIZE) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.cache = CompressedBodyCache()
+        if AVAILABLE:
+            logger.info(f"Compressing responses of {minimum_size} bytes or more with {', '.join(AVAILABLE)}.")
+        else:
+            logger.warning("No compression encoding is available; responses are sent uncompressed.")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not AVAILABLE:
+            return await self.app(scope, receive, send)
+        accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+        # A HEAD response describes the uncompressed body it would have sent
+        encoding = negotiate_encoding(accept_encoding) if accept_encoding and scope["method"] != "HEAD" else None
+        await self.app(scope, receive, _CompressingSend(send, encoding, self.minimum_size, self.cache))
+
+
+class _CompressingSend:
+    """
+    The `send` callable for one response, deciding on its first body message whether
+    to compress.
+    """
+    def __init__(self, send, encoding: Optional[str], minimum_size: int, cache: CompressedBodyCache) -> None:
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.cache = cache
+        self.start = None
+        self.passthrough = False
+        self.pending = []
+        self.pending_size = 0
+        self.compress_chunk = None
+        self.finish = None
+
+    async def __call__(self, message) -> None:
+        if self.passthrough:
+            return await self.send(message)
+
+        if message["type"] == "http.response.start":
+            headers = MutableHeaders(raw=message["headers"])
+            compressible = (
+                200 <= message["status"] and message["status"] not in (204, 304)
+                and "content-encoding" not in headers
+                and is_compressible(headers.get("content-type", ""))
+            )
+            if compressible:
+                headers.add_vary_header("Accept-Encoding")
+            elif message["status"] == 304 and self.encoding is not None:
+                # Revalidation of a body this request would have been sent compressed
+                self._weaken_etag(headers)
+            if not compressible or self.encoding is None:
+                self.passthrough = True
+                return await self.send(message)
+            self.start = message
+            return
+
+        if message["type"] != "http.response.body":
+            return await self.send(message)
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compress_chunk is not None:
+            compressed = await _run(self.compress_chunk, body, self.encoding) if body else b""
+            if not more_body:
+                compressed += self.finish()
+            if compressed or not more_body:
+                await self.send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+            return
+
+        self.pending.append(body)
+        self.pending_size += len(body)
+        if more_body and self.pending_size < self.minimum_size:
+            return
+        body = b"".join(self.pending)
+        self.pending = []
+
+        headers = MutableHeaders(raw=self.start["headers"])
+        if not more_body:
+            if len(body) < self.minimum_size:
+                headers["Content-Length"] = str(len(body))
+                return await self._send_start_and_body(body)
+            etag = headers.get("etag")
+            key = (etag, self.encoding) if etag and not etag.startswith("W/") else None
+            compressed = self.cache.get(key) if key else None
+            if compressed is None:
+                compressed = await _run(get_encoding(self.encoding).compress, body, self.encoding)
+                if key:
+                    self.cache.set(key, compressed)
+            self._set_encoding_headers(headers)
+            headers["Content-Length"] = str(len(compressed))
+            return await self._send_start_and_body(compressed)
+
+        # A stream past the minimum size: compress the rest as it arrives
+        self.compress_chunk, self.finish = get_encoding(self.encoding).stream()
+        self._set_encoding_headers(headers)
+        if "content-length" in headers:
+            del headers["Content-Length"]
+        await self.send(self.start)
+        compressed = await _run(self.compress_chunk, body, self.encoding)
+        await self.send({"type": "http.response.body", "body": compressed, "more_body": True})
+
+    def _set_encoding_headers(self, headers: MutableHeaders) -> None:
+        headers["Content-Encoding"] = self.encoding
+        self._weaken_etag(headers)
+
+    @staticmethod
+    def _weaken_etag(headers: MutableHeaders) -> None:
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["ETag"] = f"W/{etag}"
+
+    async def _send_start_and_body(self, body: bytes) -> None:
+        self.passthrough = True
+        await self.send(self.start)
+        await self.send({"type": "http.response.body", "body": body, "more_body": False})
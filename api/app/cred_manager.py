@@ -1,10 +1,18 @@
 import os
+from functools import lru_cache
 from dotenv import load_dotenv
-import keyring
-from app.logger_utility import get_my_logger
 
-load_dotenv()
-logger = get_my_logger("Cred Manager", [])
+
+@lru_cache(maxsize=None)
+def load_environment() -> None:
+    """
+    Read the .env file into the environment, once per process however many modules ask.
+    """
+    load_dotenv()
+
+
+load_environment()
+
 
 def _get_key_from_env(config, key):
     t = os.environ.get(f"{config}_{key}")
@@ -19,6 +27,8 @@ def _get_key_from_env(config, key):
 
 
 def _get_key_from_keyring(config, key):
+    # keyring probes for a backend when imported, so it is only loaded if this is used
+    import keyring
     return keyring.get_password(config, key)
 
 
@@ -31,8 +41,11 @@ def _get_key_from_folder(config, key):
                 return f.read().decode('utf-8')
 
 
+@lru_cache(maxsize=None)
 def get_key(config, key, default=None):
     """
+    Resolve a setting or secret from the environment or the cred/ folder. Each
+    lookup is resolved once and cached for the life of the process.
 
     :param config: config is group name like aws, analytics, aws-us, production_db
     :param key: key is individual key within group like password, username, port, database
@@ -51,7 +64,7 @@ def get_key(config, key, default=None):
     # if _keyring:
     #     return _keyring
 
-    if default:
+    if default is not None:
         return default
 
     raise Exception("No Key Found")
\ No newline at end of file
@@ -1,8 +1,8 @@
 import os
-from dotenv import load_dotenv
 from pydantic import BaseModel
+from app.cred_manager import load_environment
 
-load_dotenv()
+load_environment()
 
 class EnvironmentConfiguration(BaseModel):
     environment: str
@@ -22,6 +22,21 @@ class PostgresDatabaseConfiguration:
         self.user = c.get_secret(config="postgres", key="user")
         self.password = c.get_secret(config="postgres", key="password")
 
+        # Pool tuning, e.g. POSTGRES_POOL_MAX_SIZE=20
+        self.pool_min_size = int(get_key("postgres", "pool_min_size", "1"))
+        self.pool_max_size = int(get_key("postgres", "pool_max_size", "10"))
+        self.statement_cache_size = int(get_key("postgres", "statement_cache_size", "100"))
+        self.max_inactive_connection_lifetime = float(get_key("postgres", "max_inactive_connection_lifetime", "300"))
+        self.command_timeout = float(get_key("postgres", "command_timeout", "60"))
+        self.acquire_timeout = float(get_key("postgres", "acquire_timeout", "10"))
+
+        # Streaming replicas that serve read-only queries, as host[:port] pairs,
+        # e.g. POSTGRES_REPLICA_HOSTS=replica-1,replica-2:5433
+        self.replica_hosts = [h.strip() for h in get_key("postgres", "replica_hosts", "").split(",") if h.strip()]
+        # Replicas further behind the primary than this many seconds are skipped, e.g. POSTGRES_REPLICA_MAX_LAG=5
+        self.replica_max_lag = float(get_key("postgres", "replica_max_lag", "5"))
+        self.replica_check_interval = float(get_key("postgres", "replica_check_interval", "5"))
+
     def get_config(self):
         return {
             "database": self.database,
@@ -30,6 +45,32 @@ class PostgresDatabaseConfiguration:
             "user": self.user,
             "password": self.password,
         }
+
+    def get_replica_configs(self):
+        """
+        Connection settings for each replica: the primary's, with the host and port replaced.
+        """
+        configs = []
+        for replica in self.replica_hosts:
+            host, _, port = replica.partition(":")
+            configs.append({**self.get_config(), "host": host, "port": port or self.port})
+        return configs
+
+    def get_replica_settings(self):
+        return {
+            "max_lag": self.replica_max_lag,
+            "check_interval": self.replica_check_interval,
+        }
+
+    def get_pool_config(self):
+        return {
+            "min_size": self.pool_min_size,
+            "max_size": self.pool_max_size,
+            "statement_cache_size": self.statement_cache_size,
+            "max_inactive_connection_lifetime": self.max_inactive_connection_lifetime,
+            "command_timeout": self.command_timeout,
+            "acquire_timeout": self.acquire_timeout,
+        }
     
 class RedisDatabaseConfiguration:
     def __init__(self) -> None:
@@ -1,24 +1,42 @@
 from datetime import datetime
-import pandas as pd
 import asyncpg
 from asyncpg.pool import PoolConnectionProxy
 from app.database.configuration import PostgresDatabaseConfiguration
+from app.database.postgres.pool import InstrumentedPool
+from app.database.postgres.replicas import Replica, ReplicaRouter
+from app.metrics import db_timer
 from app.logger_utility import get_my_logger
 
 logger = get_my_logger("Postgres Connections", [])
 
 # GET DATA POOL
-async def get_postgres_pool(minconn=1, maxconn=2, connect_timeout=1000):
+async def get_postgres_pool(min_size=None, max_size=None, connect_timeout=1000, pg_config=None):
+    """
+    Create the connection pool, sized and tuned from PostgresDatabaseConfiguration
+    unless min_size/max_size are given explicitly.
+
+    :param pg_config: connection settings to use instead of the primary's, e.g. a replica's
+    """
     pg = PostgresDatabaseConfiguration()
 
-    pg_config = pg.get_config()
+    pg_config = pg_config or pg.get_config()
+    pool_config = pg.get_pool_config()
+    if min_size is not None:
+        pool_config["min_size"] = min_size
+    if max_size is not None:
+        pool_config["max_size"] = max_size
 
-    logger.info(f"Postgres Configuration: {pg_config}")
+    shown = {key: value for key, value in pg_config.items() if key != "password"}
+    logger.info(f"Postgres Configuration: {shown}")
+    logger.info(f"Postgres Pool Configuration: {pool_config}")
 
     logger.info("Creating Postgres Connection Pool")
     pool = await asyncpg.create_pool(
-        min_size=minconn,
-        max_size=maxconn,
+        min_size=pool_config['min_size'],
+        max_size=pool_config['max_size'],
+        statement_cache_size=pool_config['statement_cache_size'],
+        max_inactive_connection_lifetime=pool_config['max_inactive_connection_lifetime'],
+        command_timeout=pool_config['command_timeout'],
         timeout = connect_timeout,
         database= pg_config['database'],
         host = pg_config['host'],
@@ -27,20 +45,50 @@ async def get_postgres_pool(minconn=1, maxconn=2, connect_timeout=1000):
         password = pg_config['password']
     )
 
-    return pool
+    return InstrumentedPool(pool, acquire_timeout=pool_config['acquire_timeout'])
+
+
+async def get_postgres_read_pool(primary: InstrumentedPool) -> ReplicaRouter:
+    """
+    Create a pool per configured read replica and route read-only work across them,
+    falling back to `primary`. With no replicas configured every read uses the primary.
+    """
+    pg = PostgresDatabaseConfiguration()
+    replicas = []
+    for replica_config in pg.get_replica_configs():
+        name = f"{replica_config['host']}:{replica_config['port']}"
+        logger.info(f"Creating Postgres read replica pool for {name}")
+        # Nothing connects up front, so a replica that is down cannot hold up startup
+        pool = await get_postgres_pool(min_size=0, connect_timeout=5, pg_config=replica_config)
+        replicas.append(Replica(name, pool))
+
+    router = ReplicaRouter(primary, replicas, **pg.get_replica_settings())
+    await router.check()
+    return router
 
 
 # PULL DATA
-async def postgres(query: str, con: PoolConnectionProxy, table_format=True):
-    statement = await con.prepare(query)
-    data = await statement.fetch()
+async def postgres(query: str, con: PoolConnectionProxy, *args, table_format=False):
+    """
+    Run a query and return its asyncpg Records.
+
+    Pass table_format=True for callers that really want a pandas DataFrame; the
+    default path skips the frame entirely and pairs with RecordsResponse.
+    """
+    if table_format == False:
+        with db_timer():
+            return await con.fetch(query, *args)
+
+    # pandas takes longer to import than the rest of the API together; only this path needs it
+    import pandas as pd
+
+    with db_timer():
+        statement = await con.prepare(query)
+        data = await statement.fetch(*args)
 
     attributes = statement.get_attributes()
     column_names = [attr.name for attr in attributes]
 
-    if table_format == False:
-        return data
-    
     df = pd.DataFrame(data, columns=column_names)
 
     # Convert columns
@@ -48,4 +96,20 @@ async def postgres(query: str, con: PoolConnectionProxy, table_format=True):
         if pd.api.types.is_datetime64_any_dtype(df[column]):
             df[column] = df[column].astype(str)
 
-    return df
\ No newline at end of file
+    return df
+
+
+# STREAM DATA
+async def postgres_stream(query: str, con: PoolConnectionProxy, *args, batch_size=5000):
+    """
+    Yield the result of a query in lists of at most batch_size records, read through
+    a server-side cursor so only one batch is ever held in memory.
+    """
+    async with con.transaction(readonly=True):
+        cursor = await con.cursor(query, *args)
+        while True:
+            with db_timer():
+                batch = await cursor.fetch(batch_size)
+            if not batch:
+                break
+            yield batch
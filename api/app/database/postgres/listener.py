@@ -0,0 +1,81 @@
+import asyncio
+import orjson
+import asyncpg
+from app.database.configuration import PostgresDatabaseConfiguration
+from app.logger_utility import get_my_logger
+
+logger = get_my_logger("Postgres Listener", [])
+
+CHANNEL = "table_changes"
+
+
+class ChangeListener:
+    """
+    Holds one dedicated connection LISTENing on the table_changes channel and fans each
+    notification out to the subscribed callbacks. The connection is re-established if
+    it drops, since a pooled connection cannot be used (the pool UNLISTENs on release).
+    """
+    RECONNECT_DELAY = 5
+
+    def __init__(self) -> None:
+        self.subscribers = []
+        self.connection = None
+        self._closing = False
+        self._reconnect_task = None
+        # The event loop only keeps weak references to tasks; these keep dispatches alive until they finish
+        self._dispatches = set()
+
+    def subscribe(self, callback) -> None:
+        """
+        :param callback: async callable taking the decoded change, e.g. {"table": "categories", "op": "UPDATE"}
+        """
+        self.subscribers.append(callback)
+
+    async def start(self) -> None:
+        pg_config = PostgresDatabaseConfiguration().get_config()
+        self.connection = await asyncpg.connect(**pg_config)
+        self.connection.add_termination_listener(self._on_termination)
+        await self.connection.add_listener(CHANNEL, self._on_notification)
+        logger.info(f"Listening for changes on {CHANNEL}.")
+
+    async def close(self) -> None:
+        self._closing = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+        if self.connection is not None and not self.connection.is_closed():
+            await self.connection.close()
+
+    def _on_notification(self, connection, pid, channel, payload) -> None:
+        try:
+            change = orjson.loads(payload)
+        except orjson.JSONDecodeError:
+            logger.warning(f"Ignoring malformed change notification: {payload}")
+            return
+        for callback in self.subscribers:
+            task = asyncio.create_task(self._dispatch(callback, change))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, callback, change) -> None:
+        try:
+            await callback(change)
+        except Exception:
+            logger.exception(f"Change subscriber failed for {change}.")
+
+    def _on_termination(self, connection) -> None:
+        if not self._closing:
+            logger.warning("Change listener connection lost; reconnecting.")
+            self._reconnect_task = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self) -> None:
+        while not self._closing:
+            try:
+                await self.start()
+            except (OSError, asyncpg.PostgresError) as e:
+                logger.warning(f"Change listener reconnect failed: {e}")
+                await asyncio.sleep(self.RECONNECT_DELAY)
+                continue
+            # Anything may have changed while disconnected
+            for callback in self.subscribers:
+                await self._dispatch(callback, {"table": "*", "op": "RECONNECT"})
+            return
@@ -0,0 +1,90 @@
+import asyncio
+import time
+from bisect import bisect_left
+from contextlib import asynccontextmanager
+from asyncpg.pool import Pool
+
+
+class PoolAcquireTimeoutError(Exception):
+    """
+    Raised when no pooled connection became free within the acquire timeout.
+    """
+
+
+class Histogram:
+    """
+    Cumulative bucket histogram in the Prometheus style: each bucket counts the
+    observations less than or equal to its upper bound.
+    """
+    def __init__(self, buckets) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> dict:
+        cumulative, buckets = 0, {}
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            buckets["+Inf" if bound == float("inf") else str(bound)] = cumulative
+        return {"buckets": buckets, "sum": self.sum, "count": self.count}
+
+
+class InstrumentedPool:
+    """
+    Wraps an asyncpg Pool so every acquire is timed and bounded.
+
+    acquire() keeps the asyncpg `async with pool.acquire() as con` shape; any other
+    attribute is passed through to the underlying pool.
+    """
+    ACQUIRE_WAIT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, pool: Pool, acquire_timeout: float) -> None:
+        self.pool = pool
+        self.acquire_timeout = acquire_timeout
+        self.acquire_wait = Histogram(self.ACQUIRE_WAIT_BUCKETS)
+        self.acquire_timeouts = 0
+        self.waiting = 0
+
+    @asynccontextmanager
+    async def acquire(self):
+        start = time.perf_counter()
+        self.waiting += 1
+        try:
+            connection = await self.pool.acquire(timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.acquire_timeouts += 1
+            raise PoolAcquireTimeoutError(
+                f"No Postgres connection became available within {self.acquire_timeout} seconds."
+            )
+        finally:
+            self.waiting -= 1
+        self.acquire_wait.observe(time.perf_counter() - start)
+
+        try:
+            yield connection
+        finally:
+            await self.pool.release(connection)
+
+    def stats(self) -> dict:
+        size = self.pool.get_size()
+        idle = self.pool.get_idle_size()
+        return {
+            "min_size": self.pool.get_min_size(),
+            "max_size": self.pool.get_max_size(),
+            "size": size,
+            "in_use": size - idle,
+            "idle": idle,
+            "waiting": self.waiting,
+            "acquire_timeout": self.acquire_timeout,
+            "acquire_timeouts": self.acquire_timeouts,
+            "acquire_wait_seconds": self.acquire_wait.snapshot(),
+        }
+
+    def __getattr__(self, name):
+        return getattr(self.pool, name)
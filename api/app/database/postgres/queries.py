@@ -0,0 +1,35 @@
+from asyncpg.pool import PoolConnectionProxy
+from app.metrics import db_timer
+
+# name -> SQL for every fixed query the routers run
+_registry = {}
+
+
+def register_query(name: str, query: str) -> str:
+    """
+    Register a named query, run with fetch_registered.
+
+    :param name: unique name the router uses to run the query
+    :param query: SQL text; positional parameters use $1, $2, ...
+    :return: the name, so routers can keep it in a module-level constant
+    """
+    if _registry.get(name, query) != query:
+        raise ValueError(f"Query {name} is already registered with different SQL.")
+    _registry[name] = query
+    return name
+
+
+async def fetch_registered(name: str, con: PoolConnectionProxy, *args):
+    """
+    Run a registered query through asyncpg's per-connection statement cache: the first
+    call on a connection prepares it, and every later one is a single bind/execute
+    round-trip. asyncpg re-prepares it transparently if the schema changes or the
+    statement was evicted from the cache.
+
+    The cache cannot be filled ahead of time through asyncpg's public API (a
+    statement from Connection.prepare() is kept apart from it), and PreparedStatement
+    objects cannot be held instead, since asyncpg invalidates them each time the
+    connection is released back to the pool.
+    """
+    with db_timer():
+        return await con.fetch(_registry[name], *args)
@@ -0,0 +1,195 @@
+import asyncio
+import itertools
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import List, Optional
+import asyncpg
+from app.database.postgres.pool import InstrumentedPool, PoolAcquireTimeoutError
+from app.metrics import READ_ROUTES, REPLICA_HEALTHY, REPLICA_LAG
+from app.logger_utility import get_my_logger
+
+logger = get_my_logger("Postgres Replicas", [])
+
+# Seconds a health check may take before the replica counts as down
+CHECK_TIMEOUT = 2
+# Seconds between checks while a replica is catching up with a change
+CATCH_UP_INTERVAL = 0.05
+NOT_CHECKED = "not checked yet"
+# Failures that mean a replica cannot serve reads right now
+UNAVAILABLE = (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError, PoolAcquireTimeoutError)
+
+# Lag is zero once everything received has been replayed, so a quiet primary does not
+# look like lag (after a restart the receive position restarts at the segment boundary,
+# hence <=); it is NULL when replay is behind but nothing has been replayed yet
+HEALTH = """
+    SELECT
+        pg_is_in_recovery() AS standby,
+        pg_last_wal_receive_lsn() IS NOT NULL AS receiving,
+        CASE
+            WHEN pg_last_wal_receive_lsn() <= pg_last_wal_replay_lsn() THEN 0
+            ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())::float8
+        END AS lag_seconds,
+        COALESCE(pg_last_wal_replay_lsn() >= $1::text::pg_lsn, TRUE) AS caught_up
+"""
+
+
+class Replica:
+    """
+    One read replica's pool and what its last health check found.
+    """
+    def __init__(self, name: str, pool: InstrumentedPool) -> None:
+        self.name = name
+        self.pool = pool
+        self.healthy = False
+        self.caught_up = True
+        self.lag: Optional[float] = None
+        self.problem: Optional[str] = NOT_CHECKED
+
+    def stats(self) -> dict:
+        return {
+            "replica": self.name,
+            "healthy": self.healthy,
+            "caught_up": self.caught_up,
+            "lag_seconds": self.lag,
+            "problem": self.problem,
+            "pool": self.pool.stats(),
+        }
+
+
+class ReplicaRouter:
+    """
+    Hands out read-only connections from the healthy read replicas in turn, and from
+    the primary when none can serve.
+
+    A replica is healthy while it answers its periodic check, is a streaming standby
+    and replays within `max_lag` seconds of the primary. Lag alone does not make a read
+    safe right after a write, so every change notification also benches the replicas
+    until each has replayed the primary's WAL as of that notification; reads go to the
+    primary meanwhile. A client refetching because of a change (or a response cache
+    refilling after one) therefore never sees the state from before it.
+
+    acquire() keeps the `async with pool.acquire() as con` shape of InstrumentedPool.
+    """
+    def __init__(self, primary: InstrumentedPool, replicas: List[Replica], max_lag: float, check_interval: float) -> None:
+        self.primary = primary
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._turn = itertools.count()
+        self._generation = 0
+        self._changed = asyncio.Event()
+
+    def _choose(self) -> Optional[Replica]:
+        ready = [replica for replica in self.replicas if replica.healthy and replica.caught_up]
+        if not ready:
+            return None
+        return ready[next(self._turn) % len(ready)]
+
+    @asynccontextmanager
+    async def acquire(self):
+        async with AsyncExitStack() as stack:
+            connection = None
+            replica = self._choose()
+            if replica is not None:
+                try:
+                    connection = await stack.enter_async_context(replica.pool.acquire())
+                    READ_ROUTES.labels(replica.name).inc()
+                except UNAVAILABLE as e:
+                    self._set_health(replica, False, None, f"connection failed ({e})")
+            if connection is None:
+                connection = await stack.enter_async_context(self.primary.acquire())
+                READ_ROUTES.labels("primary").inc()
+            yield connection
+
+    async def on_change(self, change: dict) -> None:
+        """
+        Change listener callback: read from the primary until the replicas have replayed the change.
+
+        Nothing here awaits, so subscribed ahead of the other callbacks this takes
+        effect before any of them (e.g. response cache invalidation) runs.
+        """
+        if not self.replicas:
+            return
+        self._generation += 1
+        for replica in self.replicas:
+            replica.caught_up = False
+        self._changed.set()
+
+    async def check(self) -> None:
+        """
+        Refresh every replica's health, and whether it has caught up with the last change.
+        """
+        if not self.replicas:
+            return
+        generation = self._generation
+        target = None
+        if not all(replica.caught_up for replica in self.replicas):
+            async with self.primary.acquire() as con:
+                target = await con.fetchval("SELECT pg_current_wal_lsn()::text")
+        await asyncio.gather(*(self._check(replica, target, generation) for replica in self.replicas))
+
+    async def _check(self, replica: Replica, target: Optional[str], generation: int) -> None:
+        async def fetch():
+            async with replica.pool.acquire() as con:
+                return await con.fetchrow(HEALTH, target)
+
+        try:
+            row = await asyncio.wait_for(fetch(), CHECK_TIMEOUT)
+        except UNAVAILABLE as e:
+            self._set_health(replica, False, None, f"unreachable ({e or type(e).__name__})")
+            return
+
+        lag = row["lag_seconds"]
+        if not row["standby"]:
+            problem = "not a standby"
+        elif not row["receiving"]:
+            problem = "not receiving WAL from the primary"
+        elif lag is None:
+            problem = "replay is behind by an unknown amount"
+        elif lag > self.max_lag:
+            problem = f"{lag:.1f}s behind the primary"
+        else:
+            problem = None
+        # A change that arrived during the check may not be covered by `target`
+        if row["caught_up"] and generation == self._generation:
+            replica.caught_up = True
+        self._set_health(replica, problem is None, lag, problem)
+
+    def _set_health(self, replica: Replica, healthy: bool, lag: Optional[float], problem: Optional[str]) -> None:
+        if healthy and not replica.healthy:
+            logger.info(f"Read replica {replica.name} is in rotation.")
+        elif not healthy and (replica.healthy or replica.problem == NOT_CHECKED):
+            logger.warning(f"Read replica {replica.name} is out of rotation: {problem}.")
+        replica.healthy = healthy
+        replica.lag = lag
+        replica.problem = problem
+        REPLICA_HEALTHY.labels(replica.name).set(int(healthy))
+        if lag is not None:
+            REPLICA_LAG.labels(replica.name).set(lag)
+
+    async def run(self) -> None:
+        """
+        Background task: check the replicas every `check_interval` seconds, and every
+        CATCH_UP_INTERVAL while one is catching up with a change, until cancelled.
+        """
+        while True:
+            catching_up = any(replica.healthy and not replica.caught_up for replica in self.replicas)
+            try:
+                await asyncio.wait_for(self._changed.wait(), CATCH_UP_INTERVAL if catching_up else self.check_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._changed.clear()
+            try:
+                await self.check()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Read replica health check failed.")
+
+    def stats(self) -> dict:
+        return {
+            "max_lag_seconds": self.max_lag,
+            "replicas": [replica.stats() for replica in self.replicas],
+        }
+
+    async def close(self) -> None:
+        await asyncio.gather(*(replica.pool.close() for replica in self.replicas))
@@ -7,6 +7,15 @@ async def get_postgres_session(request: Request):
         yield connection
 
 
+async def get_postgres_read_session(request: Request):
+    """
+    A connection for read-only queries: from a healthy read replica when there is one,
+    otherwise from the primary.
+    """
+    async with request.app.state.pg_read_pool.acquire() as connection:
+        yield connection
+
+
 async def get_redis_session(request: Request):
     async with request.app.state.redis_pool.client() as connection:
         yield connection
\ No newline at end of file
@@ -0,0 +1,100 @@
+import asyncio
+import signal
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional
+from app.cred_manager import get_key
+from app.metrics import EVENT_SUBSCRIBERS
+from app.logger_utility import get_my_logger
+
+logger = get_my_logger("Event Broker", [])
+
+# Changes buffered per /events client before it is told to resync instead, e.g. EVENTS_QUEUE_SIZE=256
+QUEUE_SIZE = int(get_key("events", "queue_size", "256"))
+# Sent in place of the changes a client missed; it should reload everything it shows
+RESYNC = {"table": "*", "op": "RESYNC"}
+
+
+class EventBroker:
+    """
+    Relays table changes from the change listener to every /events client.
+
+    Each client reads from its own bounded queue, so publishing never waits on a
+    slow reader. A client that falls QUEUE_SIZE changes behind has its backlog
+    replaced by a single RESYNC event, which costs it one full reload instead of
+    letting its queue grow without bound.
+    """
+    def __init__(self, queue_size: int = QUEUE_SIZE) -> None:
+        self.queue_size = queue_size
+        self.queues = set()
+        self.last_event_id = 0
+
+    def __len__(self) -> int:
+        return len(self.queues)
+
+    async def publish(self, change: dict) -> None:
+        """
+        Change listener callback: queue the change for every connected client.
+        """
+        self.last_event_id += 1
+        event = (self.last_event_id, change)
+        for queue in self.queues:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self._replace_backlog(queue, (self.last_event_id, RESYNC))
+
+    @contextmanager
+    def connect(self) -> Iterator[asyncio.Queue]:
+        """
+        Register a client for as long as the block runs.
+
+        :return: queue of (event id, change) tuples; None means the broker has closed
+        """
+        queue = asyncio.Queue(self.queue_size)
+        self.queues.add(queue)
+        EVENT_SUBSCRIBERS.inc()
+        try:
+            yield queue
+        finally:
+            self.queues.discard(queue)
+            EVENT_SUBSCRIBERS.dec()
+
+    def close(self) -> None:
+        """
+        Tell every client the stream is over so their responses can finish.
+        """
+        if self.queues:
+            logger.info(f"Closing {len(self.queues)} event streams.")
+        for queue in self.queues:
+            self._replace_backlog(queue, None)
+
+    @staticmethod
+    def _replace_backlog(queue: asyncio.Queue, event: Optional[tuple]) -> None:
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+
+def close_on_exit_signal(broker: EventBroker) -> None:
+    """
+    Close the broker's streams as soon as the server is asked to stop.
+
+    Servers wait for open responses to finish before running the lifespan shutdown,
+    and an event stream never finishes by itself, so closing it from there would be
+    too late. The server's own SIGINT/SIGTERM handlers still run afterwards. Nothing
+    is installed off the main thread (e.g. under a test client).
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        previous = signal.getsignal(sig)
+        if not callable(previous):
+            continue
+
+        def handler(signum, frame, previous=previous):
+            loop.call_soon_threadsafe(broker.close)
+            previous(signum, frame)
+
+        signal.signal(sig, handler)
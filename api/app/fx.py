@@ -0,0 +1,158 @@
+"""
+Load exchange rates into fx_rates from local CSV files:
+
+    python -m app.fx rates/2025.csv rates/2026.csv
+
+Each file has a header row and the columns date,currency,rate, where rate is the
+value of one unit of the currency in US dollars on that date, e.g.
+
+    date,currency,rate
+    2025-05-01,EUR,1.1329
+    2025-05-01,GBP,1.3331
+
+Rows for a (currency, date) that is already loaded replace the stored rate.
+"""
+import argparse
+import asyncio
+import csv
+import re
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from typing import FrozenSet, Iterable
+from asyncpg.pool import PoolConnectionProxy
+from app.cred_manager import get_key
+from app.database.postgres.queries import fetch_registered, register_query
+from app.metrics import db_timer
+from app.logger_utility import get_my_logger
+
+logger = get_my_logger("FX Rates", [])
+
+# Currency the fx_rates table is quoted in; every other pair converts through it
+PIVOT_CURRENCY = "USD"
+# Currency amounts are reported in when a request does not ask for one, e.g. FX_BASE_CURRENCY=EUR
+BASE_CURRENCY = get_key("fx", "base_currency", PIVOT_CURRENCY)
+
+CURRENCY_CODE = re.compile(r"^[A-Z]{3}$")
+
+CURRENCIES = register_query("fx.currencies", """
+    SELECT
+        ARRAY(SELECT DISTINCT currency::text FROM accounts) AS account_currencies,
+        ARRAY(SELECT DISTINCT currency::text FROM fx_rates) AS rated_currencies
+""")
+
+
+class FxRates:
+    """
+    Which currencies the ledger holds and has rates for, so a request can be turned
+    away before its query runs when a conversion it needs has no rates. The
+    conversions themselves happen in SQL. A refresh builds a new instance.
+    """
+    def __init__(self, account_currencies: Iterable[str], rated_currencies: Iterable[str]) -> None:
+        self.account_currencies: FrozenSet[str] = frozenset(account_currencies)
+        self.rated_currencies: FrozenSet[str] = frozenset(rated_currencies) | {PIVOT_CURRENCY}
+
+    def missing(self, currencies: Iterable[str]) -> list:
+        """
+        The given currencies that have no rates loaded, sorted.
+        """
+        return sorted(set(currencies) - self.rated_currencies)
+
+    def needs_conversion(self, currency: str) -> bool:
+        """
+        Whether any account holds money in a currency other than `currency`.
+        """
+        return bool(self.account_currencies - {currency})
+
+    @classmethod
+    async def load(cls, pool) -> "FxRates":
+        async with pool.acquire() as con:
+            rows = await fetch_registered(CURRENCIES, con)
+        fx = cls(rows[0]["account_currencies"], rows[0]["rated_currencies"])
+        logger.info(
+            f"Accounts hold {len(fx.account_currencies)} currencies; "
+            f"rates are loaded for {len(fx.rated_currencies)}."
+        )
+        return fx
+
+
+async def refresh_fx_rates(app, change: dict) -> None:
+    """
+    Change listener callback: reload the currency sets when rates or accounts are written.
+    """
+    if change["table"] in ("fx_rates", "accounts", "*"):
+        app.state.fx_rates = await FxRates.load(app.state.pg_pool)
+
+
+def read_rate_file(path: str) -> tuple:
+    """
+    Parse one rates CSV file.
+
+    :return: ([(currency, date, rate)], number of rejected rows)
+    """
+    rates, rejected = [], 0
+    with open(path, newline="") as f:
+        for line, row in enumerate(csv.DictReader(f), start=2):
+            try:
+                currency = row["currency"].strip().upper()
+                if not CURRENCY_CODE.match(currency):
+                    raise ValueError(f"invalid currency code {row['currency']!r}")
+                rate = Decimal(row["rate"])
+                if not rate > 0:
+                    raise ValueError("rate must be positive")
+                rates.append((currency, date.fromisoformat(row["date"].strip()), rate))
+            except (KeyError, ValueError, InvalidOperation, AttributeError) as e:
+                logger.warning(f"{path}:{line}: skipping row ({e}).")
+                rejected += 1
+    return rates, rejected
+
+
+async def load_rate_files(con: PoolConnectionProxy, paths: Iterable[str]) -> dict:
+    """
+    Upsert the rates in local CSV files into fx_rates in one transaction, copying
+    them through a temporary staging table.
+
+    :return: counts of files read, rates loaded and rows rejected
+    """
+    result = {"files": 0, "rates": 0, "rejected": 0}
+    rates = {}
+    for path in paths:
+        file_rates, rejected = read_rate_file(path)
+        # A later file wins when two give the same currency and date
+        rates.update(((currency, day), rate) for currency, day, rate in file_rates)
+        result["files"] += 1
+        result["rejected"] += rejected
+
+    async with con.transaction():
+        await con.execute("CREATE TEMPORARY TABLE fx_rates_staging (LIKE fx_rates INCLUDING DEFAULTS) ON COMMIT DROP")
+        with db_timer():
+            await con.copy_records_to_table(
+                "fx_rates_staging",
+                records=[(currency, day, rate) for (currency, day), rate in rates.items()],
+                columns=["currency", "rate_date", "rate"],
+            )
+            status = await con.execute("""
+                INSERT INTO fx_rates (currency, rate_date, rate)
+                SELECT currency, rate_date, rate FROM fx_rates_staging
+                ON CONFLICT (currency, rate_date) DO UPDATE SET rate = EXCLUDED.rate
+            """)
+    result["rates"] = int(status.split()[-1])
+
+    logger.info(f"Loaded {result['rates']} FX rates from {result['files']} files; rejected {result['rejected']} rows.")
+    return result
+
+
+async def main(args) -> None:
+    import asyncpg
+    from app.database.configuration import PostgresDatabaseConfiguration
+
+    con = await asyncpg.connect(**PostgresDatabaseConfiguration().get_config())
+    try:
+        print(await load_rate_files(con, args.paths))
+    finally:
+        await con.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="CSV files of date,currency,rate")
+    asyncio.run(main(parser.parse_args()))
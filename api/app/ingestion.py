@@ -0,0 +1,185 @@
+import csv
+import io
+from typing import List, Optional
+import orjson
+from asyncpg.pool import PoolConnectionProxy
+from pydantic import TypeAdapter, ValidationError
+from app.models.transactions import Transaction
+from app.categoriser import Categoriser
+from app.logger_utility import get_my_logger
+
+logger = get_my_logger("Ingestion", [])
+
+BATCH_SIZE = 5000
+
+# Columns written through COPY; created_at/updated_at come from the table defaults
+COPY_COLUMNS = [
+    "transaction_id",
+    "account_id",
+    "transaction_date",
+    "description",
+    "amount",
+    "transaction_type",
+    "category_id",
+    "merchant_name",
+    "notes",
+    "is_recurring",
+]
+
+_transactions_adapter = TypeAdapter(List[Transaction])
+
+
+def parse_transaction_rows(body: bytes, content_type: str) -> list:
+    """
+    Parse a request body holding a JSON array, NDJSON or CSV into a list of dicts.
+
+    :param body: raw request body
+    :param content_type: request Content-Type, which selects the parser
+    :return: list of unvalidated rows
+    """
+    content_type = content_type.split(";")[0].strip().lower()
+
+    if content_type in ("application/x-ndjson", "application/ndjson", "application/jsonl"):
+        return [orjson.loads(line) for line in body.splitlines() if line.strip()]
+
+    if content_type in ("text/csv", "application/csv"):
+        reader = csv.DictReader(io.StringIO(body.decode("utf-8-sig")))
+        # Empty CSV cells mean "not provided" rather than an empty string
+        return [{key: value for key, value in row.items() if value != ""} for row in reader]
+
+    rows = orjson.loads(body)
+    if not isinstance(rows, list):
+        raise ValueError("Expected a JSON array of transactions.")
+    return rows
+
+
+def _validate_batch(batch: list, offset: int):
+    """
+    Validate a batch in one pass, falling back to the rows without errors when some fail.
+
+    :return: (list of (row number, Transaction), list of row errors)
+    """
+    try:
+        return list(enumerate(_transactions_adapter.validate_python(batch), start=offset)), []
+    except ValidationError as e:
+        failures = {}
+        for error in e.errors(include_url=False, include_context=False, include_input=False):
+            index, *field = error["loc"]
+            failures.setdefault(index, []).append({"field": ".".join(map(str, field)), "message": error["msg"]})
+
+    valid_indexes = [i for i in range(len(batch)) if i not in failures]
+    valid = _transactions_adapter.validate_python([batch[i] for i in valid_indexes])
+    errors = [{"row": offset + index, "errors": failures[index]} for index in sorted(failures)]
+    return [(offset + index, transaction) for index, transaction in zip(valid_indexes, valid)], errors
+
+
+async def ingest_transactions(
+    rows: list,
+    con: PoolConnectionProxy,
+    batch_size: int = BATCH_SIZE,
+    categoriser: Optional[Categoriser] = None,
+) -> dict:
+    """
+    Validate rows against Transaction in batches, COPY the valid ones into a staging
+    table and upsert them into transactions.
+
+    Rows that fail validation, reference unknown accounts or categories, or repeat a
+    transaction_id already seen in the request are reported back by row number and skipped.
+    Rows without a category are given one by the categoriser when a rule matches.
+    A transaction_id that a concurrent load writes with another date first fails the
+    whole load on transaction_ids with asyncpg.UniqueViolationError.
+    """
+    account_ids = {r["account_id"] for r in await con.fetch("SELECT account_id FROM accounts")}
+    category_ids = {r["category_id"] for r in await con.fetch("SELECT category_id FROM categories")}
+    seen_ids = set()
+
+    result = {"received": len(rows), "inserted": 0, "updated": 0, "categorised": 0, "rejected": 0, "errors": []}
+
+    async with con.transaction():
+        # Built from a column list rather than LIKE so transaction_id may be NULL
+        # here and generated by the database during the upsert.
+        await con.execute(f"""
+            CREATE TEMP TABLE transactions_staging ON COMMIT DROP AS
+            SELECT {", ".join(COPY_COLUMNS)} FROM transactions WITH NO DATA
+        """)
+
+        for offset in range(0, len(rows), batch_size):
+            validated, errors = _validate_batch(rows[offset:offset + batch_size], offset)
+
+            records = []
+            for row, t in validated:
+                transaction_id = t.transaction_id
+                problems = []
+                if t.account_id not in account_ids:
+                    problems.append({"field": "account_id", "message": "Unknown account."})
+                if t.category_id is not None and t.category_id not in category_ids:
+                    problems.append({"field": "category_id", "message": "Unknown category."})
+                if transaction_id is not None and transaction_id in seen_ids:
+                    problems.append({"field": "transaction_id", "message": "Duplicate transaction_id in request."})
+                if problems:
+                    errors.append({"row": row, "errors": problems})
+                    continue
+
+                if transaction_id is not None:
+                    seen_ids.add(transaction_id)
+                category_id = t.category_id
+                if category_id is None and categoriser is not None:
+                    category_id = categoriser.match(
+                        t.account_id, t.amount, t.transaction_type.value, t.merchant_name, t.description
+                    )
+                    result["categorised"] += category_id is not None
+                records.append((
+                    transaction_id,
+                    t.account_id,
+                    t.transaction_date,
+                    t.description,
+                    t.amount,
+                    t.transaction_type.value,
+                    category_id,
+                    t.merchant_name,
+                    t.notes,
+                    t.is_recurring,
+                ))
+
+            result["errors"].extend(sorted(errors, key=lambda e: e["row"]))
+            if not records:
+                continue
+
+            await con.copy_records_to_table("transactions_staging", records=records, columns=COPY_COLUMNS)
+            # The upsert only matches on (transaction_id, transaction_date), the partitioned
+            # table's key, so transactions re-sent with another date are first moved to it
+            await con.execute("""
+                UPDATE transactions t
+                SET transaction_date = s.transaction_date
+                FROM transactions_staging s
+                WHERE t.transaction_id = s.transaction_id
+                  AND t.transaction_date <> s.transaction_date
+            """)
+            counts = await con.fetchrow(f"""
+                WITH upserted AS (
+                    INSERT INTO transactions ({", ".join(COPY_COLUMNS)})
+                    SELECT COALESCE(transaction_id, gen_random_uuid()), {", ".join(COPY_COLUMNS[1:])}
+                    FROM transactions_staging
+                    ON CONFLICT (transaction_id, transaction_date) DO UPDATE SET
+                        {", ".join(f"{c} = EXCLUDED.{c}" for c in COPY_COLUMNS[1:] if c != "transaction_date")}
+                    -- Partitioned tables cannot return xmax; created_at is only the
+                    -- transaction's own timestamp on rows this request inserted
+                    RETURNING (created_at = CURRENT_TIMESTAMP) AS inserted
+                )
+                SELECT
+                    COUNT(*) FILTER (WHERE inserted) AS inserted,
+                    COUNT(*) FILTER (WHERE NOT inserted) AS updated
+                FROM upserted
+            """)
+            await con.execute("TRUNCATE transactions_staging")
+
+            result["inserted"] += counts["inserted"]
+            result["updated"] += counts["updated"]
+
+    result["rejected"] = len(result["errors"])
+    logger.info(
+        f"Ingested {result['inserted']} new and {result['updated']} updated transactions "
+        f"({result['categorised']} categorised by rules); "
+        f"rejected {result['rejected']} of {result['received']} rows."
+    )
+    return result
@@ -1,9 +1,60 @@
+"""
+Logging for the API: every record, uvicorn's included, is handed to a queue on the
+calling side and formatted, redacted and written in batches by a listener thread,
+so a slow or blocked stderr never stalls the event loop.
+
+Configured from the environment on first use:
+
+    LOG_LEVEL=info                                  level of every logger not listed below
+    LOG_LEVELS=Middleware=debug,Postgres Listener=warning
+    LOG_SAMPLING=DataRouter=0.1,AnalyticsRouter=0.1 fraction of records below WARNING kept
+    LOG_FORMAT=json                                 or text
+
+JSON records carry the ID of the request they were logged for (see
+RequestIdMiddleware), any `extra` fields, and the sample rate of sampled loggers so
+counts can be scaled back up. Values that look like secrets are redacted from
+messages, extra fields and tracebacks alike.
+"""
+import atexit
 import logging
+import queue
+import random
+import re
+import sys
+from contextvars import ContextVar
+from datetime import datetime, timezone
 from enum import Enum
-from typing import List
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Optional
 
+import orjson
 from pydantic import BaseModel
 
+from app.cred_manager import get_key
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# ID of the request being handled, set by RequestIdMiddleware
+request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# key=value, key: value and 'key': 'value' pairs whose key names a secret, and passwords in URLs
+SECRET_NAME = re.compile(r"(?i)password|passwd|secret|token|api[_-]?key|authorization")
+SECRET_VALUE = re.compile(
+    r"""(?i)((?:password|passwd|secret|token|api[_-]?key|authorization)['"]?\s*[:=]\s*['"]?(?:(?:bearer|basic)\s+)?)"""
+    r"""[^'"\s,;}&]+"""
+)
+URL_PASSWORD = re.compile(r"(://[^:/@\s]+:)[^@/\s]+@")
+REDACTED = "***"
+# Records waiting for the listener before new ones are dropped rather than block the caller
+QUEUE_SIZE = 10_000
+# Most records written to the output in one go
+WRITE_BATCH = 512
+
+# Attributes every LogRecord has; anything else on a record came from `extra`
+# (apart from uvicorn's copy of its message with terminal colours)
+RECORD_ATTRIBUTES = frozenset(logging.makeLogRecord({}).__dict__) | {"message", "asctime", "color_message"}
+
 
 class LoggingLevel(Enum):
     """
@@ -24,6 +75,218 @@ class LoggerInfo(BaseModel):
     level: LoggingLevel
 
 
+def redact(text: str) -> str:
+    """
+    Mask the values of password/secret/token/api key/authorization pairs and URL passwords.
+    """
+    # Neither can match without one of these, and most messages have neither
+    if "=" not in text and ":" not in text:
+        return text
+    return URL_PASSWORD.sub(rf"\1{REDACTED}@", SECRET_VALUE.sub(rf"\1{REDACTED}", text))
+
+
+def _settings(value: str) -> Dict[str, str]:
+    """
+    Parse "name=value,name=value"; logger names may contain spaces.
+    """
+    pairs = {}
+    for pair in value.split(","):
+        name, _, setting = pair.rpartition("=")
+        if name.strip():
+            pairs[name.strip()] = setting.strip()
+    return pairs
+
+
+def _level(name: str) -> int:
+    try:
+        return LoggingLevel[name.strip().upper()].value
+    except KeyError:
+        raise ValueError(f"Unknown log level {name!r}; use one of {', '.join(l.name.lower() for l in LoggingLevel)}.")
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: time, level, logger, message, then request_id, sample_rate
+    and `extra` fields when present, and the exception's traceback if there is one.
+    """
+    def __init__(self) -> None:
+        super().__init__()
+        self._second = None
+        self._second_text = ""
+
+    def _time(self, created: float) -> str:
+        # Records come in bursts, so the date and time up to the second are reused
+        second = int(created)
+        if second != self._second:
+            self._second = second
+            self._second_text = datetime.fromtimestamp(second, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+        return f"{self._second_text}.{int(created % 1 * 1000):03d}Z"
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self._time(record.created),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": redact(record.getMessage()),
+        }
+        for key, value in record.__dict__.items():
+            if key not in RECORD_ATTRIBUTES:
+                if SECRET_NAME.search(key):
+                    value = REDACTED
+                elif isinstance(value, str):
+                    value = redact(value)
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = redact(self.formatException(record.exc_info))
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return orjson.dumps(entry, default=str).decode()
+
+
+class TextFormatter(logging.Formatter):
+    """
+    The classic one-line format, redacted, with the request ID appended when there is one.
+    """
+    def __init__(self) -> None:
+        super().__init__(TEXT_FORMAT)
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = redact(super().format(record))
+        request = getattr(record, "request_id", None)
+        return text if request is None else f"{text} [request {request}]"
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of the records below WARNING from the given loggers.
+    """
+    def __init__(self, rates: Dict[str, float]) -> None:
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.name)
+        if rate is None or record.levelno >= logging.WARNING:
+            return True
+        if random.random() >= rate:
+            return False
+        record.sample_rate = rate
+        return True
+
+
+class ContextQueueHandler(QueueHandler):
+    """
+    Enqueue records for the listener thread, capturing on the calling side only what
+    cannot wait: the message (its arguments may change later) and the request ID.
+
+    Unlike QueueHandler, formatting and the traceback are left to the listener; the
+    queue never leaves the process, so records need not be made picklable. When the
+    output cannot keep up and `queue_size` records are waiting, new ones are dropped
+    and counted, and a warning with the count goes out once there is room again.
+    """
+    def __init__(self, queue_size: int = QUEUE_SIZE) -> None:
+        super().__init__(queue.SimpleQueue())
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._reported = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        request = request_id.get()
+        if request is not None:
+            record.request_id = request
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.queue.qsize() >= self.queue_size:
+            self.dropped += 1
+            return
+        if self.dropped != self._reported:
+            self.queue.put_nowait(logging.makeLogRecord({
+                "name": __name__,
+                "levelno": logging.WARNING,
+                "levelname": "WARNING",
+                "msg": f"Dropped {self.dropped - self._reported} log records; the log output could not keep up.",
+            }))
+            self._reported = self.dropped
+        self.queue.put_nowait(record)
+
+
+class BatchStreamHandler(logging.StreamHandler):
+    """
+    A StreamHandler that holds formatted records until it is flushed (or WRITE_BATCH
+    are waiting) and then writes them all at once.
+    """
+    def __init__(self, stream=None) -> None:
+        super().__init__(stream)
+        self.pending: List[str] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.pending.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+            return
+        if len(self.pending) >= WRITE_BATCH:
+            self.flush()
+
+    def flush(self) -> None:
+        with self.lock:
+            if self.pending:
+                text = self.terminator.join(self.pending) + self.terminator
+                self.pending.clear()
+                self.stream.write(text)
+            if hasattr(self.stream, "flush"):
+                self.stream.flush()
+
+
+class BatchQueueListener(QueueListener):
+    """
+    A QueueListener that flushes its handlers whenever the queue runs dry, rather than
+    after every record, so a burst of records costs one write.
+    """
+    def dequeue(self, block: bool) -> logging.LogRecord:
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            for handler in self.handlers:
+                handler.flush()
+            return self.queue.get(block)
+
+    def stop(self) -> None:
+        super().stop()
+        for handler in self.handlers:
+            handler.flush()
+
+
+@lru_cache(maxsize=None)
+def _configure_logging() -> QueueListener:
+    output = BatchStreamHandler(sys.stderr)
+    output.setFormatter(TextFormatter() if get_key("log", "format", "json").lower() == "text" else JsonFormatter())
+
+    handler = ContextQueueHandler()
+    rates = {name: float(rate) for name, rate in _settings(get_key("log", "sampling", "")).items()}
+    if rates:
+        handler.addFilter(SamplingFilter(rates))
+
+    root = logging.getLogger()
+    root.setLevel(_level(get_key("log", "level", "info")))
+    root.addHandler(handler)
+    # uvicorn's loggers, the access log's line per request included, go through the queue too
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        logging.getLogger(name).handlers.clear()
+        logging.getLogger(name).propagate = True
+    for name, level in _settings(get_key("log", "levels", "")).items():
+        logging.getLogger(name).setLevel(_level(level))
+
+    listener = BatchQueueListener(handler.queue, output, respect_handler_level=True)
+    listener.start()
+    # Writes out whatever is still queued when the process exits
+    atexit.register(listener.stop)
+    return listener
+
+
 def get_my_logger(my_logger, logging_infos: List[LoggerInfo] = None):
     """
 
@@ -31,7 +294,7 @@ def get_my_logger(my_logger, logging_infos: List[LoggerInfo] = None):
     :param logging_infos: what you want to log
     :return:
     """
-    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    _configure_logging()
     logger = logging.getLogger(my_logger)
     if logging_infos is None:
         return logger
@@ -39,4 +302,4 @@ def get_my_logger(my_logger, logging_infos: List[LoggerInfo] = None):
     for li in logging_infos:
         logging.getLogger(li.name).setLevel(li.level.value)
 
-    return logger
\ No newline at end of file
+    return logger
@@ -0,0 +1,157 @@
+import time
+from contextvars import ContextVar
+from typing import Optional
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, HistogramMetricFamily
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request to sending the response headers.",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS = Counter(
+    "http_requests_total",
+    "Requests handled.",
+    ["method", "route", "status"],
+)
+REQUEST_ERRORS = Counter(
+    "http_request_errors_total",
+    "Requests that raised or returned a 5xx status.",
+    ["method", "route"],
+)
+IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "Requests currently being handled.",
+    ["method"],
+)
+DB_TIME = Histogram(
+    "http_request_db_seconds",
+    "Time each request spent waiting on Postgres.",
+    ["route"],
+    buckets=LATENCY_BUCKETS,
+)
+STARTUP_TIME = Gauge(
+    "app_startup_seconds",
+    "Time this worker spent starting up: importing the app, then running the lifespan.",
+    ["phase"],
+)
+REPLICA_HEALTHY = Gauge(
+    "pg_replica_healthy",
+    "Whether a read replica is reachable, streaming and within the allowed lag (1) or not (0).",
+    ["replica"],
+)
+REPLICA_LAG = Gauge(
+    "pg_replica_lag_seconds",
+    "How far a read replica's replay was behind the primary at its last health check.",
+    ["replica"],
+)
+READ_ROUTES = Counter(
+    "pg_read_routes_total",
+    "Read-only connections handed out, by the server they came from.",
+    ["target"],
+)
+EVENT_SUBSCRIBERS = Gauge(
+    "events_subscribers",
+    "Clients connected to the /events change stream.",
+)
+SERIALIZATION_TIME = Histogram(
+    "http_request_serialization_seconds",
+    "Time each request spent encoding its response body.",
+    ["route"],
+    buckets=LATENCY_BUCKETS,
+)
+COMPRESSION_BYTES = Counter(
+    "http_response_compression_bytes_total",
+    "Response body bytes going into (stage=in) and coming out of (stage=out) compression.",
+    ["encoding", "stage"],
+)
+COMPRESSION_TIME = Counter(
+    "http_response_compression_seconds_total",
+    "Time spent compressing response bodies.",
+    ["encoding"],
+)
+
+
+class RequestTimings:
+    """
+    Per-request accumulator for time spent in the database and in serialisation.
+    """
+    __slots__ = ("db", "serialization")
+
+    def __init__(self) -> None:
+        self.db = 0.0
+        self.serialization = 0.0
+
+
+_request_timings: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def start_request_timings() -> RequestTimings:
+    timings = RequestTimings()
+    _request_timings.set(timings)
+    return timings
+
+
+class _Timer:
+    __slots__ = ("field", "start")
+
+    def __init__(self, field: str) -> None:
+        self.field = field
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        timings = _request_timings.get()
+        if timings is not None:
+            setattr(timings, self.field, getattr(timings, self.field) + time.perf_counter() - self.start)
+        return False
+
+
+def db_timer() -> _Timer:
+    """
+    Context manager adding the elapsed time to the current request's database time.
+    """
+    return _Timer("db")
+
+
+def serialization_timer() -> _Timer:
+    """
+    Context manager adding the elapsed time to the current request's serialisation time.
+    """
+    return _Timer("serialization")
+
+
+class PoolCollector:
+    """
+    Exposes InstrumentedPool.stats() as Prometheus metrics at scrape time.
+    """
+    def __init__(self, pool) -> None:
+        self.pool = pool
+
+    def collect(self):
+        stats = self.pool.stats()
+        for name in ("size", "in_use", "idle", "waiting", "max_size"):
+            yield GaugeMetricFamily(f"pg_pool_{name}", f"Postgres pool {name.replace('_', ' ')}.", value=stats[name])
+
+        yield CounterMetricFamily(
+            "pg_pool_acquire_timeouts", "Pool acquires that timed out.", value=stats["acquire_timeouts"]
+        )
+
+        wait = stats["acquire_wait_seconds"]
+        yield HistogramMetricFamily(
+            "pg_pool_acquire_wait_seconds",
+            "Time spent waiting for a pooled connection.",
+            buckets=list(wait["buckets"].items()),
+            sum_value=wait["sum"],
+        )
+
+
+def register_pool_collector(pool) -> PoolCollector:
+    collector = PoolCollector(pool)
+    REGISTRY.register(collector)
+    return collector
@@ -1,13 +1,93 @@
+import re
 import time
+import uuid
 from fastapi import Request
-from app.logger_utility import get_my_logger
+from app.metrics import (
+    DB_TIME,
+    IN_FLIGHT,
+    REQUEST_ERRORS,
+    REQUEST_LATENCY,
+    REQUESTS,
+    SERIALIZATION_TIME,
+    start_request_timings,
+)
+from app.logger_utility import get_my_logger, request_id
 
 logger = get_my_logger("Middleware", [])
 
+# Request IDs taken from callers are limited to what is safe to put in a log line
+REQUEST_ID = re.compile(rb"[A-Za-z0-9._-]{1,64}")
 
-async def timer(request: Request, call_next):
-    start_time = time.time()
-    logger.info("Starting timer")
-    response = await call_next(request)
-    logger.info(f"Request took: {round((time.time() - start_time), 3)} seconds.")
-    return response
\ No newline at end of file
+
+def _route_label(request: Request) -> str:
+    """
+    The matched route's path template, e.g. /categories/{category_id}/ancestors, or
+    "unmatched" when no route handled the request.
+    """
+    route = request.scope.get("route")
+    return route.path if route is not None else "unmatched"
+
+
+async def metrics(request: Request, call_next):
+    """
+    Record per-route latency, request and error counts, in-flight requests and the
+    split between database and serialisation time.
+
+    Routes are labelled by their path template (e.g. /data/transactions) so path
+    parameters do not blow up label cardinality. For streaming responses the latency
+    covers the time to the first byte, not the whole body.
+    """
+    method = request.method
+    timings = start_request_timings()
+    in_flight = IN_FLIGHT.labels(method)
+    in_flight.inc()
+    start_time = time.perf_counter()
+    status = "500"
+    try:
+        response = await call_next(request)
+        status = str(response.status_code)
+        return response
+    finally:
+        elapsed = time.perf_counter() - start_time
+        in_flight.dec()
+
+        route = _route_label(request)
+        REQUEST_LATENCY.labels(method, route, status).observe(elapsed)
+        REQUESTS.labels(method, route, status).inc()
+        if status.startswith("5"):
+            REQUEST_ERRORS.labels(method, route).inc()
+        DB_TIME.labels(route).observe(timings.db)
+        SERIALIZATION_TIME.labels(route).observe(timings.serialization)
+        logger.debug(f"{method} {route} {status} took {elapsed:.4f}s (db {timings.db:.4f}s).")
+
+
+class RequestIdMiddleware:
+    """
+    Give each request an ID that every log record made while handling it carries, and
+    return it in the X-Request-ID response header.
+
+    A well-formed X-Request-ID sent by the caller (e.g. the frontend) is kept, so one
+    ID follows a request across services. Written as plain ASGI rather than with
+    app.middleware("http") so streaming responses pass straight through.
+    """
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        incoming = next((value for name, value in scope["headers"] if name == b"x-request-id"), b"")
+        value = incoming.decode() if REQUEST_ID.fullmatch(incoming) else uuid.uuid4().hex
+        header = (b"x-request-id", value.encode())
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), header]
+            await send(message)
+
+        token = request_id.set(value)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id.reset(token)
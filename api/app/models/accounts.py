@@ -1,7 +1,6 @@
 from pydantic import BaseModel, Field, field_validator
 from typing import Optional
 from datetime import datetime
-from decimal import Decimal
 from uuid import UUID, uuid4
 from enum import Enum
 
@@ -21,8 +20,10 @@ class Account(BaseModel):
         description="Unique name of the account"
     )
     account_type: AccountType
-    currency: Decimal = Field(
+    currency: str = Field(
         default="USD",
+        min_length=3,
+        max_length=3,
         description="ISO 4217 currency code"
     )
     notes: Optional[str] = None
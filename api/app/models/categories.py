@@ -1,8 +1,11 @@
+import re
 from pydantic import BaseModel, Field, field_validator, model_validator
 from typing import Optional
 from datetime import date, datetime
 from uuid import UUID, uuid4
 from decimal import Decimal
+from app.models.transactions import TransactionType
+from app.categoriser import compile_pattern
 
 
 
@@ -22,4 +25,55 @@ class Category(BaseModel):
         return value.strip()
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class CategorisationRule(BaseModel):
+    rule_id: Optional[UUID] = Field(default_factory=uuid4)
+    category_id: UUID
+    merchant_pattern: Optional[str] = Field(
+        None,
+        description="Case-insensitive regular expression searched for in the merchant name",
+        examples=["supermart|grocer"],
+    )
+    description_pattern: Optional[str] = Field(
+        None,
+        description="Case-insensitive regular expression searched for in the description",
+    )
+    min_amount: Optional[Decimal] = Field(None, ge=0)
+    max_amount: Optional[Decimal] = Field(None, ge=0)
+    account_id: Optional[UUID] = None
+    transaction_type: Optional[TransactionType] = None
+    priority: int = Field(100, description="Lower numbers win when several rules match")
+    is_active: bool = True
+    notes: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    @field_validator('merchant_pattern', 'description_pattern')
+    @classmethod
+    def pattern_compiles(cls, value: Optional[str]) -> Optional[str]:
+        if value is None:
+            return value
+        if not value.strip():
+            raise ValueError("Pattern cannot be empty or contain only whitespace.")
+        try:
+            # The categoriser's own check, so a rule that validates here also fits its combined regex
+            compile_pattern(value)
+        except re.error as e:
+            raise ValueError(f"Invalid regular expression: {e}")
+        return value
+
+    @model_validator(mode='after')
+    def check_conditions(self) -> 'CategorisationRule':
+        conditions = [
+            self.merchant_pattern, self.description_pattern, self.min_amount,
+            self.max_amount, self.account_id, self.transaction_type,
+        ]
+        if all(condition is None for condition in conditions):
+            raise ValueError("A rule needs at least one condition.")
+        if self.min_amount is not None and self.max_amount is not None and self.min_amount > self.max_amount:
+            raise ValueError("min_amount must not be greater than max_amount.")
+        return self
+
+    class Config:
+        from_attributes = True
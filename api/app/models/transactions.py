@@ -44,4 +44,4 @@ class Transaction(BaseModel):
         return value
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        from_attributes = True
\ No newline at end of file
@@ -0,0 +1,280 @@
+"""
+Monthly partitions of the transactions table: keeping future months ready, and
+archiving past months to compressed CSV exports.
+
+The API runs the maintenance as a background task. Archiving is an operator's job,
+run from ./api with the POSTGRES_* settings as for the API:
+
+    python -m app.partitions list
+    python -m app.partitions maintain --months-ahead 6
+    python -m app.partitions archive --before 2024-01-01 --directory ../archive
+    python -m app.partitions restore ../archive/transactions_2023_06.csv.gz
+
+An archived month is exported to <directory>/transactions_YYYY_MM.csv.gz, detached
+and dropped (kept as a standalone table with --keep-tables), and its transaction_ids
+are released. account_daily_balances is left alone, so balances and net worth still
+count the archived transactions; restore puts a month back the same way, without
+counting it twice. Loading an export through bulk ingestion instead would count it twice.
+"""
+import argparse
+import asyncio
+import csv
+import gzip
+import os
+import re
+from datetime import date, timedelta
+from pathlib import Path
+from typing import List
+import asyncpg
+import orjson
+from asyncpg.pool import PoolConnectionProxy
+from app.cred_manager import get_key
+from app.database.configuration import PostgresDatabaseConfiguration
+from app.logger_utility import get_my_logger
+
+logger = get_my_logger("Partitions", [])
+
+# Months after the current one kept ready to receive transactions, e.g. PARTITION_MONTHS_AHEAD=3
+MONTHS_AHEAD = int(get_key("partition", "months_ahead", "3"))
+# Partition DDL gives up rather than queue behind long queries (and hold up every query after it)
+LOCK_TIMEOUT = "5s"
+# A monthly partition's bounds as pg_get_expr prints them
+BOUNDS = re.compile(r"FROM \('(\d{4}-\d{2}-\d{2})'\) TO \('(\d{4}-\d{2}-\d{2})'\)")
+# Exports are named after the partition they came from
+EXPORT_NAME = re.compile(r"^transactions_(\d{4})_(\d{2})\.csv\.gz$")
+
+PARTITIONS = """
+    SELECT
+        c.relname AS name,
+        pg_get_expr(c.relpartbound, c.oid) AS bound,
+        GREATEST(c.reltuples, 0)::bigint AS estimated_rows,
+        pg_total_relation_size(c.oid) AS size_bytes
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'transactions'::regclass
+    ORDER BY c.relname
+"""
+# A partition's rows with a header, timestamps in ISO 8601
+EXPORT = """
+    SELECT
+        transaction_id, account_id, transaction_date, description, amount, transaction_type,
+        category_id, merchant_name, notes, is_recurring,
+        to_json(created_at) #>> '{}' AS created_at,
+        to_json(updated_at) #>> '{}' AS updated_at
+    FROM "%s"
+    ORDER BY transaction_date, transaction_id
+"""
+
+
+class ArchiveError(Exception):
+    """
+    Raised when a partition cannot be archived or restored safely; nothing is changed.
+    """
+
+
+async def list_partitions(con: PoolConnectionProxy) -> List[dict]:
+    """
+    The partitions of transactions, with their date range (None for the default partition).
+
+    :return: dicts with name, first_date, end_date (exclusive), estimated_rows and size_bytes
+    """
+    partitions = []
+    for row in await con.fetch(PARTITIONS):
+        bounds = BOUNDS.search(row["bound"])
+        first_date, end_date = (date.fromisoformat(d) for d in bounds.groups()) if bounds else (None, None)
+        partitions.append({
+            "name": row["name"],
+            "first_date": first_date,
+            "end_date": end_date,
+            "estimated_rows": row["estimated_rows"],
+            "size_bytes": row["size_bytes"],
+        })
+    return partitions
+
+
+async def maintain_partitions(con: PoolConnectionProxy, months_ahead: int = MONTHS_AHEAD) -> int:
+    """
+    Create the partitions for this month and the next `months_ahead`, and for any month
+    whose rows went to the default partition.
+
+    :return: number of partitions created
+    """
+    async with con.transaction():
+        await con.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+        created = await con.fetchval("SELECT maintain_transaction_partitions($1)", months_ahead)
+    if created:
+        logger.info(f"Created {created} transaction partitions.")
+    return created
+
+
+async def run_partition_maintenance(pool, interval: float, months_ahead: int = MONTHS_AHEAD) -> None:
+    """
+    Background task: maintain the partitions now and every `interval` seconds until cancelled.
+
+    The first run does not wait, so a new month never goes without a partition for long,
+    and when there is nothing to create it costs a handful of catalog lookups.
+    """
+    while True:
+        try:
+            async with pool.acquire() as con:
+                await maintain_partitions(con, months_ahead)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Partition maintenance failed; retrying on the next run.")
+        await asyncio.sleep(interval)
+
+
+async def _notify(con: PoolConnectionProxy, op: str, rows: int, first_date: date, end_date: date) -> None:
+    """
+    Announce a change to transactions that no trigger sees, in the triggers' format.
+    """
+    await con.execute("SELECT pg_notify('table_changes', $1)", orjson.dumps({
+        "table": "transactions",
+        "op": op,
+        "rows": rows,
+        "first_date": first_date,
+        "last_date": date.fromordinal(end_date.toordinal() - 1),
+    }).decode())
+
+
+async def archive_partition(con: PoolConnectionProxy, partition: dict, directory: Path, keep_table: bool = False) -> dict:
+    """
+    Export one partition to a gzipped CSV, then detach it and (unless keep_table) drop it.
+
+    The export reads a single snapshot and notes its row count and latest updated_at;
+    the partition is only detached if it still matches both, so writes that land
+    during the export are never lost. Detaching fires no triggers, so the month's ids
+    are released from transaction_ids here, and caches are told through the usual
+    table_changes notification.
+
+    :return: the partition's name, date range, row count and export path
+    """
+    name = partition["name"]
+    path = directory / f"{name}.csv.gz"
+    partial = path.with_name(path.name + ".partial")
+    contents = f'SELECT COUNT(*) AS rows, MAX(updated_at) AS last_update FROM "{name}"'
+
+    async with con.transaction(isolation="repeatable_read", readonly=True):
+        exported = await con.fetchrow(contents)
+        with gzip.open(partial, "wb") as out:
+            await con.copy_from_query(EXPORT % name, output=out, format="csv", header=True)
+    os.replace(partial, path)
+
+    async with con.transaction():
+        await con.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+        await con.execute(f'ALTER TABLE transactions DETACH PARTITION "{name}"')
+        if tuple(await con.fetchrow(contents)) != tuple(exported):
+            raise ArchiveError(f"{name} was written to during its export; it stays attached.")
+        await con.execute(f'DELETE FROM transaction_ids WHERE transaction_id IN (SELECT transaction_id FROM "{name}")')
+        if not keep_table:
+            await con.execute(f'DROP TABLE "{name}"')
+        await _notify(con, "ARCHIVE", exported["rows"], partition["first_date"], partition["end_date"])
+
+    logger.info(f"Archived {exported['rows']} transactions from {name} to {path}.")
+    return {
+        "partition": name,
+        "first_date": partition["first_date"],
+        "end_date": partition["end_date"],
+        "rows": exported["rows"],
+        "path": str(path),
+    }
+
+
+async def archive_partitions(
+    con: PoolConnectionProxy,
+    before: date,
+    directory: Path,
+    keep_tables: bool = False,
+    months_ahead: int = MONTHS_AHEAD,
+) -> List[dict]:
+    """
+    Archive every monthly partition whose month is over by `before`, oldest first.
+
+    Stray rows in the default partition are given their own partitions first, so
+    nothing older than `before` is left behind.
+    """
+    if before > date.today().replace(day=1):
+        raise ArchiveError("Only months that are over can be archived.")
+    directory.mkdir(parents=True, exist_ok=True)
+    await maintain_partitions(con, months_ahead)
+
+    old = [p for p in await list_partitions(con) if p["end_date"] is not None and p["end_date"] <= before]
+    if not old:
+        logger.info(f"No transaction partitions end before {before}.")
+    return [await archive_partition(con, partition, directory, keep_tables) for partition in old]
+
+
+async def restore_partition(con: PoolConnectionProxy, path: Path) -> dict:
+    """
+    Load an export made by archive_partition back into its month's partition.
+
+    Rows are copied into the partition itself rather than through transactions, so
+    like the detach that archived them they bypass the rollup triggers, which still
+    count them. Their ids are claimed in transaction_ids first, so an export holding
+    an id the ledger has taken up since, or restored twice, fails and changes nothing.
+    The partition is created again if need be; rows that arrived for the month since
+    it was archived stay.
+
+    :return: the partition's name, date range, row count and export path
+    """
+    match = EXPORT_NAME.match(path.name)
+    if not match:
+        raise ArchiveError(f"{path.name} is not named like an export (transactions_YYYY_MM.csv.gz).")
+    first_date = date(int(match[1]), int(match[2]), 1)
+    end_date = (first_date.replace(day=28) + timedelta(days=4)).replace(day=1)
+    name = f"transactions_{first_date:%Y_%m}"
+    with gzip.open(path, "rt", newline="") as f:
+        columns = next(csv.reader(f))
+
+    try:
+        async with con.transaction():
+            await con.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+            await con.execute("SELECT create_transaction_partition($1)", first_date)
+            await con.execute(f'CREATE TEMP TABLE restored ON COMMIT DROP AS SELECT * FROM "{name}" WITH NO DATA')
+            with gzip.open(path, "rb") as source:
+                status = await con.copy_to_table("restored", source=source, columns=columns, format="csv", header=True)
+            rows = int(status.split()[-1])
+            await con.execute("INSERT INTO transaction_ids (transaction_id) SELECT transaction_id FROM restored")
+            await con.execute(f'INSERT INTO "{name}" SELECT * FROM restored')
+            await _notify(con, "RESTORE", rows, first_date, end_date)
+    except asyncpg.UniqueViolationError:
+        raise ArchiveError(f"{path.name} holds transaction ids that are in the ledger already; nothing was restored.")
+
+    logger.info(f"Restored {rows} transactions from {path} to {name}.")
+    return {"partition": name, "first_date": first_date, "end_date": end_date, "rows": rows, "path": str(path)}
+
+
+async def main(args) -> None:
+    con = await asyncpg.connect(**PostgresDatabaseConfiguration().get_config())
+    try:
+        if args.command == "list":
+            for p in await list_partitions(con):
+                span = f"{p['first_date']} .. {p['end_date']}" if p["first_date"] else "(default)"
+                print(f"{p['name']:<24} {span:<26} ~{p['estimated_rows']:>10,} rows {p['size_bytes'] / 2**20:>9.1f} MiB")
+        elif args.command == "maintain":
+            print(f"Created {await maintain_partitions(con, args.months_ahead)} partitions.")
+        elif args.command == "archive":
+            archived = await archive_partitions(con, args.before, Path(args.directory), args.keep_tables)
+            print(f"Archived {len(archived)} partitions ({sum(a['rows'] for a in archived):,} transactions).")
+        else:
+            restored = [await restore_partition(con, Path(path)) for path in args.paths]
+            print(f"Restored {len(restored)} partitions ({sum(r['rows'] for r in restored):,} transactions).")
+    finally:
+        await con.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="show the partitions with their sizes")
+    maintain = commands.add_parser("maintain", help="create missing partitions")
+    maintain.add_argument("--months-ahead", type=int, default=MONTHS_AHEAD)
+    archive = commands.add_parser("archive", help="export, detach and drop old partitions")
+    archive.add_argument("--before", type=date.fromisoformat, required=True,
+                         help="archive the months that end before this date, e.g. 2024-01-01")
+    archive.add_argument("--directory", default="archive", help="where to write the .csv.gz exports")
+    archive.add_argument("--keep-tables", action="store_true", help="keep detached partitions as standalone tables")
+    restore = commands.add_parser("restore", help="load archived partitions back")
+    restore.add_argument("paths", nargs="+", help="transactions_YYYY_MM.csv.gz exports")
+    asyncio.run(main(parser.parse_args()))
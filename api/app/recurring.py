@@ -0,0 +1,272 @@
+import asyncio
+from datetime import date, timedelta
+from decimal import Decimal
+from itertools import chain
+from typing import TYPE_CHECKING
+from asyncpg.pool import PoolConnectionProxy
+from app.metrics import db_timer
+from app.logger_utility import get_my_logger
+
+# numpy is imported by the first detection run, which happens well after a worker starts
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = get_my_logger("Recurring Detection", [])
+
+JOB_NAME = "recurring_detection"
+# (cadence, period in days, tolerance in days, minimum occurrences)
+CADENCES = [
+    ("weekly", 7.0, 1.0, 4),
+    ("biweekly", 14.0, 2.0, 3),
+    ("monthly", 30.44, 3.5, 3),
+    ("quarterly", 91.31, 7.0, 3),
+    ("annual", 365.25, 10.0, 3),
+]
+# Share of a series' gaps that must fall within the cadence's tolerance
+MATCH_SHARE = 0.75
+# Largest standard deviation of the amounts, relative to their mean, a series may have
+MAX_AMOUNT_VARIATION = 0.5
+# Writes committed just before the previous run may carry slightly older timestamps
+WATERMARK_OVERLAP = timedelta(minutes=5)
+EPOCH = date(1970, 1, 1)
+
+# The expression idx_transactions_series_key indexes; queries must spell it the same way
+SERIES_KEY = "recurring_series_key(t.merchant_name, t.description)"
+
+# Every (account, series key, type) group with the rows written since the watermark or
+# left stale by a delete or an edit, and each group's full history as arrays ordered by date
+_HISTORY = f"""
+    {{touched}}
+    SELECT
+        t.account_id,
+        {SERIES_KEY} AS series_key,
+        t.transaction_type::text AS transaction_type,
+        array_agg(t.transaction_date - DATE '1970-01-01' ORDER BY t.transaction_date) AS days,
+        array_agg(t.amount::float8 ORDER BY t.transaction_date) AS amounts
+    FROM transactions t
+    {{join}}
+    GROUP BY 1, 2, 3
+"""
+HISTORY_SINCE = _HISTORY.format(
+    touched=f"""
+    WITH touched AS (
+        SELECT t.account_id, {SERIES_KEY} AS series_key, t.transaction_type
+        FROM transactions t
+        WHERE t.updated_at > $1
+        UNION
+        SELECT * FROM unnest($2::uuid[], $3::text[], $4::transaction_type[])
+    )""",
+    join=f"""
+    JOIN touched g
+      ON g.account_id = t.account_id
+     AND g.series_key = {SERIES_KEY}
+     AND g.transaction_type = t.transaction_type""",
+)
+HISTORY_ALL = _HISTORY.format(touched="", join="")
+
+# Takes the stale groups recorded by the triggers on transactions; rolled back with the run if it fails
+DRAIN_STALE_GROUPS = """
+    WITH drained AS (DELETE FROM recurring_stale_groups RETURNING *)
+    SELECT DISTINCT account_id, series_key, transaction_type::text AS transaction_type FROM drained
+"""
+
+_GROUPS = "unnest($1::uuid[], $2::text[], $3::transaction_type[]) AS g(account_id, series_key, transaction_type)"
+
+UPSERT_SERIES = """
+    INSERT INTO recurring_series (
+        account_id, series_key, transaction_type, cadence, typical_amount, occurrences, first_date, last_date, is_active
+    )
+    SELECT s.*, (s.last_date + cadence_interval(s.cadence) * 2)::date >= CURRENT_DATE
+    FROM unnest($1::uuid[], $2::text[], $3::transaction_type[], $4::text[], $5::numeric[], $6::int[], $7::date[], $8::date[])
+        AS s(account_id, series_key, transaction_type, cadence, typical_amount, occurrences, first_date, last_date)
+    ON CONFLICT (account_id, series_key, transaction_type) DO UPDATE
+    SET cadence = EXCLUDED.cadence,
+        typical_amount = EXCLUDED.typical_amount,
+        occurrences = EXCLUDED.occurrences,
+        first_date = EXCLUDED.first_date,
+        last_date = EXCLUDED.last_date,
+        is_active = EXCLUDED.is_active
+"""
+DELETE_SERIES = f"""
+    DELETE FROM recurring_series r
+    USING {_GROUPS}
+    WHERE r.account_id = g.account_id AND r.series_key = g.series_key AND r.transaction_type = g.transaction_type
+"""
+FLAG_TRANSACTIONS = f"""
+    UPDATE transactions t
+    SET is_recurring = TRUE
+    FROM {_GROUPS}
+    WHERE t.account_id = g.account_id
+      AND {SERIES_KEY} = g.series_key
+      AND t.transaction_type = g.transaction_type
+      AND NOT t.is_recurring
+"""
+# Series none of whose transactions are left, which a full pass has no group for
+DELETE_ORPHANED_SERIES = f"""
+    DELETE FROM recurring_series r
+    WHERE NOT EXISTS (
+        SELECT 1 FROM transactions t
+        WHERE t.account_id = r.account_id
+          AND {SERIES_KEY} = r.series_key
+          AND t.transaction_type = r.transaction_type
+    )
+"""
+# Series that have missed two occurrences in a row have most likely been cancelled
+EXPIRE_SERIES = """
+    UPDATE recurring_series
+    SET is_active = FALSE
+    WHERE is_active AND (last_date + cadence_interval(cadence) * 2)::date < CURRENT_DATE
+"""
+
+
+def find_series(group: "np.ndarray", day: "np.ndarray", amount: "np.ndarray") -> tuple:
+    """
+    Classify many transaction groups as periodic or not in one pass over flat arrays.
+
+    The gaps between consecutive transactions of every group come from a single
+    np.diff; per-group statistics are then np.bincount sums keyed by group index,
+    so the cost does not depend on how the rows are split into groups. A group
+    follows a cadence when enough of its gaps fall within that cadence's tolerance
+    and its amounts are reasonably stable; when several cadences qualify the one
+    matching the largest share of gaps wins.
+
+    :param group: group index of each transaction, ascending from 0 with no gaps
+    :param day: transaction date in days since the epoch, ascending within each group
+    :param amount: transaction amount
+    :return: (cadence index per group or -1, typical amount, occurrences, first day, last day)
+    """
+    import numpy as np
+
+    counts = np.bincount(group)
+    n_groups = len(counts)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    same_group = group[1:] == group[:-1]
+    gaps = np.diff(day)[same_group]
+    gap_group = group[1:][same_group]
+    n_gaps = counts - 1
+
+    # The median is robust to the odd refund or annual price rise
+    by_amount = np.lexsort((amount, group))
+    typical = amount[by_amount][starts + (counts - 1) // 2]
+    mean = np.bincount(group, amount, n_groups) / counts
+    spread = np.sqrt(np.maximum(np.bincount(group, amount * amount, n_groups) / counts - mean * mean, 0))
+    stable = spread <= MAX_AMOUNT_VARIATION * np.abs(mean)
+
+    cadence = np.full(n_groups, -1)
+    best = np.zeros(n_groups)
+    for index, (_, period, tolerance, minimum) in enumerate(CADENCES):
+        hits = np.bincount(gap_group, (np.abs(gaps - period) <= tolerance).astype(float), n_groups)
+        share = np.divide(hits, n_gaps, out=np.zeros(n_groups), where=n_gaps > 0)
+        better = (share >= MATCH_SHARE) & (share > best) & (counts >= minimum) & stable
+        cadence[better] = index
+        best[better] = share[better]
+
+    return cadence, typical, counts, day[starts], day[starts + counts - 1]
+
+
+async def detect_recurring(con: PoolConnectionProxy, everything: bool = False) -> dict:
+    """
+    Find recurring series among the transactions written since the last run.
+
+    Only groups with a transaction added or changed since the watermark, or that
+    lost one to a delete or an edit (recorded in recurring_stale_groups by triggers),
+    are re-analysed, but each of those is judged on its whole history. Detected series
+    are upserted into recurring_series and their transactions flagged is_recurring;
+    analysed groups that are no longer periodic, or have no transactions left, lose
+    their series. Flags are only ever set, so is_recurring values supplied at
+    ingestion are kept.
+
+    Runs in one transaction under an advisory lock, so concurrent runs from several
+    workers do not duplicate the work.
+
+    :param everything: ignore the watermark and re-analyse every group
+    :return: counts of groups analysed, series found and transactions flagged
+    """
+    import numpy as np
+
+    result = {"analysed": 0, "series": 0, "flagged": 0, "skipped": False}
+    async with con.transaction():
+        if not await con.fetchval("SELECT pg_try_advisory_xact_lock(hashtext($1))", JOB_NAME):
+            logger.info("Recurring detection is already running elsewhere; skipping.")
+            result["skipped"] = True
+            return result
+
+        started_at = await con.fetchval("SELECT now()")
+        watermark = await con.fetchval("SELECT watermark FROM job_watermarks WHERE job_name = $1", JOB_NAME)
+        with db_timer():
+            stale = [tuple(g) for g in await con.fetch(DRAIN_STALE_GROUPS)]
+            if everything or watermark is None:
+                rows = await con.fetch(HISTORY_ALL)
+                await con.execute(DELETE_ORPHANED_SERIES)
+            else:
+                rows = await con.fetch(
+                    HISTORY_SINCE, watermark - WATERMARK_OVERLAP, *(map(list, zip(*stale)) if stale else ([], [], []))
+                )
+                # Stale groups with no transactions left have no history to be judged on
+                analysed = {(r["account_id"], r["series_key"], r["transaction_type"]) for r in rows}
+                emptied = [g for g in stale if g not in analysed]
+                if emptied:
+                    await con.execute(DELETE_SERIES, *map(list, zip(*emptied)))
+        result["analysed"] = len(rows)
+
+        if rows:
+            lengths = np.fromiter((len(r["days"]) for r in rows), dtype=np.int64, count=len(rows))
+            group = np.repeat(np.arange(len(rows)), lengths)
+            day = np.fromiter(chain.from_iterable(r["days"] for r in rows), dtype=np.int64, count=int(lengths.sum()))
+            amount = np.fromiter(chain.from_iterable(r["amounts"] for r in rows), dtype=np.float64, count=len(day))
+            cadence, typical, counts, first_day, last_day = find_series(group, day, amount)
+
+            found = np.flatnonzero(cadence >= 0)
+            lost = np.flatnonzero(cadence < 0)
+            keys = [(r["account_id"], r["series_key"], r["transaction_type"]) for r in rows]
+
+            with db_timer():
+                if len(lost):
+                    await con.execute(DELETE_SERIES, *map(list, zip(*(keys[i] for i in lost))))
+                if len(found):
+                    account_ids, series_keys, types = map(list, zip(*(keys[i] for i in found)))
+                    await con.execute(
+                        UPSERT_SERIES, account_ids, series_keys, types,
+                        [CADENCES[cadence[i]][0] for i in found],
+                        [Decimal(f"{typical[i]:.4f}") for i in found],
+                        [int(counts[i]) for i in found],
+                        [EPOCH + timedelta(days=int(first_day[i])) for i in found],
+                        [EPOCH + timedelta(days=int(last_day[i])) for i in found],
+                    )
+                    status = await con.execute(FLAG_TRANSACTIONS, account_ids, series_keys, types)
+                    result["flagged"] = int(status.split()[-1])
+            result["series"] = len(found)
+
+        await con.execute(EXPIRE_SERIES)
+        await con.execute(
+            """
+            INSERT INTO job_watermarks (job_name, watermark) VALUES ($1, $2)
+            ON CONFLICT (job_name) DO UPDATE SET watermark = EXCLUDED.watermark, updated_at = CURRENT_TIMESTAMP
+            """,
+            JOB_NAME, started_at,
+        )
+
+    logger.info(
+        f"Analysed {result['analysed']} transaction groups: {result['series']} recurring series, "
+        f"{result['flagged']} transactions newly flagged."
+    )
+    return result
+
+
+async def run_recurring_detection(pool, interval: float) -> None:
+    """
+    Background task: run incremental detection every `interval` seconds until cancelled.
+
+    The first run waits one interval too, so workers that start and stop often do not
+    each pay for a detection pass (and numpy's import) while they warm up.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with pool.acquire() as con:
+                await detect_recurring(con)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Recurring detection failed; retrying on the next run.")
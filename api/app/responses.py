@@ -0,0 +1,61 @@
+from decimal import Decimal
+from typing import Iterable
+from uuid import UUID
+import orjson
+from asyncpg import Record
+from fastapi import Response
+from app.metrics import serialization_timer
+
+# orjson serialises date and datetime (including timestamptz offsets) natively.
+# Everything else asyncpg hands back is encoded here; asyncpg's own UUID type
+# subclasses uuid.UUID, so lookups walk the MRO.
+ENCODERS = {
+    Decimal: float,
+    UUID: str,
+}
+
+
+def _default(value):
+    for cls in type(value).__mro__:
+        encoder = ENCODERS.get(cls)
+        if encoder is not None:
+            return encoder(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def encode_record(record: Record) -> bytes:
+    """
+    Encode a single asyncpg Record as a JSON object.
+    """
+    with serialization_timer():
+        return orjson.dumps(dict(record.items()), default=_default)
+
+
+def encode_records(records: Iterable[Record]) -> bytes:
+    """
+    Encode asyncpg Records straight to a JSON array of objects.
+    """
+    with serialization_timer():
+        return orjson.dumps([dict(record.items()) for record in records], default=_default)
+
+
+class RecordsResponse(Response):
+    """
+    Response for a list of asyncpg Records, serialised once to JSON bytes without
+    going through a DataFrame or FastAPI's jsonable_encoder.
+    """
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return encode_records(content)
+
+
+
+class RecordResponse(Response):
+    """
+    Response for a single asyncpg Record, serialised as a JSON object.
+    """
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return encode_record(content)
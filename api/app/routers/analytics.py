@@ -0,0 +1,544 @@
+from typing import Annotated, Literal, Optional
+from uuid import UUID
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from app.database.postgres.queries import fetch_registered, register_query
+from app.fx import BASE_CURRENCY
+from app.recurring import detect_recurring
+from app.responses import RecordResponse, RecordsResponse
+from app.logger_utility import get_my_logger
+from app.dependencies import get_postgres_read_session, get_postgres_session
+
+logger = get_my_logger("AnalyticsRouter", [])
+router = APIRouter()
+
+Granularity = Literal["day", "week", "month"]
+Currency = Annotated[Optional[str], Query(
+    pattern="^[A-Z]{3}$",
+    description="ISO 4217 code to report amounts in (default FX_BASE_CURRENCY)",
+)]
+
+
+def _report_currency(request: Request, currency: Optional[str]) -> str:
+    """
+    Resolve the currency to report amounts in, rejecting it when it or any account's
+    currency has no exchange rates to convert with.
+    """
+    fx = request.app.state.fx_rates
+    currency = currency or BASE_CURRENCY
+    if fx.needs_conversion(currency):
+        missing = fx.missing(fx.account_currencies | {currency})
+        if missing:
+            raise HTTPException(status_code=400, detail=f"No exchange rates loaded for {', '.join(missing)}.")
+    return currency
+
+
+SUMMARY = register_query("analytics.summary", """
+    SELECT
+        (SELECT COUNT(*) FROM accounts) AS account_count,
+        (SELECT COALESCE(SUM(transaction_count), 0) FROM account_daily_balances) AS transaction_count,
+        (SELECT COUNT(*) FROM budgets) AS budget_count,
+        (SELECT COALESCE(SUM(net_change), 0) FROM account_daily_balances) AS net_worth
+""")
+
+
+# Balances are summed per currency and each sum converted at today's rate, so the
+# rate is looked up once per currency rather than per account or day
+BALANCES_BY_CURRENCY = register_query("analytics.balances_by_currency", """
+    WITH balances AS (
+        SELECT a.currency, SUM(b.net_change) AS balance
+        FROM account_daily_balances b
+        JOIN accounts a ON a.account_id = b.account_id
+        GROUP BY 1
+    )
+    SELECT COALESCE(SUM(balance * fx_convert_rate(currency, $1, CURRENT_DATE)), 0) AS net_worth
+    FROM balances
+""")
+
+
+@router.get("/summary")
+async def get_summary(request: Request, currency: Currency = None, pg=Depends(get_postgres_read_session)):
+    """
+    Get headline counts and the current net worth in `currency`, with each
+    currency's balance converted at today's rate.
+    """
+    logger.info("Fetching the dashboard summary.")
+    currency = _report_currency(request, currency)
+    data = await fetch_registered(SUMMARY, pg)
+    summary = dict(data[0].items())
+
+    if request.app.state.fx_rates.needs_conversion(currency):
+        data = await fetch_registered(BALANCES_BY_CURRENCY, pg, currency)
+        summary["net_worth"] = data[0]["net_worth"]
+    summary["currency"] = currency
+    return RecordResponse(summary)
+
+
+NET_WORTH = register_query("analytics.net_worth", """
+    WITH changes AS (
+        SELECT
+            date_trunc($1, balance_date)::date AS period,
+            SUM(net_change) AS net_change
+        FROM account_daily_balances
+        WHERE $2::uuid IS NULL OR account_id = $2
+        GROUP BY 1
+    )
+    SELECT
+        period,
+        net_change,
+        SUM(net_change) OVER (ORDER BY period) AS net_worth
+    FROM changes
+    ORDER BY period
+""")
+
+
+# Balances are summed per currency, carried to the close of every period and
+# converted at that day's rate, so net_change includes gains and losses from rate
+# moves. Rates are looked up once per (currency, period), never per transaction.
+NET_WORTH_CONVERTED = register_query("analytics.net_worth_converted", """
+    WITH changes AS (
+        SELECT
+            a.currency,
+            date_trunc($1, b.balance_date)::date AS period,
+            SUM(b.net_change) AS net_change
+        FROM account_daily_balances b
+        JOIN accounts a ON a.account_id = b.account_id
+        WHERE $2::uuid IS NULL OR b.account_id = $2
+        GROUP BY 1, 2
+    ),
+    periods AS (
+        SELECT DISTINCT period, LEAST((period + ('1 ' || $1)::interval)::date - 1, CURRENT_DATE) AS close_date
+        FROM changes
+    ),
+    balances AS (
+        SELECT
+            c.currency,
+            p.period,
+            p.close_date,
+            SUM(COALESCE(ch.net_change, 0)) OVER (PARTITION BY c.currency ORDER BY p.period) AS balance
+        FROM (SELECT DISTINCT currency FROM changes) c
+        CROSS JOIN periods p
+        LEFT JOIN changes ch ON ch.currency = c.currency AND ch.period = p.period
+    ),
+    totals AS (
+        SELECT period, SUM(balance * fx_convert_rate(currency, $3, close_date)) AS net_worth
+        FROM balances
+        GROUP BY period
+    )
+    SELECT
+        period,
+        net_worth - LAG(net_worth, 1, 0::numeric) OVER (ORDER BY period) AS net_change,
+        net_worth
+    FROM totals
+    ORDER BY period
+""")
+
+
+@router.get("/net-worth")
+async def get_net_worth(
+    request: Request,
+    granularity: Granularity = "day",
+    account_id: Optional[UUID] = None,
+    currency: Currency = None,
+    pg=Depends(get_postgres_read_session),
+):
+    """
+    Get the net worth (or a single account's balance) at the close of each day,
+    week or month along with the net change within that period, in `currency`.
+    """
+    logger.info(f"Fetching the {granularity} net worth series.")
+    currency = _report_currency(request, currency)
+    if request.app.state.fx_rates.needs_conversion(currency):
+        data = await fetch_registered(NET_WORTH_CONVERTED, pg, granularity, account_id, currency)
+    else:
+        data = await fetch_registered(NET_WORTH, pg, granularity, account_id)
+
+    if len(data) == 0:
+        logger.warning("No transactions found in the database.")
+        return {"message": "No transactions found."}
+
+    logger.info(f"Found {len(data)} {granularity} periods.")
+    return RecordsResponse(data)
+
+
+CHANGES = register_query("analytics.changes", """
+    WITH daily AS (
+        SELECT balance_date AS day, SUM(net_change) AS net_change
+        FROM account_daily_balances
+        GROUP BY 1
+    ),
+    balances AS (
+        SELECT day, SUM(net_change) OVER (ORDER BY day) AS net_worth
+        FROM daily
+    ),
+    periods AS (
+        SELECT
+            g.granularity,
+            date_trunc(g.granularity, b.day)::date AS period,
+            (array_agg(b.net_worth ORDER BY b.day DESC))[1] AS net_worth
+        FROM balances b
+        CROSS JOIN (VALUES ('day'), ('week'), ('month')) AS g(granularity)
+        GROUP BY 1, 2
+    ),
+    ranked AS (
+        SELECT
+            granularity,
+            period,
+            net_worth,
+            LAG(net_worth) OVER (PARTITION BY granularity ORDER BY period) AS previous_net_worth,
+            ROW_NUMBER() OVER (PARTITION BY granularity ORDER BY period DESC) AS recency
+        FROM periods
+    )
+    SELECT
+        granularity,
+        period,
+        net_worth,
+        previous_net_worth,
+        (net_worth - previous_net_worth) / NULLIF(ABS(previous_net_worth), 0) AS pct_change
+    FROM ranked
+    WHERE recency = 1
+""")
+
+
+# Converts the net worth only at the (at most six) closing days being compared
+CHANGES_CONVERTED = register_query("analytics.changes_converted", """
+    WITH periods AS (
+        SELECT
+            g.granularity,
+            date_trunc(g.granularity, b.balance_date)::date AS period,
+            MAX(b.balance_date) AS close_date
+        FROM (SELECT DISTINCT balance_date FROM account_daily_balances) b
+        CROSS JOIN (VALUES ('day'), ('week'), ('month')) AS g(granularity)
+        GROUP BY 1, 2
+    ),
+    ranked AS (
+        SELECT
+            granularity,
+            period,
+            close_date,
+            LAG(close_date) OVER (PARTITION BY granularity ORDER BY period) AS previous_close_date,
+            ROW_NUMBER() OVER (PARTITION BY granularity ORDER BY period DESC) AS recency
+        FROM periods
+    ),
+    latest AS (
+        SELECT * FROM ranked WHERE recency = 1
+    ),
+    worth AS (
+        SELECT d.close_date, SUM(c.balance * fx_convert_rate(c.currency, $1, d.close_date)) AS net_worth
+        FROM (
+            SELECT close_date FROM latest
+            UNION
+            SELECT previous_close_date FROM latest WHERE previous_close_date IS NOT NULL
+        ) d
+        CROSS JOIN LATERAL (
+            SELECT a.currency, SUM(b.net_change) AS balance
+            FROM account_daily_balances b
+            JOIN accounts a ON a.account_id = b.account_id
+            WHERE b.balance_date <= d.close_date
+            GROUP BY a.currency
+        ) c
+        GROUP BY d.close_date
+    )
+    SELECT
+        l.granularity,
+        l.period,
+        w.net_worth,
+        pw.net_worth AS previous_net_worth,
+        (w.net_worth - pw.net_worth) / NULLIF(ABS(pw.net_worth), 0) AS pct_change
+    FROM latest l
+    JOIN worth w ON w.close_date = l.close_date
+    LEFT JOIN worth pw ON pw.close_date = l.previous_close_date
+""")
+
+
+@router.get("/changes")
+async def get_changes(request: Request, currency: Currency = None, pg=Depends(get_postgres_read_session)):
+    """
+    Get the percent change in net worth between the two most recent days, weeks
+    and months, comparing the closing net worth of each period in `currency`.
+    """
+    logger.info("Fetching net worth percent changes.")
+    currency = _report_currency(request, currency)
+    if request.app.state.fx_rates.needs_conversion(currency):
+        data = await fetch_registered(CHANGES_CONVERTED, pg, currency)
+    else:
+        data = await fetch_registered(CHANGES, pg)
+
+    if len(data) == 0:
+        logger.warning("No transactions found in the database.")
+        return {"message": "No transactions found."}
+
+    return RecordsResponse(data)
+
+
+
+BUDGET_VS_ACTUAL = register_query("analytics.budget_vs_actual", """
+    WITH budgeted AS (
+        SELECT b.budget_id, b.category_id, b.allocated_amount, p.start_date, p.end_date
+        FROM budgets b
+        JOIN budget_periods p ON p.budget_period_id = b.budget_period_id
+        WHERE b.budget_period_id = $1
+    ),
+    -- Every category paired with itself and all of its descendants, from the
+    -- in-memory category tree as two parallel arrays.
+    subtree AS (
+        SELECT * FROM unnest($2::uuid[], $3::uuid[]) AS s(budget_category_id, category_id)
+        WHERE s.budget_category_id IN (SELECT category_id FROM budgeted)
+    ),
+    spent AS (
+        SELECT s.budget_category_id, SUM(t.amount) AS spent
+        FROM subtree s
+        JOIN transactions t ON t.category_id = s.category_id
+        WHERE t.transaction_type = 'expense'
+          AND t.transaction_date BETWEEN (SELECT MIN(start_date) FROM budgeted) AND (SELECT MAX(end_date) FROM budgeted)
+        GROUP BY s.budget_category_id
+    )
+    SELECT
+        b.budget_id,
+        b.category_id,
+        c.category_name,
+        b.allocated_amount,
+        COALESCE(sp.spent, 0) AS spent,
+        b.allocated_amount - COALESCE(sp.spent, 0) AS remaining,
+        COALESCE(sp.spent, 0) / NULLIF(b.allocated_amount, 0) AS pct_used
+    FROM budgeted b
+    JOIN categories c ON c.category_id = b.category_id
+    LEFT JOIN spent sp ON sp.budget_category_id = b.category_id
+    ORDER BY c.category_name
+""")
+
+
+# Budgets, which are in the base currency, are converted at the rate on the period's
+# last day (or today, for a period still running); spending at each transaction
+# date's rate, looked up once per (currency, day) of the period.
+BUDGET_VS_ACTUAL_CONVERTED = register_query("analytics.budget_vs_actual_converted", """
+    WITH budgeted AS (
+        SELECT
+            b.budget_id,
+            b.category_id,
+            b.allocated_amount * fx_convert_rate($5, $4, LEAST(p.end_date, CURRENT_DATE)) AS allocated_amount,
+            p.start_date,
+            p.end_date
+        FROM budgets b
+        JOIN budget_periods p ON p.budget_period_id = b.budget_period_id
+        WHERE b.budget_period_id = $1
+    ),
+    subtree AS (
+        SELECT * FROM unnest($2::uuid[], $3::uuid[]) AS s(budget_category_id, category_id)
+        WHERE s.budget_category_id IN (SELECT category_id FROM budgeted)
+    ),
+    rates AS MATERIALIZED (
+        SELECT c.currency, d::date AS day, fx_convert_rate(c.currency, $4, d::date) AS rate
+        FROM (SELECT DISTINCT currency FROM accounts) c
+        CROSS JOIN generate_series(
+            (SELECT MIN(start_date) FROM budgeted), (SELECT MAX(end_date) FROM budgeted), interval '1 day'
+        ) AS d
+    ),
+    spent AS (
+        SELECT s.budget_category_id, SUM(t.amount * r.rate) AS spent
+        FROM subtree s
+        JOIN transactions t ON t.category_id = s.category_id
+        JOIN accounts a ON a.account_id = t.account_id
+        JOIN rates r ON r.currency = a.currency AND r.day = t.transaction_date
+        WHERE t.transaction_type = 'expense'
+          AND t.transaction_date BETWEEN (SELECT MIN(start_date) FROM budgeted) AND (SELECT MAX(end_date) FROM budgeted)
+        GROUP BY s.budget_category_id
+    )
+    SELECT
+        b.budget_id,
+        b.category_id,
+        c.category_name,
+        b.allocated_amount,
+        COALESCE(sp.spent, 0) AS spent,
+        b.allocated_amount - COALESCE(sp.spent, 0) AS remaining,
+        COALESCE(sp.spent, 0) / NULLIF(b.allocated_amount, 0) AS pct_used
+    FROM budgeted b
+    JOIN categories c ON c.category_id = b.category_id
+    LEFT JOIN spent sp ON sp.budget_category_id = b.category_id
+    ORDER BY c.category_name
+""")
+
+
+@router.get("/budget-vs-actual")
+async def get_budget_vs_actual(
+    request: Request,
+    period_id: UUID,
+    currency: Currency = None,
+    pg=Depends(get_postgres_read_session),
+):
+    """
+    Compare each budget in a period with what was spent in that category and all of
+    its subcategories between the period's start and end dates, in `currency`.
+    Budgets are in FX_BASE_CURRENCY and converted at the rate on the period's last
+    day; spending is converted at each transaction date's rate.
+    """
+    logger.info(f"Fetching budget vs actual for period {period_id}.")
+    currency = _report_currency(request, currency)
+    budget_categories, members = request.app.state.category_tree.subtree_pairs
+    fx = request.app.state.fx_rates
+    if currency != BASE_CURRENCY or fx.needs_conversion(currency):
+        missing = fx.missing({BASE_CURRENCY, currency})
+        if missing:
+            raise HTTPException(status_code=400, detail=f"No exchange rates loaded for {', '.join(missing)}.")
+        data = await fetch_registered(
+            BUDGET_VS_ACTUAL_CONVERTED, pg, period_id, budget_categories, members, currency, BASE_CURRENCY
+        )
+    else:
+        data = await fetch_registered(BUDGET_VS_ACTUAL, pg, period_id, budget_categories, members)
+
+    if len(data) == 0:
+        logger.warning(f"No budgets found for period {period_id}.")
+        return {"message": "No budgets found for this period."}
+
+    logger.info(f"Found {len(data)} budgets for period {period_id}.")
+    return RecordsResponse(data)
+
+
+RECURRING_SERIES = register_query("analytics.recurring_series", """
+    SELECT
+        s.series_id,
+        s.account_id,
+        a.account_name,
+        s.series_key,
+        s.transaction_type,
+        s.cadence,
+        s.typical_amount,
+        s.occurrences,
+        s.first_date,
+        s.last_date,
+        (s.last_date + cadence_interval(s.cadence))::date AS next_date,
+        s.is_active
+    FROM recurring_series s
+    JOIN accounts a ON a.account_id = s.account_id
+    WHERE ($1::uuid IS NULL OR s.account_id = $1)
+      AND (s.is_active OR NOT $2::boolean)
+    ORDER BY next_date, s.series_key
+""")
+
+
+@router.get("/recurring")
+async def get_recurring_series(
+    account_id: Optional[UUID] = None,
+    active_only: bool = True,
+    pg=Depends(get_postgres_read_session),
+):
+    """
+    Get the recurring series found by the detection job, soonest next occurrence first.
+    """
+    logger.info("Fetching recurring series.")
+    data = await fetch_registered(RECURRING_SERIES, pg, account_id, active_only)
+
+    if len(data) == 0:
+        logger.warning("No recurring series found.")
+        return {"message": "No recurring series found."}
+
+    logger.info(f"Found {len(data)} recurring series.")
+    return RecordsResponse(data)
+
+
+@router.post("/recurring/detect")
+async def run_recurring_detection(everything: bool = False, pg=Depends(get_postgres_session)):
+    """
+    Run recurring detection now over the transactions written since the last run,
+    or over every transaction when `everything` is set.
+    """
+    logger.info(f"Running recurring detection{' over every transaction' if everything else ''}.")
+    return await detect_recurring(pg, everything=everything)
+
+
+FORECAST = register_query("analytics.forecast", """
+    WITH occurrences AS (
+        SELECT o::date AS day, signed_amount(s.typical_amount, s.transaction_type) AS amount
+        FROM recurring_series s
+        CROSS JOIN LATERAL generate_series(
+            s.last_date + cadence_interval(s.cadence), CURRENT_DATE + $1::int, cadence_interval(s.cadence)
+        ) AS o
+        WHERE s.is_active AND ($2::uuid IS NULL OR s.account_id = $2)
+    ),
+    days AS (
+        SELECT d::date AS day
+        FROM generate_series(CURRENT_DATE + 1, CURRENT_DATE + $1::int, interval '1 day') AS d
+    ),
+    daily AS (
+        SELECT d.day, COALESCE(SUM(o.amount), 0) AS net_change, COUNT(o.amount) AS occurrence_count
+        FROM days d
+        LEFT JOIN occurrences o ON o.day = d.day
+        GROUP BY d.day
+    )
+    SELECT
+        day,
+        net_change,
+        occurrence_count,
+        (
+            SELECT COALESCE(SUM(net_change), 0)
+            FROM account_daily_balances
+            WHERE $2::uuid IS NULL OR account_id = $2
+        ) + SUM(net_change) OVER (ORDER BY day) AS balance
+    FROM daily
+    ORDER BY day
+""")
+
+
+# Every account's amounts converted at today's rate, looked up once per account
+FORECAST_CONVERTED = register_query("analytics.forecast_converted", """
+    WITH rates AS MATERIALIZED (
+        SELECT account_id, fx_convert_rate(currency, $3, CURRENT_DATE) AS rate
+        FROM accounts
+        WHERE $2::uuid IS NULL OR account_id = $2
+    ),
+    occurrences AS (
+        SELECT o::date AS day, signed_amount(s.typical_amount, s.transaction_type) * r.rate AS amount
+        FROM recurring_series s
+        JOIN rates r ON r.account_id = s.account_id
+        CROSS JOIN LATERAL generate_series(
+            s.last_date + cadence_interval(s.cadence), CURRENT_DATE + $1::int, cadence_interval(s.cadence)
+        ) AS o
+        WHERE s.is_active
+    ),
+    days AS (
+        SELECT d::date AS day
+        FROM generate_series(CURRENT_DATE + 1, CURRENT_DATE + $1::int, interval '1 day') AS d
+    ),
+    daily AS (
+        SELECT d.day, COALESCE(SUM(o.amount), 0) AS net_change, COUNT(o.amount) AS occurrence_count
+        FROM days d
+        LEFT JOIN occurrences o ON o.day = d.day
+        GROUP BY d.day
+    )
+    SELECT
+        day,
+        net_change,
+        occurrence_count,
+        (
+            SELECT COALESCE(SUM(b.net_change * r.rate), 0)
+            FROM account_daily_balances b
+            JOIN rates r ON r.account_id = b.account_id
+        ) + SUM(net_change) OVER (ORDER BY day) AS balance
+    FROM daily
+    ORDER BY day
+""")
+
+
+@router.get("/forecast")
+async def get_forecast(
+    request: Request,
+    days: int = Query(90, ge=1, le=730),
+    account_id: Optional[UUID] = None,
+    currency: Currency = None,
+    pg=Depends(get_postgres_read_session),
+):
+    """
+    Project the net worth (or a single account's balance) for each of the next
+    `days` days by replaying every active recurring series at its cadence from its
+    last occurrence, starting from today's balance. Occurrences that were due before
+    today but have not been seen are treated as missed rather than pending. Amounts
+    are in `currency` at today's rates.
+    """
+    logger.info(f"Forecasting balances {days} days ahead.")
+    currency = _report_currency(request, currency)
+    if request.app.state.fx_rates.needs_conversion(currency):
+        data = await fetch_registered(FORECAST_CONVERTED, pg, days, account_id, currency)
+    else:
+        data = await fetch_registered(FORECAST, pg, days, account_id)
+
+    logger.info(f"Forecast {len(data)} days.")
+    return RecordsResponse(data)
@@ -1,24 +1,112 @@
-from fastapi import APIRouter, Depends
-from app.database.postgres.connections import postgres
-# TODO: Import Models
+from uuid import UUID
+import asyncpg
+from fastapi import APIRouter, Depends, HTTPException, Request
+from app.database.postgres.queries import fetch_registered, register_query
+from app.models.categories import CategorisationRule
+from app.cache import cached_response
+from app.columnar import empty_body, encode_records_as
+from app.responses import RecordResponse, RecordsResponse
+from app.dependencies import get_postgres_read_session, get_postgres_session
 from app.logger_utility import get_my_logger
-from app.dependencies import get_postgres_session
 
 logger = get_my_logger("CategoriesRouter", [])
 router = APIRouter()
 
+ALL_CATEGORIES = register_query("categories.all", "SELECT * FROM categories")
+ALL_RULES = register_query("categorisation_rules.all", "SELECT * FROM categorisation_rules ORDER BY priority, created_at")
+
 @router.get("/all")
-async def get_all_categories(pg = Depends(get_postgres_session)):
+async def get_all_categories(request: Request):
     """
     Get all categories from the database.
     """
-    logger.info("Fetching all categories from the database.")
-    query = "SELECT * FROM categories"
-    data = await postgres(query, pg)
+    async def load(format):
+        logger.info("Fetching all categories from the database.")
+        async with request.app.state.pg_read_pool.acquire() as pg:
+            data = await fetch_registered(ALL_CATEGORIES, pg)
+
+        if len(data) == 0:
+            logger.warning("No categories found in the database.")
+            return empty_body(format, "No categories found.")
+
+        logger.info(f"Found {len(data)} categories.")
+        return encode_records_as(data, format)
+
+    return await cached_response(request, "categories", load)
+
+
+def _tree_category(request: Request, category_id: UUID):
+    tree = request.app.state.category_tree
+    if category_id not in tree:
+        logger.warning(f"Category {category_id} not found in the category tree.")
+        raise HTTPException(status_code=404, detail="Category not found.")
+    return tree
+
+@router.get("/tree")
+async def get_category_tree(request: Request):
+    """
+    Get the category hierarchy as nested objects, served from the in-memory category tree.
+    """
+    return request.app.state.category_tree.as_nested()
+
+@router.get("/{category_id}/ancestors")
+async def get_category_ancestors(request: Request, category_id: UUID):
+    """
+    Get the ancestors of a category, from the root category down to its direct parent.
+    """
+    tree = _tree_category(request, category_id)
+    return [{"category_id": c, "category_name": tree.names[c]} for c in tree.ancestors(category_id)]
+
+@router.get("/{category_id}/descendants")
+async def get_category_descendants(request: Request, category_id: UUID, include_self: bool = False):
+    """
+    Get every category below a category in the hierarchy.
+    """
+    tree = _tree_category(request, category_id)
+    members = tree.descendants(category_id, include_self=include_self)
+    return [{"category_id": c, "category_name": tree.names[c]} for c in sorted(members, key=tree.names.get)]
 
-    if len(data) == 0:
-        logger.warning("No categories found in the database.")
-        return {"message": "No categories found."}
+@router.get("/rules")
+async def get_categorisation_rules(pg=Depends(get_postgres_read_session)):
+    """
+    Get every categorisation rule, in the order they are tried.
+    """
+    logger.info("Fetching categorisation rules from the database.")
+    data = await fetch_registered(ALL_RULES, pg)
+    logger.info(f"Found {len(data)} categorisation rules.")
+    return RecordsResponse(data)
 
-    logger.info(f"Found {len(data)} categories.")
-    return data.to_dict(orient="records")
\ No newline at end of file
+@router.post("/rules", status_code=201)
+async def create_categorisation_rule(rule: CategorisationRule, pg=Depends(get_postgres_session)):
+    """
+    Add a categorisation rule. The API's matcher is recompiled when the change
+    notification for categorisation_rules arrives.
+    """
+    logger.info(f"Creating categorisation rule for category {rule.category_id}.")
+    try:
+        data = await pg.fetchrow(
+            """
+            INSERT INTO categorisation_rules (
+                rule_id, category_id, merchant_pattern, description_pattern, min_amount, max_amount,
+                account_id, transaction_type, priority, is_active, notes
+            ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)
+            RETURNING *
+            """,
+            rule.rule_id, rule.category_id, rule.merchant_pattern, rule.description_pattern, rule.min_amount,
+            rule.max_amount, rule.account_id, rule.transaction_type.value if rule.transaction_type else None,
+            rule.priority, rule.is_active, rule.notes,
+        )
+    except asyncpg.ForeignKeyViolationError:
+        logger.warning("Categorisation rule references an unknown category or account.")
+        raise HTTPException(status_code=400, detail="Unknown category or account.")
+    return RecordResponse(data, status_code=201)
+
+@router.delete("/rules/{rule_id}", status_code=204)
+async def delete_categorisation_rule(rule_id: UUID, pg=Depends(get_postgres_session)):
+    """
+    Remove a categorisation rule.
+    """
+    status = await pg.execute("DELETE FROM categorisation_rules WHERE rule_id = $1", rule_id)
+    if status == "DELETE 0":
+        raise HTTPException(status_code=404, detail="Categorisation rule not found.")
+    logger.info(f"Deleted categorisation rule {rule_id}.")
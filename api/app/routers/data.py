@@ -1,91 +1,402 @@
-from fastapi import APIRouter, Depends
-from app.database.postgres.connections import postgres
+import base64
+import csv
+import io
+from datetime import date
+from typing import Literal, Optional
+from uuid import UUID
+import asyncpg
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from app.database.postgres.connections import postgres, postgres_stream
+from app.database.postgres.queries import fetch_registered, register_query
 from app.models.accounts import Account
 from app.models.categories import Category
-from app.models.transactions import Transaction
+from app.models.transactions import Transaction, TransactionType
 from app.models.budgets import Budget, BudgetPeriod
+from app.ingestion import ingest_transactions, parse_transaction_rows
+from app.categoriser import categorise_transactions
+from app.cache import cached_response
+from app.columnar import MEDIA_TYPES, empty_body, encode_records_as, negotiate_format
+from app.responses import encode_record
 from app.logger_utility import get_my_logger
-from app.dependencies import get_postgres_session
+from app.dependencies import get_postgres_read_session, get_postgres_session
 
 logger = get_my_logger("DataRouter", [])
 router = APIRouter()
 
+ALL_ACCOUNTS = register_query("accounts.all", "SELECT * FROM accounts")
+ALL_CATEGORIES = register_query("categories.all", "SELECT * FROM categories")
+ALL_BUDGETS = register_query("budgets.all", "SELECT * FROM budgets")
+ALL_BUDGET_PERIODS = register_query("budget_periods.all", "SELECT * FROM budget_periods")
+
+
+def _encode_cursor(transaction_date, transaction_id) -> str:
+    raw = f"{transaction_date.isoformat()}|{transaction_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        transaction_date, transaction_id = raw.split("|")
+        return date.fromisoformat(transaction_date), UUID(transaction_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor.")
+
+
+def _encode_search_cursor(score, transaction_date, transaction_id) -> str:
+    raw = f"{score!r}|{transaction_date.isoformat()}|{transaction_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def _decode_search_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        score, transaction_date, transaction_id = raw.split("|")
+        return float(score), date.fromisoformat(transaction_date), UUID(transaction_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor.")
+
+
+def _transaction_filters(account_id=None, category_id=None, transaction_type=None, start_date=None, end_date=None):
+    """
+    Build the WHERE conditions and positional arguments shared by the transaction endpoints.
+    Each filter maps onto one of the single-column indexes on transactions. The date
+    bounds stay bare comparisons on transaction_date so they also prune the monthly
+    partitions, even as parameters of a generic plan.
+
+    category_id may be a collection of ids, e.g. a category and its subcategories.
+    """
+    conditions, args = [], []
+    if isinstance(category_id, (set, frozenset, list, tuple)):
+        category_filter = ("category_id = ANY(${})", list(category_id))
+    else:
+        category_filter = ("category_id = ${}", category_id)
+    filters = [
+        ("account_id = ${}", account_id),
+        category_filter,
+        ("transaction_type = ${}", transaction_type.value if transaction_type else None),
+        ("transaction_date >= ${}", start_date),
+        ("transaction_date <= ${}", end_date),
+    ]
+    for condition, value in filters:
+        if value is None:
+            continue
+        args.append(value)
+        conditions.append(condition.format(len(args)))
+    return conditions, args
+
+
+def _category_filter(request: Request, category_id: Optional[UUID], include_subcategories: bool):
+    """
+    Expand category_id to its whole subtree using the in-memory category tree.
+    Categories the tree has not seen yet are matched on their own.
+    """
+    tree = request.app.state.category_tree
+    if category_id is None or not include_subcategories or category_id not in tree:
+        return category_id
+    return tree.descendants(category_id)
+
+
 @router.get("/accounts")
-async def get_all_accounts(pg=Depends(get_postgres_session)):
+async def get_all_accounts(request: Request):
     """
     Get all accounts from the database.
     """
-    logger.info("Fetching all accounts from the database.")
-    query = "SELECT * FROM accounts"
-    data = await postgres(query, pg)
+    async def load(format):
+        logger.info("Fetching all accounts from the database.")
+        async with request.app.state.pg_read_pool.acquire() as pg:
+            data = await fetch_registered(ALL_ACCOUNTS, pg)
 
-    if len(data) == 0:
-        logger.warning("No accounts found in the database.")
-        return {"message": "No accounts found."}
-    
-    logger.info(f"Found {len(data)} accounts.")
-    return data.to_dict(orient="records")
+        if len(data) == 0:
+            logger.warning("No accounts found in the database.")
+            return empty_body(format, "No accounts found.")
+
+        logger.info(f"Found {len(data)} accounts.")
+        return encode_records_as(data, format)
+
+    return await cached_response(request, "accounts", load)
 
 @router.get("/categories")
-async def get_all_categories(pg=Depends(get_postgres_session)):
+async def get_all_categories(request: Request):
     """
     Get all categories from the database.
     """
-    logger.info("Fetching all categories from the database.")
-    query = "SELECT * FROM categories"
-    data = await postgres(query, pg)
+    async def load(format):
+        logger.info("Fetching all categories from the database.")
+        async with request.app.state.pg_read_pool.acquire() as pg:
+            data = await fetch_registered(ALL_CATEGORIES, pg)
 
-    if len(data) == 0:
-        logger.warning("No categories found in the database.")
-        return {"message": "No categories found."}
-    
-    logger.info(f"Found {len(data)} categories.")
-    return data.to_dict(orient="records")
+        if len(data) == 0:
+            logger.warning("No categories found in the database.")
+            return empty_body(format, "No categories found.")
+
+        logger.info(f"Found {len(data)} categories.")
+        return encode_records_as(data, format)
+
+    return await cached_response(request, "categories", load)
 
 @router.get("/transactions")
-async def get_all_transactions(pg=Depends(get_postgres_session)):
+async def get_all_transactions(
+    request: Request,
+    limit: int = Query(1000, ge=1, le=10000, description="Maximum number of transactions per page"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from a previous page's X-Next-Cursor header"),
+    order: Literal["asc", "desc"] = "asc",
+    account_id: Optional[UUID] = None,
+    category_id: Optional[UUID] = None,
+    include_subcategories: bool = Query(False, description="Also match transactions in subcategories of category_id"),
+    transaction_type: Optional[TransactionType] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    pg=Depends(get_postgres_read_session),
+):
     """
-    Get all transactions from the database.
+    Get a page of transactions ordered by (transaction_date, transaction_id).
+
+    Pages are walked with keyset pagination: when more rows are available the
+    response carries an X-Next-Cursor header to pass back as `cursor`. Send
+    Accept: application/vnd.apache.arrow.stream or application/vnd.apache.parquet
+    for a typed columnar page instead of JSON.
     """
-    logger.info("Fetching all transactions from the database.")
-    query = "SELECT * FROM transactions"
-    data = await postgres(query, pg)
+    logger.info("Fetching a page of transactions from the database.")
+    format = negotiate_format(request)
+    category_id = _category_filter(request, category_id, include_subcategories)
+    conditions, args = _transaction_filters(account_id, category_id, transaction_type, start_date, end_date)
+
+    if cursor is not None:
+        cursor_date, cursor_id = _decode_cursor(cursor)
+        args.extend([cursor_date, cursor_id])
+        comparison = ">" if order == "asc" else "<"
+        conditions.append(f"(transaction_date, transaction_id) {comparison} (${len(args) - 1}, ${len(args)})")
 
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    direction = "ASC" if order == "asc" else "DESC"
+    # Fetch one extra row to learn whether another page exists without a second query
+    args.append(limit + 1)
+    query = f"""
+        SELECT * FROM transactions
+        {where}
+        ORDER BY transaction_date {direction}, transaction_id {direction}
+        LIMIT ${len(args)}
+    """
+    data = await postgres(query, pg, *args)
+
+    headers = {"Vary": "Accept"}
     if len(data) == 0:
         logger.warning("No transactions found in the database.")
-        return {"message": "No transactions found."}
-    
+        return Response(empty_body(format, "No transactions found."), media_type=MEDIA_TYPES[format], headers=headers)
+
+    if len(data) > limit:
+        data = data[:limit]
+        last = data[-1]
+        headers["X-Next-Cursor"] = _encode_cursor(last["transaction_date"], last["transaction_id"])
+
     logger.info(f"Found {len(data)} transactions.")
-    return data.to_dict(orient="records")
+    return Response(encode_records_as(data, format), media_type=MEDIA_TYPES[format], headers=headers)
+
+@router.get("/transactions/export")
+async def export_transactions(
+    request: Request,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    account_id: Optional[UUID] = None,
+    category_id: Optional[UUID] = None,
+    include_subcategories: bool = Query(False, description="Also match transactions in subcategories of category_id"),
+    transaction_type: Optional[TransactionType] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+):
+    """
+    Stream every matching transaction as NDJSON or CSV.
+
+    Rows are read through a server-side cursor in fixed-size batches and written out
+    as they arrive, so memory use stays flat regardless of the size of the ledger.
+    """
+    logger.info(f"Exporting transactions as {format}.")
+    category_id = _category_filter(request, category_id, include_subcategories)
+    conditions, args = _transaction_filters(account_id, category_id, transaction_type, start_date, end_date)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = f"""
+        SELECT * FROM transactions
+        {where}
+        ORDER BY transaction_date, transaction_id
+    """
+    encode = _encode_csv_batch if format == "csv" else _encode_ndjson_batch
+
+    async def stream():
+        # The connection is held by the generator rather than a dependency, because
+        # dependencies are torn down before a streaming body is sent.
+        async with request.app.state.pg_read_pool.acquire() as pg:
+            header = format == "csv"
+            async for batch in postgres_stream(query, pg, *args):
+                yield encode(batch, header)
+                header = False
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        stream(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="transactions.{format}"'},
+    )
+
+
+@router.get("/transactions/search")
+async def search_transactions(
+    request: Request,
+    q: str = Query(..., min_length=2, max_length=200, description="Words to look for in descriptions and merchant names"),
+    limit: int = Query(50, ge=1, le=1000, description="Maximum number of transactions per page"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from a previous page's X-Next-Cursor header"),
+    account_id: Optional[UUID] = None,
+    category_id: Optional[UUID] = None,
+    include_subcategories: bool = Query(False, description="Also match transactions in subcategories of category_id"),
+    transaction_type: Optional[TransactionType] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    pg=Depends(get_postgres_read_session),
+):
+    """
+    Search transaction descriptions and merchant names, best matches first.
+
+    Rows match on full-text search (web-search syntax, English stemming) or on
+    trigram word similarity, which catches typos and partial words. Each row carries
+    a `score`; pages are walked with the X-Next-Cursor header as for /transactions.
+    """
+    logger.info(f"Searching transactions for {q!r}.")
+    format = negotiate_format(request)
+    category_id = _category_filter(request, category_id, include_subcategories)
+    conditions, args = _transaction_filters(account_id, category_id, transaction_type, start_date, end_date)
+
+    args.append(q)
+    term = f"${len(args)}"
+    # transaction_search_vector(...) must be spelled exactly as in idx_transactions_search
+    document = "transaction_search_vector(description, merchant_name)"
+    query_vector = f"websearch_to_tsquery('english', {term})"
+    conditions.append(
+        f"({document} @@ {query_vector} OR {term} <% description OR {term} <% merchant_name)"
+    )
+
+    page_condition = ""
+    if cursor is not None:
+        cursor_score, cursor_date, cursor_id = _decode_search_cursor(cursor)
+        args.extend([cursor_score, cursor_date, cursor_id])
+        page_condition = f"WHERE (score, transaction_date, transaction_id) < (${len(args) - 2}, ${len(args) - 1}, ${len(args)})"
+
+    # Fetch one extra row to learn whether another page exists without a second query
+    args.append(limit + 1)
+    query = f"""
+        SELECT * FROM (
+            SELECT *, GREATEST(
+                ts_rank({document}, {query_vector}),
+                word_similarity({term}, description),
+                word_similarity({term}, COALESCE(merchant_name, ''))
+            ) AS score
+            FROM transactions
+            WHERE {' AND '.join(conditions)}
+        ) matches
+        {page_condition}
+        ORDER BY score DESC, transaction_date DESC, transaction_id DESC
+        LIMIT ${len(args)}
+    """
+    data = await postgres(query, pg, *args)
+
+    headers = {"Vary": "Accept"}
+    if len(data) == 0:
+        logger.warning(f"No transactions match {q!r}.")
+        return Response(empty_body(format, "No transactions found."), media_type=MEDIA_TYPES[format], headers=headers)
+
+    if len(data) > limit:
+        data = data[:limit]
+        last = data[-1]
+        headers["X-Next-Cursor"] = _encode_search_cursor(last["score"], last["transaction_date"], last["transaction_id"])
+
+    logger.info(f"Found {len(data)} transactions matching {q!r}.")
+    return Response(encode_records_as(data, format), media_type=MEDIA_TYPES[format], headers=headers)
+
+
+def _encode_ndjson_batch(batch, header=False) -> bytes:
+    return b"".join(encode_record(record) + b"\n" for record in batch)
+
+
+def _encode_csv_batch(batch, header=False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(batch[0].keys())
+    writer.writerows(batch)
+    return buffer.getvalue().encode("utf-8")
+
+@router.post("/transactions/bulk")
+async def bulk_ingest_transactions(request: Request, pg=Depends(get_postgres_session)):
+    """
+    Bulk insert or update transactions from a JSON array, NDJSON or CSV body.
+
+    The body format is taken from the Content-Type header (application/json,
+    application/x-ndjson or text/csv). Rows are validated in batches and written
+    with COPY; invalid rows are skipped and reported back by row number.
+    """
+    logger.info("Bulk ingesting transactions.")
+    try:
+        rows = parse_transaction_rows(await request.body(), request.headers.get("content-type", "application/json"))
+    except (ValueError, csv.Error) as e:
+        logger.warning(f"Could not parse bulk transaction body: {e}")
+        raise HTTPException(status_code=400, detail=f"Could not parse request body: {e}")
+
+    try:
+        return await ingest_transactions(rows, pg, categoriser=request.app.state.categoriser)
+    except asyncpg.UniqueViolationError:
+        # Another request wrote one of these transaction_ids with a different date first
+        logger.warning("Bulk ingestion lost a race for a transaction_id; nothing was written.")
+        raise HTTPException(
+            status_code=409, detail="A transaction_id was written concurrently with another date; retry the request."
+        )
+
+@router.post("/transactions/categorise")
+async def categorise_uncategorised_transactions(
+    request: Request,
+    everything: bool = Query(False, description="Re-evaluate already categorised transactions as well"),
+    pg=Depends(get_postgres_session),
+):
+    """
+    Run the categorisation rules over the ledger and assign categories where a rule matches.
+
+    By default only transactions without a category are considered.
+    """
+    logger.info(f"Categorising {'all' if everything else 'uncategorised'} transactions.")
+    return await categorise_transactions(request.app.state.categoriser, pg, everything=everything)
 
 @router.get("/budgets")
-async def get_all_budgets(pg=Depends(get_postgres_session)):
+async def get_all_budgets(request: Request):
     """
     Get all budgets from the database.
     """
-    logger.info("Fetching all budgets from the database.")
-    query = "SELECT * FROM budgets"
-    data = await postgres(query, pg)
+    async def load(format):
+        logger.info("Fetching all budgets from the database.")
+        async with request.app.state.pg_read_pool.acquire() as pg:
+            data = await fetch_registered(ALL_BUDGETS, pg)
 
-    if len(data) == 0:
-        logger.warning("No budgets found in the database.")
-        return {"message": "No budgets found."}
-    
-    logger.info(f"Found {len(data)} budgets.")
-    return data.to_dict(orient="records")
+        if len(data) == 0:
+            logger.warning("No budgets found in the database.")
+            return empty_body(format, "No budgets found.")
+
+        logger.info(f"Found {len(data)} budgets.")
+        return encode_records_as(data, format)
+
+    return await cached_response(request, "budgets", load)
 
 @router.get("/budget-periods")
-async def get_all_budget_periods(pg=Depends(get_postgres_session)):
+async def get_all_budget_periods(request: Request):
     """
     Get all budget periods from the database.
     """
-    logger.info("Fetching all budget periods from the database.")
-    query = "SELECT * FROM budget_periods"
-    data = await postgres(query, pg)
+    async def load(format):
+        logger.info("Fetching all budget periods from the database.")
+        async with request.app.state.pg_read_pool.acquire() as pg:
+            data = await fetch_registered(ALL_BUDGET_PERIODS, pg)
 
-    if len(data) == 0:
-        logger.warning("No budget periods found in the database.")
-        return {"message": "No budget periods found."}
-    
-    logger.info(f"Found {len(data)} budget periods.")
-    return data.to_dict(orient="records")
\ No newline at end of file
+        if len(data) == 0:
+            logger.warning("No budget periods found in the database.")
+            return empty_body(format, "No budget periods found.")
+
+        logger.info(f"Found {len(data)} budget periods.")
+        return encode_records_as(data, format)
+
+    return await cached_response(request, "budget_periods", load)
@@ -0,0 +1,68 @@
+import asyncio
+from typing import List, Optional
+import orjson
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import StreamingResponse
+from app.events import RESYNC
+from app.logger_utility import get_my_logger
+
+logger = get_my_logger("EventsRouter", [])
+router = APIRouter()
+
+# Seconds between comment lines that keep idle streams open through proxies
+HEARTBEAT_INTERVAL = 15
+# Milliseconds an EventSource waits before reconnecting after the stream drops
+RETRY_MS = 5000
+
+
+def _event(event_id: int, change: dict) -> bytes:
+    return b"id: %d\nevent: change\ndata: %s\n\n" % (event_id, orjson.dumps(change))
+
+
+@router.get("")
+async def stream_events(
+    request: Request,
+    tables: Optional[List[str]] = Query(None, description="Only send changes to these tables (default: all)"),
+):
+    """
+    Stream table changes as Server-Sent Events.
+
+    Every write to a table the API watches becomes one `change` event whose data is
+    the change notification, e.g. {"table": "budgets", "op": "UPDATE"}; writes to
+    transactions also say how many rows changed, over which dates and in which
+    accounts. An event for table "*" (RESYNC after falling behind, RECONNECT after
+    the API lost its database listener) means anything may have changed. Changes
+    are not replayed, so a client reconnecting with Last-Event-ID is sent a RESYNC
+    first.
+    """
+    broker = request.app.state.event_broker
+    wanted = set(tables) if tables else None
+    resume = request.headers.get("last-event-id") is not None
+
+    async def stream():
+        with broker.connect() as queue:
+            logger.info(f"Event stream opened; {len(broker)} connected.")
+            yield b"retry: %d\n\n" % RETRY_MS
+            if resume:
+                yield _event(broker.last_event_id, RESYNC)
+            try:
+                while True:
+                    try:
+                        event = await asyncio.wait_for(queue.get(), HEARTBEAT_INTERVAL)
+                    except asyncio.TimeoutError:
+                        yield b": keep-alive\n\n"
+                        continue
+                    if event is None:
+                        return
+                    event_id, change = event
+                    if wanted is None or change["table"] == "*" or change["table"] in wanted:
+                        yield _event(event_id, change)
+            finally:
+                logger.info("Event stream closed.")
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        # Proxies must neither cache nor buffer the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
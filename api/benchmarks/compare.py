@@ -0,0 +1,44 @@
+"""
+Compare two benchmarks.load result files endpoint by endpoint.
+
+    python -m benchmarks.compare benchmarks/results/before.json benchmarks/results/after.json
+
+Latency changes are shown as a percentage of the baseline, so a negative number
+means the second run was faster; for throughput a positive number is better.
+"""
+import argparse
+import json
+
+METRICS = ["throughput_rps", "p50_ms", "p95_ms", "p99_ms", "peak_rss_mb"]
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        run = json.load(f)
+    return {(r["endpoint"], r["concurrency"]): r for r in run["results"]}
+
+
+def change(before, after) -> str:
+    if before is None or after is None:
+        return "n/a"
+    if not before:
+        return "new"
+    return f"{(after - before) / before:+.1%}"
+
+
+def main(args) -> None:
+    baseline, candidate = load(args.baseline), load(args.candidate)
+    print(f"{'endpoint':<60} {'c':>4}  " + "  ".join(f"{metric:>14}" for metric in METRICS))
+    for key in sorted(baseline.keys() & candidate.keys()):
+        endpoint, concurrency = key
+        cells = [change(baseline[key].get(metric), candidate[key].get(metric)) for metric in METRICS]
+        print(f"{endpoint[:60]:<60} {concurrency:>4}  " + "  ".join(f"{cell:>14}" for cell in cells))
+    for key in sorted(baseline.keys() ^ candidate.keys()):
+        print(f"{key[0][:60]:<60} {key[1]:>4}  only in {'baseline' if key in baseline else 'candidate'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    main(parser.parse_args())
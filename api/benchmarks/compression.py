@@ -0,0 +1,187 @@
+"""
+Measure what response compression saves on the wire and costs in CPU, per endpoint.
+
+Every endpoint is requested --requests times in a row with each Accept-Encoding
+(identity, then every encoding the API answers with) and reports:
+
+    wire_bytes       body bytes as sent, and the ratio to the identity body
+    server_cpu_ms    the API process's user+system CPU per request, read from /proc
+    client_decode_ms time to decompress one body on the client
+    p50_ms / p95_ms  loopback latency, where bandwidth is free and only the CPU shows
+    transfer_ms      time the body would take at --bandwidth Mbit/s
+
+Unless --url is given the API is started with uvicorn in a child process, as in
+benchmarks.load. Run from ./api against a database seeded with benchmarks.seed:
+
+    python -m benchmarks.compression --requests 100 --bandwidth 100
+
+Results are written to benchmarks/results/compression-<timestamp>.json in the same
+shape as benchmarks.load, so two runs can be compared with benchmarks.compare.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import httpx
+from benchmarks.load import DEFAULT_ENDPOINTS, RESULTS_DIR, discover, git_commit, percentile, wait_until_up
+
+ENCODINGS = ["identity", "gzip", "br", "zstd"]
+EXTRA_ENDPOINTS = ["/data/transactions?limit=10000", "/data/transactions/export?format=csv&start_date={recent}"]
+
+
+def read_cpu_seconds(pid: int) -> float:
+    """
+    User plus system CPU time a process has used so far.
+    """
+    with open(f"/proc/{pid}/stat") as stat:
+        # The command name may contain spaces; the fields after it are fixed
+        fields = stat.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def decoder(encoding: str):
+    if encoding == "gzip":
+        return lambda raw: zlib.decompress(raw, 47)
+    if encoding == "br":
+        import brotli
+        return brotli.decompress
+    if encoding == "zstd":
+        import zstandard
+        # Streamed bodies are several frames without a content size
+        return lambda raw: zstandard.ZstdDecompressor().decompressobj().decompress(raw)
+    return lambda raw: raw
+
+
+def fetch(client: httpx.Client, path: str, encoding: str) -> tuple:
+    """
+    :return: (raw body as sent, Content-Encoding, seconds until the body was read)
+    """
+    started = time.perf_counter()
+    with client.stream("GET", path, headers={"Accept-Encoding": encoding}) as response:
+        response.raise_for_status()
+        raw = b"".join(response.iter_raw())
+    return raw, response.headers.get("content-encoding", "identity"), time.perf_counter() - started
+
+
+def measure(client: httpx.Client, path: str, encoding: str, requests: int, pid: int, identity_size: int, bandwidth: float) -> dict:
+    raw, used, _ = fetch(client, path, encoding)
+    if used != encoding:
+        return None
+    decode = decoder(encoding)
+    started = time.perf_counter()
+    body = decode(raw)
+    decode_seconds = time.perf_counter() - started
+
+    latencies = []
+    cpu_before = read_cpu_seconds(pid) if pid else None
+    for _ in range(requests):
+        latencies.append(fetch(client, path, encoding)[2])
+    cpu = (read_cpu_seconds(pid) - cpu_before) / requests if pid else None
+
+    ordered = sorted(latencies)
+    return {
+        "endpoint": f"{path} [{encoding}]",
+        "concurrency": 1,
+        "requests": requests,
+        "errors": 0,
+        "throughput_rps": round(requests / sum(ordered), 2),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+        "peak_rss_mb": None,
+        "body_bytes": len(body),
+        "wire_bytes": len(raw),
+        "ratio": round(len(raw) / (identity_size or len(raw)), 4),
+        "server_cpu_ms": round(cpu * 1000, 3) if cpu is not None else None,
+        "client_decode_ms": round(decode_seconds * 1000, 3),
+        "transfer_ms": round(len(raw) * 8 / (bandwidth * 1e6) * 1000, 3),
+    }
+
+
+def main(args) -> None:
+    server = None
+    url = args.url
+    if url is None:
+        url = f"http://127.0.0.1:{args.port}"
+        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        server_log = open(RESULTS_DIR / "server.log", "w")
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--log-level", "warning"],
+            cwd=Path(__file__).parent.parent,
+            stdout=server_log,
+            stderr=subprocess.STDOUT,
+        )
+    pid = server.pid if server is not None else args.pid
+
+    results = []
+    try:
+        async def prepare():
+            async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+                await wait_until_up(client, server)
+                return await discover(client)
+
+        placeholders = asyncio.run(prepare())
+        # The last 90 days, so the export is large but not the whole ledger
+        placeholders["recent"] = (datetime.now(timezone.utc).date() - timedelta(days=90)).isoformat()
+
+        with httpx.Client(base_url=url, timeout=120) as client:
+            for template in args.endpoint or DEFAULT_ENDPOINTS + EXTRA_ENDPOINTS:
+                try:
+                    path = template.format_map(placeholders)
+                except KeyError as e:
+                    print(f"Skipping {template}: no {e.args[0]} in the seeded data.")
+                    continue
+                # Warm the pool, statement caches and response cache before measuring
+                for encoding in ENCODINGS:
+                    fetch(client, path, encoding)
+                identity_size = None
+                for encoding in ENCODINGS:
+                    result = measure(client, path, encoding, args.requests, pid, identity_size, args.bandwidth)
+                    if result is None:
+                        continue
+                    identity_size = identity_size or result["wire_bytes"]
+                    result["endpoint"] = f"{template} [{encoding}]"
+                    results.append(result)
+                    cpu = f"{result['server_cpu_ms']:>7.2f}" if result["server_cpu_ms"] is not None else "    n/a"
+                    print(
+                        f"{template[:52]:<52} {encoding:<8} {result['wire_bytes']:>11,} B ({result['ratio']:>6.1%})  "
+                        f"cpu {cpu} ms  decode {result['client_decode_ms']:>6.2f} ms  "
+                        f"p50 {result['p50_ms']:>7.2f} ms  @{args.bandwidth:g}Mbit/s {result['transfer_ms']:>8.2f} ms"
+                    )
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+            server_log.close()
+
+    run = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "settings": {"requests": args.requests, "bandwidth_mbit": args.bandwidth, "url": url},
+        "results": results,
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / f"compression-{run['timestamp'].replace(':', '')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(run, indent=2))
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=50, help="requests per endpoint and encoding")
+    parser.add_argument("--bandwidth", type=float, default=100, help="link speed in Mbit/s for the transfer estimate")
+    parser.add_argument("--endpoint", action="append", help="endpoint to measure; repeat for several (default: all)")
+    parser.add_argument("--url", help="measure an API that is already running instead of starting one")
+    parser.add_argument("--pid", type=int, help="process id of the API given by --url, to read its CPU time")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("BENCH_PORT", "8001")))
+    parser.add_argument("--output", help="results file (default: benchmarks/results/compression-<timestamp>.json)")
+    main(parser.parse_args())
@@ -0,0 +1,232 @@
+"""
+Load-test the API at fixed concurrency levels and record the results as JSON.
+
+Unless --url is given, the API is started with uvicorn in a child process so its
+resident memory can be sampled while each endpoint is under load. Every endpoint
+is driven at each concurrency level for --duration seconds by that many clients
+issuing requests back to back over keep-alive connections, and reports p50/p95/p99
+latency, throughput, errors and the server's peak RSS.
+
+Run from ./api against a database seeded with benchmarks.seed:
+
+    python -m benchmarks.load --concurrency 1 10 50 --duration 10
+    python -m benchmarks.load --endpoint "/data/transactions?limit=1000" --concurrency 20
+
+Results are written to benchmarks/results/<timestamp>.json; compare two runs with
+benchmarks.compare.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+import httpx
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+# {period_id} and {category_id} are filled in from the seeded data before the run
+DEFAULT_ENDPOINTS = [
+    "/data/accounts",
+    "/data/categories",
+    "/data/budgets",
+    "/data/transactions?limit=1000",
+    "/data/transactions?limit=1000&order=desc",
+    "/data/transactions?limit=1000&category_id={category_id}&include_subcategories=true",
+    "/categories/tree",
+    "/analytics/summary",
+    "/analytics/net-worth?granularity=month",
+    "/analytics/changes",
+    "/analytics/budget-vs-actual?period_id={period_id}",
+]
+
+
+def percentile(ordered: list, pct: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def read_rss(pid: int) -> int:
+    """
+    Resident set size of a process in bytes, or 0 when it cannot be read.
+    """
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss
+    except ImportError:
+        pass
+    except Exception:
+        return 0
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+async def sample_rss(pid: int, peak: list, interval: float = 0.05) -> None:
+    while True:
+        peak[0] = max(peak[0], read_rss(pid))
+        await asyncio.sleep(interval)
+
+
+async def run_endpoint(client: httpx.AsyncClient, path: str, concurrency: int, duration: float, pid: int) -> dict:
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await client.get(path)
+                await response.aread()
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    peak = [read_rss(pid) if pid else 0]
+    sampler = asyncio.create_task(sample_rss(pid, peak)) if pid else None
+    began = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - began
+    if sampler is not None:
+        sampler.cancel()
+
+    ordered = sorted(latencies)
+    return {
+        "endpoint": path,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+        "peak_rss_mb": round(peak[0] / 2 ** 20, 1) if pid else None,
+    }
+
+
+async def discover(client: httpx.AsyncClient) -> dict:
+    """
+    Ids the parameterised endpoints need, taken from whatever data is loaded.
+    """
+    placeholders = {}
+    for name, path, key in [
+        ("period_id", "/data/budget-periods", "budget_period_id"),
+        ("category_id", "/categories/tree", "category_id"),
+    ]:
+        rows = (await client.get(path)).json()
+        if isinstance(rows, list) and rows:
+            placeholders[name] = rows[0][key]
+    return placeholders
+
+
+async def wait_until_up(client: httpx.AsyncClient, server: subprocess.Popen, timeout: float = 30) -> None:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if server is not None and server.poll() is not None:
+            raise RuntimeError(f"The API exited during startup; see {RESULTS_DIR / 'server.log'}.")
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("The API did not become healthy in time.")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args) -> None:
+    server = None
+    url = args.url
+    if url is None:
+        url = f"http://127.0.0.1:{args.port}"
+        # The API logs every request; keep that out of the report but on disk for debugging
+        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        server_log = open(RESULTS_DIR / "server.log", "w")
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--log-level", "warning"],
+            cwd=Path(__file__).parent.parent,
+            stdout=server_log,
+            stderr=subprocess.STDOUT,
+        )
+    pid = server.pid if server is not None else args.pid
+
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    try:
+        async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+            await wait_until_up(client, server)
+            placeholders = await discover(client)
+            summary = (await client.get("/analytics/summary")).json()
+
+            results = []
+            for template in args.endpoint or DEFAULT_ENDPOINTS:
+                try:
+                    path = template.format_map(placeholders)
+                except KeyError as e:
+                    print(f"Skipping {template}: no {e.args[0]} in the seeded data.")
+                    continue
+                for concurrency in args.concurrency:
+                    # Warm the pool, statement caches and response cache before measuring
+                    await run_endpoint(client, path, concurrency, args.warmup, pid)
+                    result = await run_endpoint(client, path, concurrency, args.duration, pid)
+                    result["endpoint"] = template
+                    results.append(result)
+                    print(
+                        f"{template[:60]:<60} c={concurrency:<4} {result['throughput_rps']:>9.1f} req/s  "
+                        f"p50 {result['p50_ms']:>8.2f}  p95 {result['p95_ms']:>8.2f}  p99 {result['p99_ms']:>8.2f} ms  "
+                        f"errors {result['errors']}  rss {result['peak_rss_mb']} MB"
+                    )
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+            server_log.close()
+
+    run = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "dataset": {"transactions": summary.get("transaction_count"), "accounts": summary.get("account_count")},
+        "settings": {"duration": args.duration, "warmup": args.warmup, "concurrency": args.concurrency, "url": url},
+        "results": results,
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{run['timestamp'].replace(':', '')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(run, indent=2))
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--duration", type=float, default=10, help="seconds per endpoint and concurrency level")
+    parser.add_argument("--warmup", type=float, default=2, help="unmeasured seconds before each measurement")
+    parser.add_argument("--endpoint", action="append", help="endpoint to drive; repeat for several (default: all)")
+    parser.add_argument("--url", help="benchmark an API that is already running instead of starting one")
+    parser.add_argument("--pid", type=int, help="process id of the API given by --url, to sample its memory")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("BENCH_PORT", "8001")))
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<timestamp>.json)")
+    asyncio.run(main(parser.parse_args()))
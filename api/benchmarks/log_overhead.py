@@ -0,0 +1,182 @@
+"""
+Measure what logging costs requests on the event loop.
+
+Simulated requests log the way the routers do (an INFO record before and after an
+await) and are run back to back by --concurrency tasks for --duration seconds under
+each logging pipeline:
+
+    none      logging below WARNING disabled, the floor everything else is measured against
+    stream    a StreamHandler writing on the event loop (the set-up before app.logger_utility)
+    queue     app.logger_utility's queue handler, with JSON formatted by the listener thread
+    sampled   queue, keeping 10% of the INFO records as LOG_SAMPLING would
+
+and against two outputs: /dev/null, and a congested stream whose every write blocks
+for --write-delay ms, like stderr when a container's log collector falls behind.
+
+Run from ./api (no database needed):
+
+    python -m benchmarks.log_overhead --concurrency 1 50 --duration 5
+
+Results are written to benchmarks/results/log-overhead-<timestamp>.json in the
+same shape as benchmarks.load, so two runs can be compared with benchmarks.compare.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from app.logger_utility import (
+    TEXT_FORMAT,
+    BatchQueueListener,
+    BatchStreamHandler,
+    ContextQueueHandler,
+    JsonFormatter,
+    SamplingFilter,
+)
+from benchmarks.load import RESULTS_DIR, git_commit, percentile
+
+PIPELINES = ["none", "stream", "queue", "sampled"]
+LOGGER = "bench"
+
+
+class CongestedStream:
+    """
+    A text stream whose writes block, as a pipe does when its reader falls behind.
+    """
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+
+    def write(self, text: str) -> int:
+        time.sleep(self.delay)
+        return len(text)
+
+    def flush(self) -> None:
+        pass
+
+
+def set_up(pipeline: str, output) -> tuple:
+    """
+    Point the benchmark logger at one pipeline.
+
+    :return: (the logger, a function that detaches the pipeline, waits for its
+        queue to drain and returns the records dropped on the way)
+    """
+    logger = logging.getLogger(LOGGER)
+    logger.handlers.clear()
+    logger.propagate = False
+    logger.setLevel(logging.WARNING if pipeline == "none" else logging.INFO)
+
+    if pipeline in ("none", "stream"):
+        handler = logging.StreamHandler(output)
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+        logger.addHandler(handler)
+        return logger, lambda: 0
+
+    handler = ContextQueueHandler()
+    if pipeline == "sampled":
+        handler.addFilter(SamplingFilter({LOGGER: 0.1}))
+    writer = BatchStreamHandler(output)
+    writer.setFormatter(JsonFormatter())
+    listener = BatchQueueListener(handler.queue, writer)
+    listener.start()
+    logger.addHandler(handler)
+
+    def tear_down() -> int:
+        logger.removeHandler(handler)
+        listener.stop()
+        return handler.dropped
+
+    return logger, tear_down
+
+
+async def run(logger: logging.Logger, concurrency: int, duration: float) -> tuple:
+    """
+    :return: (per-request latencies in seconds, requests completed, seconds taken)
+    """
+    latencies = []
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        n = 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            logger.info("Fetching a page of transactions from the database.")
+            await asyncio.sleep(0)
+            n += 1
+            logger.info(f"Found {n} transactions.")
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, len(latencies), time.perf_counter() - started
+
+
+def measure(pipeline: str, output_name: str, output, concurrency: int, duration: float) -> dict:
+    logger, tear_down = set_up(pipeline, output)
+    latencies, requests, elapsed = asyncio.run(run(logger, concurrency, duration))
+    drain_started = time.perf_counter()
+    dropped = tear_down()
+    drain_seconds = time.perf_counter() - drain_started
+    ordered = sorted(latencies)
+    return {
+        "endpoint": f"logging: {pipeline} -> {output_name}",
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": 0,
+        "throughput_rps": round(requests / elapsed, 1),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 4),
+        "p50_ms": round(percentile(ordered, 50) * 1000, 4),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 4),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 4),
+        "peak_rss_mb": None,
+        "dropped_records": dropped,
+        "drain_seconds": round(drain_seconds, 3),
+    }
+
+
+def main(args) -> None:
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    results = []
+    with open(os.devnull, "w") as devnull:
+        outputs = {"/dev/null": devnull, "congested": CongestedStream(args.write_delay / 1000)}
+        for output_name, output in outputs.items():
+            for concurrency in args.concurrency:
+                floor = None
+                for pipeline in args.pipelines:
+                    result = measure(pipeline, output_name, output, concurrency, args.duration)
+                    results.append(result)
+                    # What logging adds to each request on the event loop, over the floor
+                    per_request = 1e6 / result["throughput_rps"]
+                    floor = per_request if pipeline == "none" else floor
+                    added = f"+{per_request - floor:7.1f} us/request" if floor is not None and pipeline != "none" else " " * 18
+                    print(
+                        f"{result['endpoint']:<34} c={concurrency:<4} {result['throughput_rps']:>11,.0f} req/s  {added}  "
+                        f"p99 {result['p99_ms']:>8.3f} ms  dropped {result['dropped_records']:>7}  "
+                        f"drain {result['drain_seconds']:.2f}s"
+                    )
+
+    run = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "settings": {"duration": args.duration, "write_delay_ms": args.write_delay},
+        "results": results,
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / f"log-overhead-{run['timestamp'].replace(':', '')}.json"
+    output.write_text(json.dumps(run, indent=2))
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 50])
+    parser.add_argument("--duration", type=float, default=3, help="seconds per pipeline, output and concurrency")
+    parser.add_argument("--write-delay", type=float, default=0.2, help="ms each write to the congested output blocks")
+    parser.add_argument("--pipelines", nargs="+", choices=PIPELINES, default=PIPELINES)
+    parser.add_argument("--output", help="results file (default: benchmarks/results/log-overhead-<timestamp>.json)")
+    main(parser.parse_args())
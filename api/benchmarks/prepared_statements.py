@@ -0,0 +1,67 @@
+"""
+Micro-benchmark: per-request prepare + fetch (the old postgres() path) against a
+registered query, which asyncpg's statement cache prepares on its first run only.
+
+The statement cache size must be above zero (POSTGRES_STATEMENT_CACHE_SIZE) for the
+registry to help.
+
+Run from ./api against a database created from db/init.sql:
+
+    python -m benchmarks.prepared_statements --iterations 2000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import asyncpg
+from app.database.configuration import PostgresDatabaseConfiguration
+from app.database.postgres.queries import fetch_registered, register_query
+
+QUERY = "SELECT * FROM categories"
+ALL_CATEGORIES = register_query("categories.all", QUERY)
+
+
+async def prepare_per_call(con):
+    statement = await con.prepare(QUERY)
+    await statement.fetch()
+    statement.get_attributes()
+
+
+async def registered(con):
+    await fetch_registered(ALL_CATEGORIES, con)
+
+
+async def measure(fn, con, iterations: int) -> list:
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await fn(con)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(name: str, timings: list) -> None:
+    timings = sorted(timings)
+    p50 = timings[len(timings) // 2] * 1000
+    p99 = timings[int(len(timings) * 0.99)] * 1000
+    print(f"{name:<20} mean {statistics.mean(timings) * 1000:.3f} ms  p50 {p50:.3f} ms  p99 {p99:.3f} ms")
+
+
+async def main(iterations: int) -> None:
+    con = await asyncpg.connect(
+        **PostgresDatabaseConfiguration().get_config(),
+        statement_cache_size=PostgresDatabaseConfiguration().statement_cache_size,
+    )
+    try:
+        for name, fn in [("prepare per call", prepare_per_call), ("registered", registered)]:
+            await measure(fn, con, iterations // 10)  # warm up
+            report(name, await measure(fn, con, iterations))
+    finally:
+        await con.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(main(args.iterations))
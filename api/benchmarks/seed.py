@@ -0,0 +1,188 @@
+"""
+Seed a database created from db/init.sql with a synthetic ledger for benchmarking.
+
+Accounts, a two-level category hierarchy, monthly budget periods and budgets are
+inserted first; transactions are then generated in chunks and written with COPY,
+so the rollup triggers see the same statement-level inserts as bulk ingestion.
+The generator is seeded, so two runs with the same arguments produce the same ledger.
+
+Run from ./api against a local Postgres (POSTGRES_* settings as for the API):
+
+    python -m benchmarks.seed --transactions 10k --reset
+    python -m benchmarks.seed --transactions 1m --accounts 200 --categories 80 --reset
+
+--reset truncates accounts, categories and budget periods (and everything that
+references them) first. Never point it at a database whose data you want to keep.
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+import asyncpg
+from app.database.configuration import PostgresDatabaseConfiguration
+
+CHUNK_SIZE = 50_000
+
+ACCOUNT_TYPES = ["checking", "savings", "credit_card", "cash", "investment", "loan", "other"]
+# (transaction_type, weight, low, high) for generated amounts
+TRANSACTION_MIX = [
+    ("expense", 80, 1, 250),
+    ("income", 10, 500, 5000),
+    ("transfer_out", 5, 50, 1000),
+    ("transfer_in", 5, 50, 1000),
+]
+MERCHANTS = [
+    "Corner Grocer", "City Power Co", "Metro Transit", "Fuel Stop", "Streamline Video",
+    "Pharmacy Plus", "Book Nook", "Cafe Uno", "Hardware Depot", "Online Market",
+]
+
+TRANSACTION_COLUMNS = [
+    "account_id",
+    "transaction_date",
+    "description",
+    "amount",
+    "transaction_type",
+    "category_id",
+    "merchant_name",
+    "is_recurring",
+]
+
+
+def parse_count(value: str) -> int:
+    """
+    Parse a row count such as 10000, 10k, 1m or 10M.
+    """
+    multipliers = {"k": 1_000, "m": 1_000_000}
+    suffix = value[-1].lower()
+    if suffix in multipliers:
+        return int(float(value[:-1]) * multipliers[suffix])
+    return int(value)
+
+
+async def seed_reference_data(con, rng: random.Random, accounts: int, categories: int, start: date, end: date):
+    """
+    Insert accounts, categories, budget periods and budgets.
+
+    :return: (account ids, category ids)
+    """
+    account_ids = [
+        r["account_id"] for r in await con.fetch(
+            """
+            INSERT INTO accounts (account_name, account_type)
+            SELECT 'Bench Account ' || i, ($2::text[])[1 + i % array_length($2::text[], 1)]::account_type
+            FROM generate_series(1, $1) AS i
+            RETURNING account_id
+            """,
+            accounts, ACCOUNT_TYPES,
+        )
+    ]
+
+    # A quarter of the categories are roots; the rest hang off a random root
+    roots = max(1, categories // 4)
+    root_ids = [
+        r["category_id"] for r in await con.fetch(
+            "INSERT INTO categories (category_name) SELECT 'Bench Category ' || i FROM generate_series(1, $1) AS i "
+            "RETURNING category_id",
+            roots,
+        )
+    ]
+    parents = [rng.choice(root_ids) for _ in range(categories - roots)]
+    child_ids = [
+        r["category_id"] for r in await con.fetch(
+            """
+            INSERT INTO categories (category_name, parent_category_id)
+            SELECT 'Bench Category ' || ($1 + n), parent
+            FROM unnest($2::uuid[]) WITH ORDINALITY AS p(parent, n)
+            RETURNING category_id
+            """,
+            roots, parents,
+        )
+    ]
+
+    await con.execute(
+        """
+        INSERT INTO budget_periods (period_name, start_date, end_date)
+        SELECT 'Bench ' || to_char(m, 'YYYY-MM'), m::date, (m + interval '1 month' - interval '1 day')::date
+        FROM generate_series(date_trunc('month', $1::date), $2::date, interval '1 month') AS m
+        """,
+        start, end,
+    )
+    await con.execute(
+        """
+        INSERT INTO budgets (budget_period_id, category_id, allocated_amount)
+        SELECT p.budget_period_id, c, (100 + floor(random() * 900))::numeric
+        FROM budget_periods p, unnest($1::uuid[]) AS c
+        WHERE p.period_name LIKE 'Bench %'
+        """,
+        root_ids,
+    )
+    return account_ids, root_ids + child_ids
+
+
+def generate_transactions(rng: random.Random, count: int, account_ids: list, category_ids: list, start: date, days: int):
+    kinds = [kind for kind, *_ in TRANSACTION_MIX]
+    weights = [weight for _, weight, *_ in TRANSACTION_MIX]
+    ranges = {kind: (low, high) for kind, _, low, high in TRANSACTION_MIX}
+    for _ in range(count):
+        kind = rng.choices(kinds, weights)[0]
+        low, high = ranges[kind]
+        merchant = rng.choice(MERCHANTS)
+        yield (
+            rng.choice(account_ids),
+            start + timedelta(days=rng.randrange(days)),
+            f"{merchant} {kind.replace('_', ' ')}",
+            Decimal(f"{rng.uniform(low, high):.2f}"),
+            kind,
+            rng.choice(category_ids) if kind == "expense" else None,
+            merchant,
+            rng.random() < 0.05,
+        )
+
+
+async def main(args) -> None:
+    rng = random.Random(args.seed)
+    count = parse_count(args.transactions)
+    end = date.today()
+    start = end - timedelta(days=args.days - 1)
+
+    con = await asyncpg.connect(**PostgresDatabaseConfiguration().get_config())
+    try:
+        if args.reset:
+            print("Truncating accounts, categories and budget periods.")
+            await con.execute("TRUNCATE accounts, categories, budget_periods CASCADE")
+
+        began = time.perf_counter()
+        async with con.transaction():
+            account_ids, category_ids = await seed_reference_data(con, rng, args.accounts, args.categories, start, end)
+        print(f"Seeded {len(account_ids)} accounts and {len(category_ids)} categories.")
+
+        # Partitions for the whole history up front, rather than leaving it to the default partition
+        created = await con.fetchval("SELECT create_transaction_partitions($1, $2)", start, end)
+        print(f"Created {created} monthly transaction partitions.")
+
+        rows = generate_transactions(rng, count, account_ids, category_ids, start, args.days)
+        written = 0
+        while written < count:
+            chunk = [next(rows) for _ in range(min(CHUNK_SIZE, count - written))]
+            await con.copy_records_to_table("transactions", records=chunk, columns=TRANSACTION_COLUMNS)
+            written += len(chunk)
+            print(f"  {written:,} / {count:,} transactions", end="\r", flush=True)
+
+        await con.execute("ANALYZE")
+        elapsed = time.perf_counter() - began
+        print(f"\nSeeded {count:,} transactions in {elapsed:.1f}s ({count / elapsed:,.0f} rows/s).")
+    finally:
+        await con.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transactions", default="10k", help="number of transactions, e.g. 10k, 1m, 10m")
+    parser.add_argument("--accounts", type=int, default=50)
+    parser.add_argument("--categories", type=int, default=40)
+    parser.add_argument("--days", type=int, default=730, help="days of history ending today")
+    parser.add_argument("--seed", type=int, default=42, help="random seed for a reproducible ledger")
+    parser.add_argument("--reset", action="store_true", help="truncate existing data before seeding")
+    asyncio.run(main(parser.parse_args()))
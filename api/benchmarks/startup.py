@@ -0,0 +1,125 @@
+"""
+Measure how long a fresh API worker takes to start.
+
+Each run times two things in new processes: importing the application module
+(`import main`, which is what every uvicorn worker pays before serving anything)
+and the wall time from spawning uvicorn to its first successful /health, which
+adds interpreter start-up, the lifespan (pool, caches, in-memory indexes) and
+binding the socket. The worker's RSS once healthy is recorded too.
+
+Run from ./api with the database the API normally uses:
+
+    python -m benchmarks.startup --runs 10
+
+Results are written to benchmarks/results/startup-<timestamp>.json in the same
+shape as benchmarks.load, so two runs can be compared with benchmarks.compare.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+import httpx
+from benchmarks.load import RESULTS_DIR, git_commit, percentile, read_rss
+
+API_DIR = Path(__file__).parent.parent
+IMPORT_PROBE = "import time; started = time.perf_counter(); import main; print(time.perf_counter() - started)"
+
+
+def time_import() -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE], cwd=API_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def time_to_healthy(port: int, timeout: float, log) -> tuple:
+    """
+    Spawn a uvicorn worker and poll /health until it answers.
+
+    :return: (seconds from spawn to the first 200, worker RSS in bytes at that point)
+    """
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=API_DIR,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=1) as client:
+            while time.perf_counter() - started < timeout:
+                if server.poll() is not None:
+                    raise RuntimeError(f"The API exited during startup; see {RESULTS_DIR / 'server.log'}.")
+                try:
+                    if client.get("/health").status_code == 200:
+                        return time.perf_counter() - started, read_rss(server.pid)
+                except httpx.HTTPError:
+                    pass
+                time.sleep(0.005)
+        raise RuntimeError("The API did not become healthy in time.")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def summarise(name: str, samples: list, rss: list = None) -> dict:
+    ordered = sorted(samples)
+    return {
+        "endpoint": name,
+        "concurrency": 1,
+        "requests": len(ordered),
+        "errors": 0,
+        "mean_ms": round(statistics.mean(ordered) * 1000, 3),
+        "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+        "peak_rss_mb": round(max(rss) / 2 ** 20, 1) if rss else None,
+    }
+
+
+def main(args) -> None:
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    imports, healthy, rss = [], [], []
+    with open(RESULTS_DIR / "server.log", "w") as log:
+        for run in range(1, args.runs + 1):
+            imports.append(time_import())
+            seconds, resident = time_to_healthy(args.port, args.timeout, log)
+            healthy.append(seconds)
+            rss.append(resident)
+            print(f"run {run:>3}: import {imports[-1] * 1000:8.1f} ms   first /health {seconds * 1000:8.1f} ms")
+
+    results = [
+        summarise("startup: import main", imports),
+        summarise("startup: spawn to first /health", healthy, rss),
+    ]
+    for result in results:
+        print(
+            f"{result['endpoint']:<36} p50 {result['p50_ms']:>8.1f}  p95 {result['p95_ms']:>8.1f}  "
+            f"max {result['p99_ms']:>8.1f} ms"
+        )
+
+    run = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "settings": {"runs": args.runs},
+        "results": results,
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / f"startup-{run['timestamp'].replace(':', '')}.json"
+    output.write_text(json.dumps(run, indent=2))
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=int(os.environ.get("BENCH_PORT", "8001")))
+    parser.add_argument("--timeout", type=float, default=60, help="seconds to wait for each worker to become healthy")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/startup-<timestamp>.json)")
+    main(parser.parse_args())
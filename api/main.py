@@ -1,10 +1,30 @@
-from fastapi import FastAPI
+import time
+IMPORT_STARTED = time.perf_counter()
+
+import asyncio
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from app.database.postgres.connections import get_postgres_pool
-from contextlib import asynccontextmanager
+from fastapi.responses import JSONResponse
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+from app.database.postgres.connections import get_postgres_pool, get_postgres_read_pool
+from app.database.postgres.pool import PoolAcquireTimeoutError
+from app.database.postgres.listener import ChangeListener
+from app.cache import create_response_cache, close_response_cache
+from app.events import EventBroker, close_on_exit_signal
+from app.category_tree import CategoryTree, refresh_category_tree
+from app.categoriser import Categoriser, refresh_categoriser
+from app.fx import FxRates, refresh_fx_rates
+from app.recurring import run_recurring_detection
+from app.partitions import run_partition_maintenance
+from app.cred_manager import get_key
+from contextlib import asynccontextmanager, suppress
 from app.routers.categories import router as categories_router
 from app.routers.data import router as data_router
-from app.middlewares import timer
+from app.routers.analytics import router as analytics_router
+from app.routers.events import router as events_router
+from app.middlewares import RequestIdMiddleware, metrics
+from app.compression import CompressionMiddleware
+from app.metrics import STARTUP_TIME, register_pool_collector
 from app.logger_utility import get_my_logger
 
 logger = get_my_logger("API", [])
@@ -13,15 +33,77 @@ logger = get_my_logger("API", [])
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Application is starting up")
+    lifespan_started = time.perf_counter()
 
     logger.info("Getting Postgres Database Connection.")
     pg_pool = await get_postgres_pool()
     app.state.pg_pool = pg_pool
+    app.state.pool_collector = register_pool_collector(pg_pool)
+
+    logger.info("Connecting to the Postgres read replicas.")
+    app.state.pg_read_pool = await get_postgres_read_pool(pg_pool)
+    app.state.replica_task = asyncio.create_task(app.state.pg_read_pool.run())
+
+    logger.info("Setting up the response cache.")
+    await create_response_cache(app)
+
+    logger.info("Loading the category tree.")
+    app.state.category_tree = await CategoryTree.load(pg_pool)
+
+    logger.info("Compiling the categorisation rules.")
+    app.state.categoriser = await Categoriser.load(pg_pool)
+
+    logger.info("Loading the currencies in use and with exchange rates.")
+    app.state.fx_rates = await FxRates.load(pg_pool)
+
+    logger.info("Starting the Postgres change listener.")
+    app.state.change_listener = ChangeListener()
+    # First, so reads stop going to replicas before anything else reacts to the change
+    app.state.change_listener.subscribe(app.state.pg_read_pool.on_change)
+    app.state.change_listener.subscribe(lambda change: app.state.response_cache.invalidate(change["table"]))
+    app.state.change_listener.subscribe(lambda change: refresh_category_tree(app, change))
+    app.state.change_listener.subscribe(lambda change: refresh_categoriser(app, change))
+    app.state.change_listener.subscribe(lambda change: refresh_fx_rates(app, change))
+    app.state.event_broker = EventBroker()
+    app.state.change_listener.subscribe(app.state.event_broker.publish)
+    close_on_exit_signal(app.state.event_broker)
+    await app.state.change_listener.start()
+
+    # Seconds between incremental recurring detection runs, e.g. RECURRING_DETECTION_INTERVAL=3600
+    interval = float(get_key("recurring", "detection_interval", "3600"))
+    logger.info(f"Scheduling recurring detection every {interval:g} seconds.")
+    app.state.recurring_task = asyncio.create_task(run_recurring_detection(pg_pool, interval))
+
+    # Seconds between checks that the coming months have transaction partitions, e.g. PARTITION_MAINTENANCE_INTERVAL=86400
+    interval = float(get_key("partition", "maintenance_interval", "86400"))
+    logger.info(f"Scheduling transaction partition maintenance every {interval:g} seconds.")
+    app.state.partition_task = asyncio.create_task(run_partition_maintenance(pg_pool, interval))
+
+    lifespan_seconds = time.perf_counter() - lifespan_started
+    STARTUP_TIME.labels("lifespan").set(lifespan_seconds)
+    logger.info(f"Application started: imports took {IMPORT_SECONDS:.3f}s, the lifespan {lifespan_seconds:.3f}s.")
 
     yield
 
     logger.info("Application is shutting down")
 
+    app.state.recurring_task.cancel()
+    with suppress(asyncio.CancelledError):
+        await app.state.recurring_task
+
+    app.state.partition_task.cancel()
+    with suppress(asyncio.CancelledError):
+        await app.state.partition_task
+
+    await app.state.change_listener.close()
+    app.state.event_broker.close()
+    await close_response_cache(app)
+
+    app.state.replica_task.cancel()
+    with suppress(asyncio.CancelledError):
+        await app.state.replica_task
+    await app.state.pg_read_pool.close()
+    REGISTRY.unregister(app.state.pool_collector)
     await app.state.pg_pool.close()
     logger.info("Postgres Database connection pool closed.")
 
@@ -46,7 +128,18 @@ app.add_middleware(
     allow_headers=["*"],  # Which headers are allowed, "*" allows all headers
 )
 
-app.middleware("https")(timer)
+# Inside metrics, so compressing a body counts towards the request's latency
+app.add_middleware(CompressionMiddleware)
+app.middleware("http")(metrics)
+# Outermost, so everything logged for a request carries its ID
+app.add_middleware(RequestIdMiddleware)
+
+
+@app.exception_handler(PoolAcquireTimeoutError)
+async def pool_acquire_timeout_handler(request: Request, exc: PoolAcquireTimeoutError):
+    logger.warning(f"Postgres pool exhausted: {exc}")
+    return JSONResponse(status_code=503, content={"message": str(exc)}, headers={"Retry-After": "1"})
+
 
 app.include_router(
     router=data_router,
@@ -58,6 +151,21 @@ app.include_router(
     prefix="/categories",
     tags=["Categories"],
 )
+app.include_router(
+    router=analytics_router,
+    prefix="/analytics",
+    tags=["Analytics"],
+)
+app.include_router(
+    router=events_router,
+    prefix="/events",
+    tags=["Events"],
+)
+
+# Everything above, from the first import on, is paid by every new worker
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
+STARTUP_TIME.labels("import").set(IMPORT_SECONDS)
+
 
 @app.get("/")
 async def root():
@@ -67,6 +175,18 @@ async def root():
 async def health_check():
     return {"status": "ok", "message": "API is running smoothly."}
 
+@app.get("/health/pool")
+async def pool_stats(request: Request):
+    return request.app.state.pg_pool.stats()
+
+@app.get("/health/replicas")
+async def replica_stats(request: Request):
+    return request.app.state.pg_read_pool.stats()
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/version")
 async def version():
     return {"version": "0.1.0", "description": "Budget Tool API"}
\ No newline at end of file
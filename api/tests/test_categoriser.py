@@ -0,0 +1,140 @@
+import re
+from decimal import Decimal
+from uuid import uuid4
+import pytest
+from app.categoriser import Categoriser, _combinable, _scoped, compile_pattern
+
+ACCOUNT = uuid4()
+
+
+def rule(merchant_pattern=None, description_pattern=None, **conditions) -> dict:
+    """
+    A row as ACTIVE_RULES returns it; the category doubles as the rule's name in assertions.
+    """
+    return {
+        "rule_id": uuid4(),
+        "category_id": uuid4(),
+        "merchant_pattern": merchant_pattern,
+        "description_pattern": description_pattern,
+        "min_amount": conditions.get("min_amount"),
+        "max_amount": conditions.get("max_amount"),
+        "account_id": conditions.get("account_id"),
+        "transaction_type": conditions.get("transaction_type"),
+    }
+
+
+def match(categoriser, merchant_name=None, description="", amount="10", transaction_type="expense"):
+    return categoriser.match(ACCOUNT, Decimal(amount), transaction_type, merchant_name, description)
+
+
+# -- inline flags -----------------------------------------------------------------------------
+
+def test_scoped_turns_leading_flags_into_a_group():
+    assert _scoped("(?i)amazon") == "(?i:amazon)"
+    assert _scoped("(?x) amazon  # shop") == "(?x: amazon  # shop\n)"
+    assert _scoped("amazon(?:prime)?") == "amazon(?:prime)?"
+
+
+def test_leading_case_flag_shares_the_combined_regex():
+    rules = [rule("(?i)amazon"), rule("(?-i:Tesco)"), rule("grocer")]
+    categoriser = Categoriser(rules)
+    assert categoriser._separate_merchant == {}
+    assert match(categoriser, "AMAZON EU") == rules[0]["category_id"]
+    assert match(categoriser, "tesco express") is None
+    assert match(categoriser, "Tesco Express") == rules[1]["category_id"]
+    assert match(categoriser, "Green Grocer") == rules[2]["category_id"]
+
+
+def test_verbose_comment_does_not_swallow_the_rest_of_the_combined_regex():
+    rules = [rule("(?x) prime \\s+ video  # streaming"), rule("netflix")]
+    categoriser = Categoriser(rules)
+    assert match(categoriser, "Prime   Video") == rules[0]["category_id"]
+    assert match(categoriser, "Netflix") == rules[1]["category_id"]
+
+
+# -- character classes ------------------------------------------------------------------------
+
+@pytest.mark.parametrize("pattern, text", [
+    ("x[]a]y", "x]y"),
+    ("x[^]]y", "xzy"),
+    ("[\\1]", "\x01"),
+    ("a\\\\1", "a\\1"),
+    ("\\0", "\x00"),
+])
+def test_classes_and_escapes_that_look_like_backreferences_stay_combined(pattern, text):
+    assert _combinable(re.compile(pattern))
+    categoriser = Categoriser([rule(pattern)])
+    assert categoriser._separate_merchant == {}
+    assert match(categoriser, text) is not None
+
+
+def test_backreference_after_a_class_holding_a_bracket_is_found():
+    assert not _combinable(re.compile("([]a])\\1"))
+    categoriser = Categoriser([rule("([]a])\\1")])
+    assert match(categoriser, "x]]y") is not None
+    assert match(categoriser, "x]ay") is None
+
+
+# -- patterns that refer to their own groups --------------------------------------------------
+
+@pytest.mark.parametrize("pattern, hit, miss", [
+    ("(a)\\1", "xaax", "xabx"),
+    ("(?P<word>ab)(?P=word)", "abab", "abba"),
+    ("(a)?(?(1)b|q)", "ab", "xyz"),
+])
+def test_patterns_with_backreferences_are_searched_on_their_own(pattern, hit, miss):
+    assert not _combinable(re.compile(pattern))
+    rules = [rule(pattern), rule("shop")]
+    categoriser = Categoriser(rules)
+    assert list(categoriser._separate_merchant) == [0]
+    assert match(categoriser, hit) == rules[0]["category_id"]
+    assert match(categoriser, miss) is None
+    assert match(categoriser, "Corner Shop") == rules[1]["category_id"]
+
+
+def test_rules_may_reuse_group_names():
+    rules = [rule("(?P<w>ab)(?P=w)"), rule("(?P<w>cd)(?P=w)")]
+    categoriser = Categoriser(rules)
+    assert match(categoriser, "cdcd") == rules[1]["category_id"]
+
+
+# -- combined matching ------------------------------------------------------------------------
+
+def test_alternation_stays_inside_its_rule():
+    rules = [rule(description_pattern="rent|mortgage"), rule(description_pattern="^salary$")]
+    categoriser = Categoriser(rules)
+    assert match(categoriser, description="Mortgage May") == rules[0]["category_id"]
+    assert match(categoriser, description="Salary") == rules[1]["category_id"]
+    # Unbracketed alternation must not turn "^salary$" into "...|^salary" plus "$"
+    assert match(categoriser, description="Salary bonus") is None
+
+
+def test_merchant_and_description_must_both_match():
+    rules = [rule("cinema", "ticket")]
+    categoriser = Categoriser(rules)
+    assert match(categoriser, "Cinema", "Tickets x2") == rules[0]["category_id"]
+    assert match(categoriser, "Cinema", "Popcorn") is None
+    assert match(categoriser, None, "Tickets") is None
+
+
+def test_first_matching_rule_by_priority_wins():
+    rules = [
+        rule("market", min_amount=Decimal("100")),
+        rule("market", transaction_type="income"),
+        rule(description_pattern="weekly"),
+        rule("market"),
+    ]
+    categoriser = Categoriser(rules)
+    assert match(categoriser, "Farmers Market", "Weekly shop", amount="150") == rules[0]["category_id"]
+    assert match(categoriser, "Farmers Market", "Weekly shop", amount="20") == rules[2]["category_id"]
+    assert match(categoriser, "Farmers Market", "Stall refund", amount="20", transaction_type="income") == rules[1]["category_id"]
+    assert match(categoriser, "Farmers Market", "Veg", amount="20") == rules[3]["category_id"]
+
+
+def test_invalid_patterns_are_rejected_and_skipped():
+    with pytest.raises(re.error):
+        compile_pattern("(unclosed")
+    rules = [rule("(unclosed"), rule("shop")]
+    categoriser = Categoriser(rules)
+    assert len(categoriser) == 1
+    assert match(categoriser, "Shop") == rules[1]["category_id"]
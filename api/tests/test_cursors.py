@@ -0,0 +1,49 @@
+import base64
+from datetime import date
+from uuid import uuid4
+import pytest
+from fastapi import HTTPException
+from app.routers.data import _decode_cursor, _decode_search_cursor, _encode_cursor, _encode_search_cursor
+
+
+def encoded(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+@pytest.mark.parametrize("transaction_date", [date(2025, 5, 1), date(1, 1, 1), date(9999, 12, 31)])
+def test_cursor_round_trip(transaction_date):
+    transaction_id = uuid4()
+    cursor = _encode_cursor(transaction_date, transaction_id)
+    assert _decode_cursor(cursor) == (transaction_date, transaction_id)
+    # Cursors travel in query strings as they are
+    assert set(cursor) <= set("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_=")
+
+
+@pytest.mark.parametrize("score", [0.0, 0.1, 1 / 3, 1e-20, 123456.789])
+def test_search_cursor_round_trip_keeps_the_exact_score(score):
+    transaction_date, transaction_id = date(2025, 5, 1), uuid4()
+    cursor = _encode_search_cursor(score, transaction_date, transaction_id)
+    assert _decode_search_cursor(cursor) == (score, transaction_date, transaction_id)
+
+
+@pytest.mark.parametrize("cursor", [
+    "",
+    "not base64!",
+    "é",
+    encoded(b"\xff\xfe"),
+    encoded(b"2025-05-01"),
+    encoded(f"2025-05-01|{uuid4()}|extra".encode()),
+    encoded(f"2025-13-01|{uuid4()}".encode()),
+    encoded(b"2025-05-01|not-a-uuid"),
+])
+def test_invalid_cursor_is_a_bad_request(cursor):
+    with pytest.raises(HTTPException) as error:
+        _decode_cursor(cursor)
+    assert error.value.status_code == 400
+
+
+def test_plain_cursor_is_not_a_search_cursor():
+    cursor = _encode_cursor(date(2025, 5, 1), uuid4())
+    with pytest.raises(HTTPException) as error:
+        _decode_search_cursor(cursor)
+    assert error.value.status_code == 400
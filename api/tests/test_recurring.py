@@ -0,0 +1,110 @@
+from datetime import date
+import numpy as np
+import pytest
+from app import recurring
+from app.recurring import CADENCES, EPOCH, find_series
+
+
+def classify(*groups) -> list:
+    """
+    Run find_series over groups of (day, amount) pairs laid out as detect_recurring
+    lays out its rows, and return one (cadence name or None, typical, occurrences,
+    first day, last day) per group.
+    """
+    lengths = np.array([len(g) for g in groups], dtype=np.int64)
+    group = np.repeat(np.arange(len(groups)), lengths)
+    day = np.fromiter((d for g in groups for d, _ in g), dtype=np.int64, count=int(lengths.sum()))
+    amount = np.fromiter((a for g in groups for _, a in g), dtype=np.float64, count=len(day))
+    cadence, typical, counts, first_day, last_day = find_series(group, day, amount)
+    return [
+        (CADENCES[c][0] if c >= 0 else None, float(t), int(n), int(f), int(l))
+        for c, t, n, f, l in zip(cadence, typical, counts, first_day, last_day)
+    ]
+
+
+def every(step: int, times: int, amount: float = 10.0, start: int = 20_000) -> list:
+    return [(start + step * i, amount) for i in range(times)]
+
+
+def days(*dates: str) -> list:
+    return [(date.fromisoformat(d) - EPOCH).days for d in dates]
+
+
+def test_weekly_monthly_and_irregular_groups_side_by_side():
+    monthly = days("2025-01-01", "2025-02-01", "2025-03-03", "2025-04-01", "2025-05-01", "2025-06-02")
+    weekly, monthly, irregular = classify(
+        every(7, 6),
+        [(d, 1200.0) for d in monthly],
+        [(20_000, 5.0), (20_003, 5.0), (20_043, 5.0), (20_054, 5.0), (20_144, 5.0)],
+    )
+    assert weekly[:3] == ("weekly", 10.0, 6)
+    assert monthly[:3] == ("monthly", 1200.0, 6)
+    assert irregular[0] is None
+
+
+def test_quarterly_and_annual_cadences():
+    quarterly, annual = classify(every(91, 4, 300.0), every(365, 3, 80.0))
+    assert quarterly[0] == "quarterly"
+    assert annual[0] == "annual"
+
+
+@pytest.mark.parametrize("dates, expected", [
+    # A skipped month puts one gap of five off cadence: 80% still match
+    (("2025-01-01", "2025-02-01", "2025-03-01", "2025-05-01", "2025-06-01", "2025-07-01"), "monthly"),
+    # A payment nine days late puts the gaps either side of it off: only 60% match
+    (("2025-01-01", "2025-02-01", "2025-03-10", "2025-04-01", "2025-05-01", "2025-06-01"), None),
+])
+def test_share_of_gaps_on_cadence(dates, expected):
+    (series,) = classify([(d, 50.0) for d in days(*dates)])
+    assert series[0] == expected
+
+
+def test_too_few_occurrences_are_not_a_series():
+    # Weekly needs four occurrences, monthly three
+    short_weekly, short_monthly = classify(every(7, 3), every(30, 2))
+    assert short_weekly[0] is None
+    assert short_monthly[0] is None
+
+
+def test_single_row_groups_keep_their_own_figures():
+    single, weekly, other_single = classify([(19_000, 42.0)], every(7, 5, start=19_500), [(21_000, 7.5)])
+    assert single == (None, 42.0, 1, 19_000, 19_000)
+    assert weekly == ("weekly", 10.0, 5, 19_500, 19_528)
+    assert other_single == (None, 7.5, 1, 21_000, 21_000)
+
+
+def test_unstable_amounts_are_not_a_series():
+    stable, unstable = classify(
+        [(d, a) for (d, _), a in zip(every(7, 6), [10, 11, 9, 10, 12, 10])],
+        [(d, a) for (d, _), a in zip(every(7, 6), [10, 100, 10, 100, 10, 100])],
+    )
+    assert stable[0] == "weekly"
+    assert unstable[0] is None
+
+
+def test_typical_amount_is_each_groups_own_median():
+    # Groups of different sizes with amounts out of order, so every group's median
+    # sits at a different offset into the amounts sorted group by group
+    odd, even, weekly = classify(
+        [(20_000, 30.0), (20_030, 10.0), (20_061, 20.0)],
+        [(20_000, 7.0), (20_007, 5.0), (20_014, 100.0), (20_021, 6.0)],
+        [(d, a) for (d, _), a in zip(every(7, 5), [12.0, 9.0, 11.0, 10.0, 8.0])],
+    )
+    assert odd[1] == 20.0
+    # The lower middle value for an even count
+    assert even[1] == 6.0
+    assert weekly[1] == 10.0
+    assert (odd[3], odd[4]) == (20_000, 20_061)
+
+
+@pytest.mark.parametrize("gaps, expected", [
+    ([7, 7, 7, 14, 14], "weekly"),
+    ([7, 7, 14, 14, 14], "biweekly"),
+    # An exact tie goes to the cadence listed first
+    ([7, 7, 14, 14], "weekly"),
+])
+def test_cadence_matching_the_most_gaps_wins(monkeypatch, gaps, expected):
+    # With the default share only one cadence can qualify; lower it so two do
+    monkeypatch.setattr(recurring, "MATCH_SHARE", 0.3)
+    (series,) = classify([(20_000 + sum(gaps[:i]), 10.0) for i in range(len(gaps) + 1)])
+    assert series[0] == expected
@@ -11,6 +11,9 @@ SET TIME ZONE 'UTC';
 -- or uuid-ossp for uuid_generate_v4(). gen_random_uuid() is core in PG13+.
 -- CREATE EXTENSION IF NOT EXISTS "pgcrypto"; -- Uncomment if needed
 
+-- Trigram matching for fuzzy transaction search (ships with the standard contrib modules)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
 --------------------------------------------------------------------------------
 -- ENUMERATED TYPES
 --------------------------------------------------------------------------------
@@ -60,8 +63,14 @@ CREATE TABLE IF NOT EXISTS categories (
 ALTER TABLE categories ADD CONSTRAINT chk_category_name_not_empty CHECK (TRIM(category_name) <> '');
 
 
+-- Transactions Table: Range partitioned by month of transaction_date, so date-range queries
+-- only scan the months they cover and old months can be detached and archived whole.
+-- Partitions are named transactions_YYYY_MM and created ahead of time by
+-- maintain_transaction_partitions(); rows for months without one land in transactions_default
+-- until it runs. The primary key has to include the partition key, so on its own it would let
+-- one transaction_id appear on two dates; transaction_ids below keeps ids unique across the ledger.
 CREATE TABLE IF NOT EXISTS transactions (
-    transaction_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    transaction_id UUID NOT NULL DEFAULT gen_random_uuid(),
     account_id UUID NOT NULL REFERENCES accounts(account_id) ON DELETE RESTRICT,
     transaction_date DATE NOT NULL DEFAULT CURRENT_DATE,
     description TEXT NOT NULL,
@@ -72,10 +81,20 @@ CREATE TABLE IF NOT EXISTS transactions (
     notes TEXT,
     is_recurring BOOLEAN NOT NULL DEFAULT FALSE,
     created_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
-);
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (transaction_id, transaction_date)
+) PARTITION BY RANGE (transaction_date);
 ALTER TABLE transactions ADD CONSTRAINT chk_description_not_empty CHECK (TRIM(description) <> '');
 ALTER TABLE transactions ADD CONSTRAINT chk_amount_positive CHECK (amount >= 0);
+CREATE TABLE IF NOT EXISTS transactions_default PARTITION OF transactions DEFAULT;
+
+-- Transaction IDs Table: Every transaction_id in `transactions`, whatever its date, kept by the
+-- statement triggers on `transactions`. Its primary key is the uniqueness the partitioned
+-- table's key cannot give: a second row with an id already in use fails, including when
+-- concurrent writers add it at once. Archiving a month releases its ids; restoring claims them again.
+CREATE TABLE IF NOT EXISTS transaction_ids (
+    transaction_id UUID PRIMARY KEY
+);
 
 -- Budget Periods Table: Defines periods for budgets (e.g., Monthly Jan 2024, Quarterly Q1 2024)
 CREATE TABLE IF NOT EXISTS budget_periods (
@@ -103,6 +122,153 @@ CREATE TABLE IF NOT EXISTS budgets (
     CONSTRAINT chk_allocated_amount_positive CHECK (allocated_amount >= 0)
 );
 
+-- Categorisation Rules Table: Assigns a category to uncategorised transactions.
+-- Every condition that is set must hold; when several rules match, the lowest priority wins.
+-- Patterns are case-insensitive regular expressions searched anywhere in the text.
+CREATE TABLE IF NOT EXISTS categorisation_rules (
+    rule_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    category_id UUID NOT NULL REFERENCES categories(category_id) ON DELETE CASCADE,
+    merchant_pattern TEXT,
+    description_pattern TEXT,
+    min_amount DECIMAL(19, 4),
+    max_amount DECIMAL(19, 4),
+    account_id UUID REFERENCES accounts(account_id) ON DELETE CASCADE,
+    transaction_type transaction_type,
+    priority INTEGER NOT NULL DEFAULT 100,
+    is_active BOOLEAN NOT NULL DEFAULT TRUE,
+    notes TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT chk_rule_has_condition CHECK (
+        merchant_pattern IS NOT NULL OR description_pattern IS NOT NULL
+        OR min_amount IS NOT NULL OR max_amount IS NOT NULL
+        OR account_id IS NOT NULL OR transaction_type IS NOT NULL
+    ),
+    CONSTRAINT chk_rule_amount_range CHECK (min_amount IS NULL OR max_amount IS NULL OR min_amount <= max_amount)
+);
+
+-- Recurring Series Table: Periodic transactions found by the API's recurring detection job.
+-- One row per (account, series key, type), the key being recurring_series_key() of its transactions.
+CREATE TABLE IF NOT EXISTS recurring_series (
+    series_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    account_id UUID NOT NULL REFERENCES accounts(account_id) ON DELETE CASCADE,
+    series_key TEXT NOT NULL,
+    transaction_type transaction_type NOT NULL,
+    cadence VARCHAR(20) NOT NULL,
+    typical_amount DECIMAL(19, 4) NOT NULL,
+    occurrences INTEGER NOT NULL,
+    first_date DATE NOT NULL,
+    last_date DATE NOT NULL,
+    is_active BOOLEAN NOT NULL DEFAULT TRUE,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (account_id, series_key, transaction_type),
+    CONSTRAINT chk_recurring_cadence CHECK (cadence IN ('weekly', 'biweekly', 'monthly', 'quarterly', 'annual'))
+);
+
+-- Recurring Stale Groups Table: (account, series key, type) groups that lost transactions to a
+-- delete, or to an edit of their account, type, merchant or description, since recurring detection
+-- last ran. Rows written since the watermark lead detection to their own groups; these are the
+-- groups they left. Filled by triggers on `transactions`, emptied by each detection run.
+CREATE TABLE IF NOT EXISTS recurring_stale_groups (
+    account_id UUID NOT NULL,
+    series_key TEXT NOT NULL,
+    transaction_type transaction_type NOT NULL
+);
+
+-- FX Rates Table: Daily exchange rates, loaded from local CSV files by the API (python -m app.fx).
+-- `rate` is the value of one unit of `currency` in US dollars, so any pair converts through USD.
+CREATE TABLE IF NOT EXISTS fx_rates (
+    currency CHAR(3) NOT NULL, -- ISO 4217 currency code
+    rate_date DATE NOT NULL,
+    rate NUMERIC(24, 12) NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (currency, rate_date),
+    CONSTRAINT chk_fx_rate_positive CHECK (rate > 0)
+);
+
+-- Job Watermarks Table: How far incremental background jobs have processed
+CREATE TABLE IF NOT EXISTS job_watermarks (
+    job_name VARCHAR(100) PRIMARY KEY,
+    watermark TIMESTAMPTZ NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Account Daily Balances Table: Per-account, per-day net change rolled up from transactions.
+-- Maintained incrementally by the rollup triggers below so balance-over-time queries
+-- scan O(days) rows instead of the whole ledger.
+CREATE TABLE IF NOT EXISTS account_daily_balances (
+    account_id UUID NOT NULL REFERENCES accounts(account_id) ON DELETE CASCADE,
+    balance_date DATE NOT NULL,
+    net_change DECIMAL(19, 4) NOT NULL DEFAULT 0,
+    transaction_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (account_id, balance_date)
+);
+
+--------------------------------------------------------------------------------
+-- FUNCTIONS FOR SEARCH
+--------------------------------------------------------------------------------
+
+-- Weighted document for full-text search: merchant matches rank above description matches.
+-- Indexed as an expression rather than stored in a generated column so `SELECT *` keeps
+-- returning only the ledger columns. Queries must call it exactly as the index does.
+CREATE OR REPLACE FUNCTION transaction_search_vector(description TEXT, merchant_name TEXT)
+RETURNS tsvector AS $$
+  SELECT setweight(to_tsvector('english', COALESCE(merchant_name, '')), 'A')
+      || setweight(to_tsvector('english', description), 'B');
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+--------------------------------------------------------------------------------
+-- FUNCTIONS FOR RECURRING DETECTION
+--------------------------------------------------------------------------------
+
+-- Groups a payee's transactions into one series: lower-cased merchant plus the description
+-- with numbers and month names removed, so "Rent May 2025" and "Rent June 2025" share a key.
+CREATE OR REPLACE FUNCTION recurring_series_key(merchant_name TEXT, description TEXT)
+RETURNS TEXT AS $$
+  SELECT lower(COALESCE(merchant_name, '')) || ' | ' || btrim(regexp_replace(regexp_replace(
+      lower(description),
+      '[0-9]+|\m(jan(uary)?|feb(ruary)?|mar(ch)?|apr(il)?|may|june?|july?|aug(ust)?|sept?(ember)?|oct(ober)?|nov(ember)?|dec(ember)?)\M',
+      ' ', 'g'), '[\s[:punct:]]+', ' ', 'g'));
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+-- Statement-level with transition tables: records the groups that deleted or re-keyed rows
+-- left, so recurring detection re-analyses them (and drops their series once they are empty).
+-- Updates that leave the key alone, such as categorisation, record nothing.
+CREATE OR REPLACE FUNCTION trigger_mark_recurring_groups_stale()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'TRUNCATE' THEN
+    DELETE FROM recurring_series;
+    DELETE FROM recurring_stale_groups;
+  ELSIF TG_OP = 'UPDATE' THEN
+    INSERT INTO recurring_stale_groups (account_id, series_key, transaction_type)
+    SELECT DISTINCT o.account_id, recurring_series_key(o.merchant_name, o.description), o.transaction_type
+    FROM old_rows o
+    JOIN new_rows n ON n.transaction_id = o.transaction_id
+    WHERE (o.account_id, o.transaction_type, o.merchant_name, o.description)
+      IS DISTINCT FROM (n.account_id, n.transaction_type, n.merchant_name, n.description);
+  ELSE
+    INSERT INTO recurring_stale_groups (account_id, series_key, transaction_type)
+    SELECT DISTINCT account_id, recurring_series_key(merchant_name, description), transaction_type
+    FROM old_rows;
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Step between occurrences of a recurring series
+CREATE OR REPLACE FUNCTION cadence_interval(cadence TEXT)
+RETURNS INTERVAL AS $$
+  SELECT CASE cadence
+    WHEN 'weekly' THEN INTERVAL '7 days'
+    WHEN 'biweekly' THEN INTERVAL '14 days'
+    WHEN 'monthly' THEN INTERVAL '1 month'
+    WHEN 'quarterly' THEN INTERVAL '3 months'
+    WHEN 'annual' THEN INTERVAL '1 year'
+  END;
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
 --------------------------------------------------------------------------------
 -- INDEXES
 --------------------------------------------------------------------------------
@@ -110,13 +276,28 @@ CREATE TABLE IF NOT EXISTS budgets (
 CREATE INDEX IF NOT EXISTS idx_accounts_account_type ON accounts(account_type);
 CREATE INDEX IF NOT EXISTS idx_categories_parent_category_id ON categories(parent_category_id);
 CREATE INDEX IF NOT EXISTS idx_transactions_account_id ON transactions(account_id);
-CREATE INDEX IF NOT EXISTS idx_transactions_transaction_date ON transactions(transaction_date);
-CREATE INDEX IF NOT EXISTS idx_transactions_category_id ON transactions(category_id);
+-- Composite (date, id) index backs keyset pagination of the ledger as well as plain date-range filters
+CREATE INDEX IF NOT EXISTS idx_transactions_date_id ON transactions(transaction_date, transaction_id);
+-- Leading category_id still serves plain category filters; the date lets budget-vs-actual range-scan a period
+CREATE INDEX IF NOT EXISTS idx_transactions_category_date ON transactions(category_id, transaction_date);
 CREATE INDEX IF NOT EXISTS idx_transactions_transaction_type ON transactions(transaction_type);
+-- Ranked full-text search, plus trigram indexes for fuzzy and partial-word matches
+CREATE INDEX IF NOT EXISTS idx_transactions_search ON transactions USING GIN (transaction_search_vector(description, merchant_name));
+CREATE INDEX IF NOT EXISTS idx_transactions_description_trgm ON transactions USING GIN (description gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_transactions_merchant_name_trgm ON transactions USING GIN (merchant_name gin_trgm_ops);
 CREATE INDEX IF NOT EXISTS idx_budget_periods_start_date ON budget_periods(start_date);
 CREATE INDEX IF NOT EXISTS idx_budget_periods_end_date ON budget_periods(end_date);
 CREATE INDEX IF NOT EXISTS idx_budgets_budget_period_id ON budgets(budget_period_id);
 CREATE INDEX IF NOT EXISTS idx_budgets_category_id ON budgets(category_id);
+CREATE INDEX IF NOT EXISTS idx_account_daily_balances_balance_date ON account_daily_balances(balance_date);
+-- Recurring detection finds recently written rows, then loads each touched series' history
+CREATE INDEX IF NOT EXISTS idx_transactions_updated_at ON transactions(updated_at);
+-- Recurring detection loads a series' history by account, key and type
+CREATE INDEX IF NOT EXISTS idx_transactions_series_key
+  ON transactions(account_id, recurring_series_key(merchant_name, description), transaction_type);
+CREATE INDEX IF NOT EXISTS idx_recurring_series_account_id ON recurring_series(account_id);
+-- Lets the categoriser walk only the uncategorised part of the ledger
+CREATE INDEX IF NOT EXISTS idx_transactions_uncategorised ON transactions(transaction_id) WHERE category_id IS NULL;
 
 --------------------------------------------------------------------------------
 -- FUNCTIONS FOR UPDATING `updated_at` TIMESTAMPS
@@ -130,6 +311,277 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+--------------------------------------------------------------------------------
+-- FUNCTIONS FOR ANALYTICS
+--------------------------------------------------------------------------------
+
+-- Amounts are stored unsigned; money leaving an account is negative for balance purposes
+CREATE OR REPLACE FUNCTION signed_amount(amount DECIMAL, kind transaction_type)
+RETURNS DECIMAL AS $$
+  SELECT CASE WHEN kind IN ('income', 'transfer_in') THEN amount ELSE -amount END;
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+--------------------------------------------------------------------------------
+-- FUNCTIONS FOR CURRENCY CONVERSION
+--------------------------------------------------------------------------------
+
+-- Value of one unit of a currency in US dollars on a day: the latest rate on or before
+-- that day (an as-of lookup on the primary key), or the earliest rate for days before
+-- the first one. NULL when the currency has no rates at all.
+CREATE OR REPLACE FUNCTION fx_rate(code CHAR(3), on_date DATE)
+RETURNS NUMERIC AS $$
+  SELECT CASE WHEN code = 'USD' THEN 1 ELSE COALESCE(
+    (SELECT rate FROM fx_rates WHERE currency = code AND rate_date <= on_date ORDER BY rate_date DESC LIMIT 1),
+    (SELECT rate FROM fx_rates WHERE currency = code ORDER BY rate_date LIMIT 1)
+  ) END;
+$$ LANGUAGE sql STABLE PARALLEL SAFE;
+
+-- Multiplier taking an amount in one currency to another on a day
+CREATE OR REPLACE FUNCTION fx_convert_rate(from_code CHAR(3), to_code CHAR(3), on_date DATE)
+RETURNS NUMERIC AS $$
+  SELECT CASE WHEN from_code = to_code THEN 1 ELSE fx_rate(from_code, on_date) / fx_rate(to_code, on_date) END;
+$$ LANGUAGE sql STABLE PARALLEL SAFE;
+
+--------------------------------------------------------------------------------
+-- FUNCTIONS FOR CHANGE NOTIFICATIONS
+--------------------------------------------------------------------------------
+
+-- Statement-level, so a bulk write sends one notification rather than one per row.
+-- The API listens on `table_changes` to invalidate its response cache and relays
+-- each change to /events subscribers.
+CREATE OR REPLACE FUNCTION trigger_notify_table_change()
+RETURNS TRIGGER AS $$
+BEGIN
+  PERFORM pg_notify('table_changes', json_build_object('table', TG_TABLE_NAME, 'op', TG_OP)::text);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Statement-level with transition tables: one notification per write to `transactions`
+-- saying how many rows changed, over which dates and, when there are only a few, in which
+-- accounts and which transactions, so listeners can tell what to reload. Payloads stay
+-- well under the 8000 byte NOTIFY limit however large the statement.
+CREATE OR REPLACE FUNCTION trigger_notify_transaction_change()
+RETURNS TRIGGER AS $$
+DECLARE
+  max_ids CONSTANT INT := 20;
+  row_count BIGINT;
+  first_date DATE;
+  last_date DATE;
+  account_ids UUID[];
+  transaction_ids UUID[];
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    SELECT COUNT(*), MIN(transaction_date), MAX(transaction_date) INTO row_count, first_date, last_date FROM new_rows;
+    account_ids := ARRAY(SELECT DISTINCT account_id FROM new_rows LIMIT max_ids + 1);
+    transaction_ids := ARRAY(SELECT transaction_id FROM new_rows LIMIT max_ids + 1);
+  ELSIF TG_OP = 'UPDATE' THEN
+    -- A row moved to another account or day touches both the old and the new one
+    SELECT COUNT(*) INTO row_count FROM new_rows;
+    SELECT MIN(transaction_date), MAX(transaction_date) INTO first_date, last_date
+    FROM (SELECT transaction_date FROM new_rows UNION ALL SELECT transaction_date FROM old_rows) dates;
+    account_ids := ARRAY(
+      SELECT account_id FROM new_rows UNION SELECT account_id FROM old_rows LIMIT max_ids + 1
+    );
+    transaction_ids := ARRAY(SELECT transaction_id FROM new_rows LIMIT max_ids + 1);
+  ELSE
+    SELECT COUNT(*), MIN(transaction_date), MAX(transaction_date) INTO row_count, first_date, last_date FROM old_rows;
+    account_ids := ARRAY(SELECT DISTINCT account_id FROM old_rows LIMIT max_ids + 1);
+    transaction_ids := ARRAY(SELECT transaction_id FROM old_rows LIMIT max_ids + 1);
+  END IF;
+
+  -- Statements that matched nothing (e.g. a re-run of categorisation) change nothing
+  IF row_count = 0 THEN
+    RETURN NULL;
+  END IF;
+
+  PERFORM pg_notify('table_changes', json_build_object(
+    'table', TG_TABLE_NAME,
+    'op', TG_OP,
+    'rows', row_count,
+    'first_date', first_date,
+    'last_date', last_date,
+    -- NULL when there are more than max_ids of them
+    'account_ids', CASE WHEN cardinality(account_ids) <= max_ids THEN account_ids END,
+    'transaction_ids', CASE WHEN cardinality(transaction_ids) <= max_ids THEN transaction_ids END
+  )::text);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+--------------------------------------------------------------------------------
+-- FUNCTIONS FOR MAINTAINING `account_daily_balances`
+--------------------------------------------------------------------------------
+
+-- Statement-level trigger: folds the transition tables into one delta per
+-- (account, day) so a bulk load costs one upsert per touched day, not per row.
+CREATE OR REPLACE FUNCTION trigger_rollup_account_daily_balances()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'TRUNCATE' THEN
+    DELETE FROM account_daily_balances;
+    RETURN NULL;
+  END IF;
+
+  IF TG_OP = 'INSERT' THEN
+    INSERT INTO account_daily_balances AS b (account_id, balance_date, net_change, transaction_count)
+    SELECT account_id, transaction_date, SUM(signed_amount(amount, transaction_type)), COUNT(*)
+    FROM new_rows
+    GROUP BY account_id, transaction_date
+    ON CONFLICT (account_id, balance_date) DO UPDATE
+    SET net_change = b.net_change + EXCLUDED.net_change,
+        transaction_count = b.transaction_count + EXCLUDED.transaction_count;
+    RETURN NULL;
+  END IF;
+
+  IF TG_OP = 'UPDATE' THEN
+    INSERT INTO account_daily_balances AS b (account_id, balance_date, net_change, transaction_count)
+    SELECT account_id, balance_date, SUM(net_change), SUM(transaction_count)
+    FROM (
+      SELECT account_id, transaction_date AS balance_date, signed_amount(amount, transaction_type) AS net_change, 1 AS transaction_count FROM new_rows
+      UNION ALL
+      SELECT account_id, transaction_date, -signed_amount(amount, transaction_type), -1 FROM old_rows
+    ) deltas
+    GROUP BY account_id, balance_date
+    -- Updates that leave amounts, types, accounts and dates alone (e.g. categorisation) net to zero
+    HAVING SUM(net_change) <> 0 OR SUM(transaction_count) <> 0
+    ON CONFLICT (account_id, balance_date) DO UPDATE
+    SET net_change = b.net_change + EXCLUDED.net_change,
+        transaction_count = b.transaction_count + EXCLUDED.transaction_count;
+  ELSE
+    INSERT INTO account_daily_balances AS b (account_id, balance_date, net_change, transaction_count)
+    SELECT account_id, transaction_date, -SUM(signed_amount(amount, transaction_type)), -COUNT(*)
+    FROM old_rows
+    GROUP BY account_id, transaction_date
+    ON CONFLICT (account_id, balance_date) DO UPDATE
+    SET net_change = b.net_change + EXCLUDED.net_change,
+        transaction_count = b.transaction_count + EXCLUDED.transaction_count;
+  END IF;
+
+  -- Days left without any transactions after an update or delete are dropped
+  DELETE FROM account_daily_balances b
+  USING (SELECT DISTINCT account_id, transaction_date FROM old_rows) o
+  WHERE b.account_id = o.account_id
+    AND b.balance_date = o.transaction_date
+    AND b.transaction_count = 0;
+
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Rebuilds the rollup from scratch; only needed to backfill or repair it. It only sees
+-- attached partitions, so restore archived months first or their days drop out of the balances.
+CREATE OR REPLACE FUNCTION refresh_account_daily_balances()
+RETURNS VOID AS $$
+BEGIN
+  DELETE FROM account_daily_balances;
+  INSERT INTO account_daily_balances (account_id, balance_date, net_change, transaction_count)
+  SELECT account_id, transaction_date, SUM(signed_amount(amount, transaction_type)), COUNT(*)
+  FROM transactions
+  GROUP BY account_id, transaction_date;
+END;
+$$ LANGUAGE plpgsql;
+
+--------------------------------------------------------------------------------
+-- FUNCTIONS FOR KEEPING `transaction_id` UNIQUE
+--------------------------------------------------------------------------------
+
+-- Statement-level with transition tables: claims the ids of inserted rows in transaction_ids
+-- and releases those of deleted ones, one statement each however many rows were written.
+CREATE OR REPLACE FUNCTION trigger_track_transaction_ids()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'TRUNCATE' THEN
+    DELETE FROM transaction_ids;
+  ELSIF TG_OP = 'INSERT' THEN
+    INSERT INTO transaction_ids (transaction_id) SELECT transaction_id FROM new_rows;
+  ELSIF TG_OP = 'UPDATE' THEN
+    -- Updates nearly always keep every id, moves to another date included; only when the
+    -- ids changed are the old ones released and the new ones claimed
+    IF EXISTS (SELECT transaction_id FROM old_rows EXCEPT SELECT transaction_id FROM new_rows)
+       OR EXISTS (SELECT transaction_id FROM new_rows EXCEPT SELECT transaction_id FROM old_rows) THEN
+      DELETE FROM transaction_ids WHERE transaction_id IN (SELECT transaction_id FROM old_rows);
+      INSERT INTO transaction_ids (transaction_id) SELECT transaction_id FROM new_rows;
+    END IF;
+  ELSE
+    DELETE FROM transaction_ids WHERE transaction_id IN (SELECT transaction_id FROM old_rows);
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+--------------------------------------------------------------------------------
+-- FUNCTIONS FOR MANAGING `transactions` PARTITIONS
+--------------------------------------------------------------------------------
+
+-- Creates the partition for the calendar month containing `for_month` unless it exists,
+-- moving in any rows for that month that transactions_default caught meanwhile.
+-- The partition is built as a plain table and then attached, which locks the parent
+-- against other DDL only, so reads and writes of the ledger carry on while it runs;
+-- only the default partition is locked throughout, so no row for the month slips in
+-- between the move and the attach. Rows moved out of the default partition do not pass
+-- through the parent's statement triggers, so the rollup, transaction_ids and change
+-- notifications see nothing: nothing changed.
+-- Returns whether a partition was created.
+CREATE OR REPLACE FUNCTION create_transaction_partition(for_month DATE)
+RETURNS BOOLEAN AS $$
+DECLARE
+  first_day DATE := date_trunc('month', for_month)::date;
+  next_first_day DATE := (date_trunc('month', for_month) + INTERVAL '1 month')::date;
+  partition_name TEXT := 'transactions_' || to_char(for_month, 'YYYY_MM');
+  columns TEXT;
+BEGIN
+  IF to_regclass(partition_name) IS NOT NULL THEN
+    RETURN FALSE;
+  END IF;
+
+  -- Generated columns cannot be copied, only recomputed
+  SELECT string_agg(quote_ident(attname), ', ' ORDER BY attnum) INTO columns
+  FROM pg_attribute
+  WHERE attrelid = 'transactions'::regclass AND attnum > 0 AND NOT attisdropped AND attgenerated = '';
+
+  LOCK TABLE transactions_default IN EXCLUSIVE MODE;
+  EXECUTE format('CREATE TABLE %I (LIKE transactions INCLUDING ALL)', partition_name);
+  EXECUTE format(
+    'WITH moved AS (DELETE FROM transactions_default WHERE transaction_date >= %L AND transaction_date < %L RETURNING *) '
+    'INSERT INTO %I (%s) SELECT %s FROM moved',
+    first_day, next_first_day, partition_name, columns, columns
+  );
+  EXECUTE format(
+    'ALTER TABLE transactions ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+    partition_name, first_day, next_first_day
+  );
+  RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Creates the monthly partitions from first_month through last_month that do not exist yet.
+-- Returns how many were created.
+CREATE OR REPLACE FUNCTION create_transaction_partitions(first_month DATE, last_month DATE)
+RETURNS INT AS $$
+  SELECT COUNT(*) FILTER (WHERE create_transaction_partition(m::date))::int
+  FROM generate_series(date_trunc('month', first_month), last_month, INTERVAL '1 month') AS m;
+$$ LANGUAGE sql;
+
+-- Keeps a partition ready for this month and the next `months_ahead`, and gives any month
+-- with rows in transactions_default (e.g. a backfill of older history) a partition of its own.
+-- Serialised with an advisory lock, so every API worker may run it. Returns how many
+-- partitions were created.
+CREATE OR REPLACE FUNCTION maintain_transaction_partitions(months_ahead INT DEFAULT 3)
+RETURNS INT AS $$
+DECLARE
+  created INT;
+BEGIN
+  PERFORM pg_advisory_xact_lock(hashtext('maintain_transaction_partitions'));
+  created := create_transaction_partitions(
+    CURRENT_DATE, (date_trunc('month', CURRENT_DATE) + make_interval(months => months_ahead))::date
+  );
+  SELECT created + COUNT(*) FILTER (WHERE create_transaction_partition(m)) INTO created
+  FROM (SELECT DISTINCT date_trunc('month', transaction_date)::date AS m FROM transactions_default) stray;
+  RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
 --------------------------------------------------------------------------------
 -- TRIGGERS to automatically update `updated_at` columns
 --------------------------------------------------------------------------------
@@ -159,6 +611,152 @@ BEFORE UPDATE ON budgets
 FOR EACH ROW
 EXECUTE FUNCTION trigger_set_timestamp();
 
+CREATE TRIGGER set_timestamp_categorisation_rules
+BEFORE UPDATE ON categorisation_rules
+FOR EACH ROW
+EXECUTE FUNCTION trigger_set_timestamp();
+
+CREATE TRIGGER set_timestamp_recurring_series
+BEFORE UPDATE ON recurring_series
+FOR EACH ROW
+EXECUTE FUNCTION trigger_set_timestamp();
+
+--------------------------------------------------------------------------------
+-- TRIGGERS to keep `account_daily_balances` in step with `transactions`
+--------------------------------------------------------------------------------
+
+CREATE TRIGGER rollup_transactions_insert
+AFTER INSERT ON transactions
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION trigger_rollup_account_daily_balances();
+
+CREATE TRIGGER rollup_transactions_update
+AFTER UPDATE ON transactions
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION trigger_rollup_account_daily_balances();
+
+CREATE TRIGGER rollup_transactions_delete
+AFTER DELETE ON transactions
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION trigger_rollup_account_daily_balances();
+
+CREATE TRIGGER rollup_transactions_truncate
+AFTER TRUNCATE ON transactions
+FOR EACH STATEMENT
+EXECUTE FUNCTION trigger_rollup_account_daily_balances();
+
+--------------------------------------------------------------------------------
+-- TRIGGERS to keep `transaction_ids` in step with `transactions`
+--------------------------------------------------------------------------------
+
+CREATE TRIGGER track_transaction_ids_insert
+AFTER INSERT ON transactions
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION trigger_track_transaction_ids();
+
+CREATE TRIGGER track_transaction_ids_update
+AFTER UPDATE ON transactions
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION trigger_track_transaction_ids();
+
+CREATE TRIGGER track_transaction_ids_delete
+AFTER DELETE ON transactions
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION trigger_track_transaction_ids();
+
+CREATE TRIGGER track_transaction_ids_truncate
+AFTER TRUNCATE ON transactions
+FOR EACH STATEMENT
+EXECUTE FUNCTION trigger_track_transaction_ids();
+
+--------------------------------------------------------------------------------
+-- TRIGGERS to announce writes to the cached reference tables
+--------------------------------------------------------------------------------
+
+CREATE TRIGGER notify_change_accounts
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON accounts
+FOR EACH STATEMENT
+EXECUTE FUNCTION trigger_notify_table_change();
+
+CREATE TRIGGER notify_change_categories
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON categories
+FOR EACH STATEMENT
+EXECUTE FUNCTION trigger_notify_table_change();
+
+CREATE TRIGGER notify_change_budget_periods
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON budget_periods
+FOR EACH STATEMENT
+EXECUTE FUNCTION trigger_notify_table_change();
+
+CREATE TRIGGER notify_change_budgets
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON budgets
+FOR EACH STATEMENT
+EXECUTE FUNCTION trigger_notify_table_change();
+
+CREATE TRIGGER notify_change_categorisation_rules
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON categorisation_rules
+FOR EACH STATEMENT
+EXECUTE FUNCTION trigger_notify_table_change();
+
+CREATE TRIGGER notify_change_fx_rates
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON fx_rates
+FOR EACH STATEMENT
+EXECUTE FUNCTION trigger_notify_table_change();
+
+--------------------------------------------------------------------------------
+-- TRIGGERS to announce writes to `transactions` with a summary of what changed
+--------------------------------------------------------------------------------
+
+CREATE TRIGGER notify_change_transactions_insert
+AFTER INSERT ON transactions
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION trigger_notify_transaction_change();
+
+CREATE TRIGGER notify_change_transactions_update
+AFTER UPDATE ON transactions
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION trigger_notify_transaction_change();
+
+CREATE TRIGGER notify_change_transactions_delete
+AFTER DELETE ON transactions
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION trigger_notify_transaction_change();
+
+CREATE TRIGGER notify_change_transactions_truncate
+AFTER TRUNCATE ON transactions
+FOR EACH STATEMENT
+EXECUTE FUNCTION trigger_notify_table_change();
+
+--------------------------------------------------------------------------------
+-- TRIGGERS to point recurring detection at the groups rows leave
+--------------------------------------------------------------------------------
+
+CREATE TRIGGER mark_recurring_stale_transactions_update
+AFTER UPDATE ON transactions
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION trigger_mark_recurring_groups_stale();
+
+CREATE TRIGGER mark_recurring_stale_transactions_delete
+AFTER DELETE ON transactions
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION trigger_mark_recurring_groups_stale();
+
+CREATE TRIGGER mark_recurring_stale_transactions_truncate
+AFTER TRUNCATE ON transactions
+FOR EACH STATEMENT
+EXECUTE FUNCTION trigger_mark_recurring_groups_stale();
+
 --------------------------------------------------------------------------------
 -- Initial Data
 --------------------------------------------------------------------------------
@@ -230,6 +828,23 @@ INSERT INTO budgets (budget_period_id, category_id, allocated_amount)
 SELECT (SELECT budget_period_id FROM budget_periods WHERE period_name = 'May 2025'), (SELECT category_id FROM categories WHERE category_name = 'Loan Interest'), 50.00;
 
 
+-- Categorisation rules applied to transactions that arrive without a category
+INSERT INTO categorisation_rules (category_id, merchant_pattern, description_pattern, transaction_type, priority)
+SELECT c.category_id, r.merchant_pattern, r.description_pattern, r.transaction_type::transaction_type, r.priority
+FROM (VALUES
+    ('Groceries', 'supermart|grocer|market', NULL, 'expense', 100),
+    ('Gasoline', 'gas stop|fuel|petrol', NULL, 'expense', 100),
+    ('Healthcare', 'pharmacy|clinic|dental', NULL, 'expense', 100),
+    ('Movies', 'cinema|theat(re|er)', 'movie', 'expense', 100),
+    ('Salary', NULL, 'salary|payroll', 'income', 50),
+    ('Rent', NULL, '\brent\b', 'expense', 50)
+) AS r(category_name, merchant_pattern, description_pattern, transaction_type, priority)
+JOIN categories c ON c.category_name = r.category_name;
+
+-- Monthly partitions from the sample data through the next few months
+SELECT create_transaction_partitions(DATE '2025-05-01', CURRENT_DATE);
+SELECT maintain_transaction_partitions(3);
+
 -- Transactions (for May 2025)
 DO $$
 DECLARE
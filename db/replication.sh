@@ -0,0 +1,3 @@
+#!/bin/sh
+# Let standbys (the db-replica service) stream WAL from this server
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
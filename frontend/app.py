@@ -1,9 +1,7 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
 import plotly.graph_objects as go
 
-from tools.api import get_accounts, get_transactions, get_budgets, get_categories
+from tools.api import get_accounts, get_budget_vs_actual, get_change_feed, get_dashboard_data
 
 
 # ---- Page configuration ----
@@ -15,50 +13,98 @@ st.set_page_config(
 st.title("Budget Tool")
 st.caption("A tool to help you manage your budget effectively.")
 
+# ---- Live updates ----
+# The API pushes table changes to a feed shared by every session, which expires the
+# affected cached responses. Each session only checks the feed's version, which costs
+# no API request, and reruns when it moved; the rerun refetches just what was expired.
+feed = get_change_feed()
+st.session_state["rendered_version"] = feed.version
+
+
+@st.fragment(run_every=2)
+def watch_for_changes():
+    if feed.version != st.session_state["rendered_version"]:
+        st.rerun()
+    st.caption("Live updates on" if feed.connected else "Live updates reconnecting…")
+
+
+with st.sidebar:
+    watch_for_changes()
+
+# ---- Report currency ----
+# Accounts may be held in different currencies; the API converts every aggregate
+# into the chosen one, or into its base currency by default.
+account_currencies = sorted(get_accounts()['currency'].dropna().unique())
+currency = st.sidebar.selectbox("Report currency", ["Default"] + account_currencies)
+currency = None if currency == "Default" else currency
+
 # ---- Load data ----
-accounts_df = get_accounts()
-transactions_df = get_transactions()
-budgets_df = get_budgets()
-categories_df = get_categories()
+# Aggregates are computed by the API; only the most recent transactions are downloaded.
+# Every request is issued concurrently over the shared, cached API client.
+data = get_dashboard_data(currency)
+accounts_df = data["accounts"]
+transactions_df = data["transactions"]
+budgets_df = data["budgets"]
+categories_df = data["categories"]
+summary = data["summary"]
+net_worth_df = data["net_worth"]
+changes = data["changes"]
 
 # ---- Metrics ----
 col1, col2, col3 = st.columns(3)
 
 with col1:
-    st.metric("Total Accounts", len(accounts_df), delta=None)
+    st.metric("Total Accounts", summary['account_count'], delta=None)
 
 with col2:
-    st.metric("Total Transactions", len(transactions_df), delta=None)
+    st.metric("Total Transactions", summary['transaction_count'], delta=None)
 
 with col3:
-    st.metric("Total Budgets", len(budgets_df), delta=None)
+    st.metric("Total Budgets", summary['budget_count'], delta=None)
 
 # ---- Accounts Overview ----
-st.metric("Net Worth", f"${transactions_df['amount'].sum():,.2f}")
+st.metric("Net Worth", f"{summary['net_worth']:,.2f} {summary['currency']}")
 
 st.dataframe(transactions_df, use_container_width=True, hide_index=True)
 
-# Calculate cumulative sum by date
-nw_agg = transactions_df.groupby('transaction_date').agg(**{
-    'amount': pd.NamedAgg('amount', np.cumsum)
-}).reset_index()
-st.dataframe(nw_agg, use_container_width=True, hide_index=True)
+# Net worth at the close of each day
+fig = go.Figure(go.Scatter(x=net_worth_df['period'], y=net_worth_df['net_worth'], mode='lines+markers'))
+fig.update_layout(title="Net Worth", xaxis_title="Date", yaxis_title=f"Net Worth ({summary['currency']})")
+st.plotly_chart(fig, use_container_width=True)
+st.dataframe(net_worth_df, use_container_width=True, hide_index=True)
 
-# Calculate daily percent change
-nw_agg['daily_pct_change'] = nw_agg['amount'].pct_change()
 
-# Resample and calculate weekly percent change
-weekly_change = nw_agg.set_index('transaction_date').resample('W')['amount'].last().pct_change()
+def _format_change(granularity: str) -> str:
+    pct_change = changes.get(granularity, {}).get('pct_change')
+    return "n/a" if pct_change is None else f"{pct_change:.2%}"
 
-# Resample and calculate monthly percent change
-monthly_change = nw_agg.set_index('transaction_date').resample('M')['amount'].last().pct_change()
 
 # Display metrics
 st.subheader("Percent Changes")
 metric_col1, metric_col2, metric_col3 = st.columns(3)
 with metric_col1:
-    st.metric("Daily Change", f"{nw_agg['daily_pct_change'].iloc[-1]:.2%}")
+    st.metric("Daily Change", _format_change('day'))
 with metric_col2:
-    st.metric("Weekly Change", f"{weekly_change.iloc[-1]:.2%}")
+    st.metric("Weekly Change", _format_change('week'))
 with metric_col3:
-    st.metric("Monthly Change", f"{monthly_change.iloc[-1]:.2%}")
\ No newline at end of file
+    st.metric("Monthly Change", _format_change('month'))
+
+
+# ---- Budget vs Actual ----
+st.subheader("Budget vs Actual")
+budget_periods_df = data["budget_periods"]
+if budget_periods_df.empty:
+    st.info("No budget periods found.")
+else:
+    period_names = dict(zip(budget_periods_df['period_name'], budget_periods_df['budget_period_id']))
+    period_name = st.selectbox("Budget Period", list(period_names))
+    budget_vs_actual_df = get_budget_vs_actual(period_names[period_name], currency)
+    if budget_vs_actual_df.empty:
+        st.info(f"No budgets found for {period_name}.")
+    else:
+        st.dataframe(
+            budget_vs_actual_df[['category_name', 'allocated_amount', 'spent', 'remaining', 'pct_used']],
+            use_container_width=True,
+            hide_index=True,
+            column_config={"pct_used": st.column_config.ProgressColumn("Used", min_value=0, max_value=1, format="percent")},
+        )
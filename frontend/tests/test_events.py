@@ -0,0 +1,48 @@
+import pytest
+from tools.events import parse_events
+
+
+def test_each_event_is_its_data_lines_joined():
+    lines = [
+        'data: {"table": "transactions",',
+        'data: "op": "INSERT"}',
+        "",
+        'data: {"table": "accounts", "op": "UPDATE"}',
+        "",
+    ]
+    assert list(parse_events(lines)) == [
+        ("data", '{"table": "transactions",\n"op": "INSERT"}'),
+        ("data", '{"table": "accounts", "op": "UPDATE"}'),
+    ]
+
+
+def test_only_one_leading_space_is_dropped():
+    assert list(parse_events(["data:x", "data:  y", "data", ""])) == [("data", "x\n y\n")]
+
+
+def test_comments_and_blank_lines_without_data_are_ignored():
+    lines = [": keep-alive", "", "", ": another", "data: 1", ": between lines", "data: 2", ""]
+    assert list(parse_events(lines)) == [("data", "1\n2")]
+
+
+def test_other_fields_are_ignored():
+    lines = ["event: change", "id: 7", "data: 1", "unknown", ""]
+    assert list(parse_events(lines)) == [("data", "1")]
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("3000", [("retry", "3000")]),
+    ("3.5", []),
+    ("-1", []),
+    ("", []),
+])
+def test_retry_is_passed_on_only_when_it_is_a_whole_number(value, expected):
+    assert list(parse_events([f"retry: {value}"])) == expected
+
+
+def test_retry_arrives_before_the_event_it_came_with():
+    assert list(parse_events(["retry: 500", "data: 1", ""])) == [("retry", "500"), ("data", "1")]
+
+
+def test_an_event_cut_off_before_its_blank_line_is_dropped():
+    assert list(parse_events(["data: 1", "", "data: 2"])) == [("data", "1")]
@@ -1,40 +1,129 @@
-import requests
 import os
+from typing import Optional
 import streamlit as st
 import pandas as pd
+import pyarrow as pa
 from dotenv import load_dotenv
+from tools.client import ApiClient
+from tools.events import ChangeFeed
 load_dotenv()
 
 api_url = f"http://{os.environ.get('API_HOST', 'api')}:{os.environ.get('API_PORT', '8000')}"
 
-@st.cache_data()
-def get_accounts() -> dict:
-    response = requests.get(f"{api_url}/data/accounts")
-    if response.status_code != 200:
-        raise Exception(f"Failed to get accounts: {response.status_code} - {response.text}")
-    return pd.DataFrame(response.json())
-
-@st.cache_data()
-def get_transactions() -> dict:
-    response = requests.get(f"{api_url}/data/transactions")
-    if response.status_code != 200:
-        raise Exception(f"Failed to get transactions: {response.status_code} - {response.text}")
-    df = pd.DataFrame(response.json())
-    df['transaction_date'] = pd.to_datetime(df['transaction_date'])
-    df['amount'] = pd.to_numeric(df['amount'], errors='coerce')
-    return df.sort_values(by='transaction_date').reset_index(drop=True)
-    return pd.DataFrame(response.json())
-
-@st.cache_data()
-def get_budgets() -> dict:
-    response = requests.get(f"{api_url}/data/budgets")
-    if response.status_code != 200:
-        raise Exception(f"Failed to get budgets: {response.status_code} - {response.text}")
-    return pd.DataFrame(response.json())
-
-@st.cache_data()
-def get_categories() -> dict:
-    response = requests.get(f"{api_url}/data/categories")
-    if response.status_code != 200:
-        raise Exception(f"Failed to get categories: {response.status_code} - {response.text}")
-    return pd.DataFrame(response.json())
+# Tables each resource is computed from, so a change to one expires only what it affects
+DEPENDENCIES = {
+    "/data/accounts": ("accounts",),
+    "/data/transactions": ("transactions",),
+    "/data/budgets": ("budgets",),
+    "/data/categories": ("categories",),
+    "/data/budget-periods": ("budget_periods",),
+    "/analytics/summary": ("accounts", "transactions", "budgets", "fx_rates"),
+    "/analytics/net-worth": ("accounts", "transactions", "fx_rates"),
+    "/analytics/changes": ("accounts", "transactions", "fx_rates"),
+    "/analytics/budget-vs-actual": ("accounts", "transactions", "budgets", "budget_periods", "categories", "fx_rates"),
+}
+
+
+@st.cache_resource
+def get_client() -> ApiClient:
+    # One pooled client per Streamlit server process, shared by every session
+    return ApiClient(
+        api_url,
+        ttl=int(os.environ.get('API_CACHE_TTL', '60')),
+        live_ttl=int(os.environ.get('API_LIVE_CACHE_TTL', '3600')),
+        max_entries=int(os.environ.get('API_CACHE_SIZE', '256')),
+        dependencies=DEPENDENCIES,
+    )
+
+
+@st.cache_resource
+def get_change_feed() -> ChangeFeed:
+    # One subscription per Streamlit server process; sessions watch its version
+    return ChangeFeed(get_client()).start()
+
+
+def _to_frame(table: pa.Table) -> pd.DataFrame:
+    # Decimals become floats for charting and UUIDs become strings so they can be
+    # passed straight back to the API; every other column converts without copying.
+    columns = []
+    for field, column in zip(table.schema, table.columns):
+        if pa.types.is_decimal(field.type):
+            column = column.cast(pa.float64())
+        elif isinstance(field.type, pa.UuidType):
+            column = pa.array([None if u is None else str(u) for u in column.to_pylist()], type=pa.string())
+        columns.append(column)
+    return pa.table(columns, names=table.column_names).to_pandas(date_as_object=False)
+
+
+def _in_currency(params: dict, currency: Optional[str]) -> dict:
+    # Without a currency the API reports in its configured base currency
+    return {**params, "currency": currency} if currency else params
+
+
+def get_accounts() -> pd.DataFrame:
+    return _to_frame(get_client().get_table("/data/accounts", what="accounts"))
+
+def get_transactions() -> pd.DataFrame:
+    # Walk the keyset-paginated ledger until the API stops handing back a cursor
+    client = get_client()
+    pages = []
+    params = {"limit": 10000}
+    while True:
+        table, headers = client.get("/data/transactions", params=dict(params), what="transactions", arrow=True)
+        pages.append(table)
+        next_cursor = headers.get("X-Next-Cursor")
+        if not next_cursor:
+            break
+        params["cursor"] = next_cursor
+    # Pages arrive in (transaction_date, transaction_id) order, so no sort is needed
+    return _to_frame(pa.concat_tables(pages, promote_options="permissive"))
+
+def get_budgets() -> pd.DataFrame:
+    return _to_frame(get_client().get_table("/data/budgets", what="budgets"))
+
+def get_categories() -> pd.DataFrame:
+    return _to_frame(get_client().get_table("/data/categories", what="categories"))
+
+def get_recent_transactions(limit: int = 100) -> pd.DataFrame:
+    table = get_client().get_table("/data/transactions", params={"limit": limit, "order": "desc"}, what="transactions")
+    return _to_frame(table)
+
+def get_summary(currency: Optional[str] = None) -> dict:
+    return get_client().get_json("/analytics/summary", params=_in_currency({}, currency), what="summary")
+
+def get_net_worth(granularity: str = "day", currency: Optional[str] = None) -> pd.DataFrame:
+    params = _in_currency({"granularity": granularity}, currency)
+    data = get_client().get_json("/analytics/net-worth", params=params, what="net worth")
+    df = pd.DataFrame(data)
+    df['period'] = pd.to_datetime(df['period'])
+    return df
+
+def get_changes(currency: Optional[str] = None) -> dict:
+    data = get_client().get_json("/analytics/changes", params=_in_currency({}, currency), what="changes")
+    return {row['granularity']: row for row in data}
+
+def get_budget_periods() -> pd.DataFrame:
+    return _to_frame(get_client().get_table("/data/budget-periods", what="budget periods"))
+
+def get_budget_vs_actual(period_id: str, currency: Optional[str] = None) -> pd.DataFrame:
+    params = _in_currency({"period_id": period_id}, currency)
+    data = get_client().get_json("/analytics/budget-vs-actual", params=params, what="budget vs actual")
+    # The API answers with a message object rather than a list when a period has no budgets
+    return pd.DataFrame(data if isinstance(data, list) else [])
+
+def get_dashboard_data(currency: Optional[str] = None) -> dict:
+    """
+    Fetch everything the dashboard needs at once, so the first paint waits on the
+    slowest call rather than the sum of all of them. Amounts are reported in
+    `currency`, or the API's base currency when it is None.
+    """
+    return get_client().gather({
+        "accounts": get_accounts,
+        "transactions": get_recent_transactions,
+        "budgets": get_budgets,
+        "categories": get_categories,
+        "summary": lambda: get_summary(currency),
+        "net_worth": lambda: get_net_worth("day", currency),
+        "changes": lambda: get_changes(currency),
+        "budget_periods": get_budget_periods,
+    })
@@ -0,0 +1,146 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+import pyarrow as pa
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+
+from tools.logger_utility import get_my_logger
+
+logger = get_my_logger("API Client", [])
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+
+class ApiClient:
+    """
+    HTTP client for the Budget Tool API shared by every Streamlit session.
+
+    Connections are kept alive in a pooled requests.Session. Successful GET
+    responses are cached for `ttl` seconds; once an entry expires it is
+    revalidated with If-None-Match, so an unchanged resource costs a 304
+    rather than a full download. Each request carries a fresh X-Request-ID, which
+    the API puts on everything it logs while handling it, and asks for a compressed
+    body in every encoding urllib3 can decode here.
+
+    While `live` is set (a ChangeFeed is connected and expires entries as the
+    underlying tables change) entries are trusted for `live_ttl` seconds instead.
+
+    Expired entries are kept for revalidation until `max_entries` are cached, then
+    the least recently used are dropped, so every page and parameter combination
+    ever requested does not stay in memory for the life of the process.
+    """
+    def __init__(
+        self,
+        base_url: str,
+        ttl: int = 60,
+        pool_size: int = 10,
+        timeout: float = 30,
+        live_ttl: int = 3600,
+        max_entries: int = 256,
+        dependencies: Optional[Dict[str, tuple]] = None,
+    ) -> None:
+        self.base_url = base_url
+        self.ttl = ttl
+        self.live_ttl = live_ttl
+        self.max_entries = max_entries
+        self.live = False
+        self.timeout = timeout
+        # path -> tables its response is computed from; other paths depend on every table
+        self.dependencies = dependencies or {}
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # gzip and deflate, plus br and zstd when their packages are installed; bodies
+        # are decoded before response.content is read
+        self.session.headers["Accept-Encoding"] = make_headers(accept_encoding=True)["accept-encoding"]
+
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="api-client")
+        # (path, params, arrow) -> (fetched_at, etag, data, headers)
+        self._cache: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str, params: Optional[dict] = None, what: str = None, arrow: bool = False):
+        """
+        GET a resource, serving it from the cache while it is fresh.
+
+        :param arrow: ask for an Arrow IPC stream and decode it to a pyarrow Table
+            instead of decoding JSON
+        :return: (decoded body, response headers)
+        """
+        key = (path, tuple(sorted((params or {}).items())), arrow)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+
+        ttl = self.live_ttl if self.live else self.ttl
+        if cached is not None and time.monotonic() - cached[0] < ttl:
+            return cached[2], cached[3]
+
+        request_id = uuid.uuid4().hex
+        headers = {"Accept": ARROW_STREAM if arrow else "application/json", "X-Request-ID": request_id}
+        if cached is not None and cached[1]:
+            headers["If-None-Match"] = cached[1]
+
+        response = self.session.get(f"{self.base_url}{path}", params=params, headers=headers, timeout=self.timeout)
+
+        if response.status_code == 304 and cached is not None:
+            logger.debug(f"{path} not modified; reusing cached response.", extra={"request_id": request_id})
+            data, response_headers = cached[2], cached[3]
+        elif response.status_code == 200:
+            data = pa.ipc.open_stream(response.content).read_all() if arrow else response.json()
+            response_headers = response.headers
+        else:
+            logger.warning(f"Failed to get {path}: {response.status_code}.", extra={"request_id": request_id})
+            raise Exception(f"Failed to get {what or path}: {response.status_code} - {response.text} (request {request_id})")
+
+        with self._lock:
+            self._cache[key] = (time.monotonic(), response.headers.get("ETag"), data, response_headers)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return data, response_headers
+
+    def get_json(self, path: str, params: Optional[dict] = None, what: str = None):
+        return self.get(path, params, what)[0]
+
+    def get_table(self, path: str, params: Optional[dict] = None, what: str = None) -> pa.Table:
+        return self.get(path, params, what, arrow=True)[0]
+
+    def gather(self, loaders: Dict[str, Callable]) -> dict:
+        """
+        Run several loaders at once on the client's thread pool.
+
+        :param loaders: name -> zero-argument callable
+        :return: name -> loader result, once every loader has finished
+        """
+        futures = {name: self.executor.submit(loader) for name, loader in loaders.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+    def expire(self, table: str) -> int:
+        """
+        Mark every cached response computed from `table` ("*" for all of them) as
+        stale, so the next get revalidates it.
+
+        :return: number of entries expired
+        """
+        expired = 0
+        with self._lock:
+            for key, (_, etag, data, headers) in self._cache.items():
+                tables = self.dependencies.get(key[0])
+                if table == "*" or tables is None or table in tables:
+                    self._cache[key] = (float("-inf"), etag, data, headers)
+                    expired += 1
+        return expired
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
@@ -0,0 +1,104 @@
+import json
+import threading
+import time
+from typing import Iterable, Iterator, Optional
+
+import requests
+
+from tools.client import ApiClient
+from tools.logger_utility import get_my_logger
+
+logger = get_my_logger("Change Feed", [])
+
+
+def parse_events(lines: Iterable[str]) -> Iterator[tuple]:
+    """
+    Decode a Server-Sent Events stream.
+
+    :param lines: the stream's lines without line endings
+    :return: (field, value) for each `retry` field and each complete event's data
+    """
+    data = []
+    for line in lines:
+        if not line:
+            if data:
+                yield "data", "\n".join(data)
+                data = []
+        elif line.startswith(":"):
+            continue
+        else:
+            field, _, value = line.partition(":")
+            value = value.removeprefix(" ")
+            if field == "data":
+                data.append(value)
+            elif field == "retry" and value.isdigit():
+                yield "retry", value
+
+
+class ChangeFeed:
+    """
+    Follows the API's /events stream on a background thread and expires the
+    client's cached responses that each table change affects.
+
+    `version` goes up whenever a cached response may be out of date, so a page can
+    compare it with the version it last rendered and rerun only when it differs;
+    the rerun then refetches just the expired responses. While connected the client trusts
+    its cache for longer, since changes expire entries as they happen. The stream
+    is reopened after `reconnect_delay` seconds (or whatever the API asks for)
+    whenever it drops, and everything is expired on reconnecting because changes
+    made in between were missed.
+    """
+    def __init__(self, client: ApiClient, reconnect_delay: float = 5, read_timeout: float = 60) -> None:
+        self.client = client
+        self.reconnect_delay = reconnect_delay
+        self.read_timeout = read_timeout
+        self.version = 0
+        self.connected = False
+        self.last_change: Optional[dict] = None
+        self._thread = threading.Thread(target=self._run, name="api-change-feed", daemon=True)
+
+    def start(self) -> "ChangeFeed":
+        self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        # A session of its own, so the stream never holds one of the client's pooled connections
+        session = requests.Session()
+        while True:
+            try:
+                with session.get(
+                    f"{self.client.base_url}/events",
+                    headers={"Accept": "text/event-stream"},
+                    stream=True,
+                    # The API sends a keep-alive comment every 15 seconds
+                    timeout=(self.client.timeout, self.read_timeout),
+                ) as response:
+                    response.raise_for_status()
+                    self._set_connected(True)
+                    for field, value in parse_events(response.iter_lines(decode_unicode=True)):
+                        if field == "retry":
+                            self.reconnect_delay = int(value) / 1000
+                        else:
+                            self._apply(json.loads(value))
+                logger.info("Change feed closed by the API; reconnecting.")
+            except (requests.RequestException, ValueError) as e:
+                logger.warning(f"Change feed unavailable ({e}); retrying in {self.reconnect_delay:g}s.")
+            self._set_connected(False)
+            time.sleep(self.reconnect_delay)
+
+    def _set_connected(self, connected: bool) -> None:
+        if connected == self.connected:
+            return
+        self.connected = connected
+        self.client.live = connected
+        if connected:
+            logger.info("Change feed connected.")
+            self._apply({"table": "*", "op": "CONNECT"})
+
+    def _apply(self, change: dict) -> None:
+        expired = self.client.expire(change["table"])
+        logger.debug(f"{change['table']} {change['op']}: expired {expired} cached responses.")
+        self.last_change = change
+        # Changes to tables nothing on screen was computed from need no rerun
+        if expired:
+            self.version += 1
@@ -1,10 +1,47 @@
+"""
+Logging for the frontend, as in the API: records are handed to a queue and formatted,
+redacted and written in batches by a listener thread, so a slow console or log file
+never holds up a Streamlit rerun.
+
+Configured from the environment (or .env) on first use, like the API:
+LOG_LEVEL, LOG_LEVELS (per-logger levels, e.g. "API Client=debug"), LOG_SAMPLING
+(per-logger fraction of records below WARNING kept) and LOG_FORMAT (json or text).
+"""
+import atexit
+import json
 import logging
-from enum import Enum
-from typing import List
 import os
+import queue
+import random
+import re
+import sys
+from datetime import datetime, timezone
+from enum import Enum
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List
 
+from dotenv import load_dotenv
 from pydantic import BaseModel
 
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# key=value, key: value and 'key': 'value' pairs whose key names a secret, and passwords in URLs
+SECRET_NAME = re.compile(r"(?i)password|passwd|secret|token|api[_-]?key|authorization")
+SECRET_VALUE = re.compile(
+    r"""(?i)((?:password|passwd|secret|token|api[_-]?key|authorization)['"]?\s*[:=]\s*['"]?(?:(?:bearer|basic)\s+)?)"""
+    r"""[^'"\s,;}&]+"""
+)
+URL_PASSWORD = re.compile(r"(://[^:/@\s]+:)[^@/\s]+@")
+REDACTED = "***"
+# Records waiting for the listener before new ones are dropped rather than block the caller
+QUEUE_SIZE = 10_000
+# Most records written to an output in one go
+WRITE_BATCH = 512
+
+# Attributes every LogRecord has; anything else on a record came from `extra`
+RECORD_ATTRIBUTES = frozenset(logging.makeLogRecord({}).__dict__) | {"message", "asctime"}
+
 
 class LoggingLevel(Enum):
     """
@@ -25,48 +62,234 @@ class LoggerInfo(BaseModel):
     level: LoggingLevel
 
 
+def redact(text: str) -> str:
+    """
+    Mask the values of password/secret/token/api key/authorization pairs and URL passwords.
+    """
+    # Neither can match without one of these, and most messages have neither
+    if "=" not in text and ":" not in text:
+        return text
+    return URL_PASSWORD.sub(rf"\1{REDACTED}@", SECRET_VALUE.sub(rf"\1{REDACTED}", text))
+
+
+def _settings(value: str) -> Dict[str, str]:
+    """
+    Parse "name=value,name=value"; logger names may contain spaces.
+    """
+    pairs = {}
+    for pair in value.split(","):
+        name, _, setting = pair.rpartition("=")
+        if name.strip():
+            pairs[name.strip()] = setting.strip()
+    return pairs
+
+
+def _level(name: str) -> int:
+    try:
+        return LoggingLevel[name.strip().upper()].value
+    except KeyError:
+        raise ValueError(f"Unknown log level {name!r}; use one of {', '.join(l.name.lower() for l in LoggingLevel)}.")
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: time, level, logger, message, then sample_rate and
+    `extra` fields (e.g. request_id) when present, and the exception's traceback if there is one.
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": redact(record.getMessage()),
+        }
+        for key, value in record.__dict__.items():
+            if key not in RECORD_ATTRIBUTES:
+                if SECRET_NAME.search(key):
+                    value = REDACTED
+                elif isinstance(value, str):
+                    value = redact(value)
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = redact(self.formatException(record.exc_info))
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """
+    The classic one-line format, redacted, with the request ID appended when there is one.
+    """
+    def __init__(self) -> None:
+        super().__init__(TEXT_FORMAT)
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = redact(super().format(record))
+        request = getattr(record, "request_id", None)
+        return text if request is None else f"{text} [request {request}]"
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of the records below WARNING from the given loggers.
+    """
+    def __init__(self, rates: Dict[str, float]) -> None:
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.name)
+        if rate is None or record.levelno >= logging.WARNING:
+            return True
+        if random.random() >= rate:
+            return False
+        record.sample_rate = rate
+        return True
+
+
+class LocalQueueHandler(QueueHandler):
+    """
+    Enqueue records for the listener thread with their message rendered, leaving the
+    formatting and the traceback to the listener. When `queue_size` records are
+    waiting new ones are dropped, and a warning with the count goes out once there is room.
+    """
+    def __init__(self, queue_size: int = QUEUE_SIZE) -> None:
+        super().__init__(queue.SimpleQueue())
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._reported = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.queue.qsize() >= self.queue_size:
+            self.dropped += 1
+            return
+        if self.dropped != self._reported:
+            self.queue.put_nowait(logging.makeLogRecord({
+                "name": __name__,
+                "levelno": logging.WARNING,
+                "levelname": "WARNING",
+                "msg": f"Dropped {self.dropped - self._reported} log records; the log output could not keep up.",
+            }))
+            self._reported = self.dropped
+        self.queue.put_nowait(record)
+
+
+class BatchStreamHandler(logging.StreamHandler):
+    """
+    A StreamHandler that holds formatted records until it is flushed (or WRITE_BATCH
+    are waiting) and then writes them all at once.
+    """
+    def __init__(self, stream=None) -> None:
+        super().__init__(stream)
+        self.pending: List[str] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.pending.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+            return
+        if len(self.pending) >= WRITE_BATCH:
+            self.flush()
+
+    def flush(self) -> None:
+        with self.lock:
+            if self.pending:
+                text = self.terminator.join(self.pending) + self.terminator
+                self.pending.clear()
+                self.stream.write(text)
+            if hasattr(self.stream, "flush"):
+                self.stream.flush()
+
+
+class BatchQueueListener(QueueListener):
+    """
+    A QueueListener that flushes its handlers whenever the queue runs dry, rather than
+    after every record, so a burst of records costs one write per output.
+    """
+    def dequeue(self, block: bool) -> logging.LogRecord:
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            for handler in self.handlers:
+                handler.flush()
+            return self.queue.get(block)
+
+    def stop(self) -> None:
+        super().stop()
+        for handler in self.handlers:
+            handler.flush()
+
+
+def _formatter() -> logging.Formatter:
+    return TextFormatter() if os.environ.get("LOG_FORMAT", "json").lower() == "text" else JsonFormatter()
+
+
+@lru_cache(maxsize=None)
+def _configure_logging() -> BatchQueueListener:
+    load_dotenv()
+    output = BatchStreamHandler(sys.stderr)
+    output.setFormatter(_formatter())
+
+    handler = LocalQueueHandler()
+    rates = {name: float(rate) for name, rate in _settings(os.environ.get("LOG_SAMPLING", "")).items()}
+    if rates:
+        handler.addFilter(SamplingFilter(rates))
+
+    root = logging.getLogger()
+    root.setLevel(_level(os.environ.get("LOG_LEVEL", "info")))
+    root.addHandler(handler)
+    for name, level in _settings(os.environ.get("LOG_LEVELS", "")).items():
+        logging.getLogger(name).setLevel(_level(level))
+
+    listener = BatchQueueListener(handler.queue, output, respect_handler_level=True)
+    listener.start()
+    # Writes out whatever is still queued when the process exits
+    atexit.register(listener.stop)
+    return listener
+
+
+def _write_to_file(listener: BatchQueueListener, file_path: str) -> None:
+    """
+    Have the listener write every record to `file_path` as well, once per path.
+    """
+    if not (file_path.endswith(".txt") or file_path.endswith(".log")):
+        raise ValueError(f"file_path '{file_path}' must be a .txt or .log file")
+    path = os.path.abspath(file_path)
+    if any(getattr(handler, "baseFilename", None) == path for handler in listener.handlers):
+        return
+    if os.path.dirname(file_path):
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    file_handler = logging.FileHandler(file_path)
+    file_handler.setFormatter(_formatter())
+    # The listener reads its handlers afresh for every record
+    listener.handlers = (*listener.handlers, file_handler)
+
+
 def get_my_logger(my_logger, logging_infos: List[LoggerInfo] = None, *, write_to_file: bool = False, file_path: str = "temp.log"):
     """
     Get a logger with the specified name and logging level.
 
     :param my_logger: name of logger
     :param logging_infos: what you want to log
-    :param write_to_file: whether to write to file
+    :param write_to_file: whether to write to file (every logger's records, not just this one's)
     :param file_path: name of file to write to
     :return:
     """
-    TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-
-    logging.basicConfig(level=logging.INFO, format=TEXT_FORMAT)
+    listener = _configure_logging()
     logger = logging.getLogger(my_logger)
-    logger.propagate = False  # Prevent double logging if root logger is configured elsewhere
-
-    # Add console handler
-    if not any(isinstance(handler, logging.StreamHandler) for handler in logger.handlers):
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
-        logger.addHandler(console_handler)
 
-    # Add file handler if requested
     if write_to_file:
-        if not (file_path.endswith(".txt") or file_path.endswith(".log")):
-            raise ValueError(f"file_path '{file_path}' must be a .txt or .log file")
-        if os.path.dirname(file_path):
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        if not any(isinstance(handler, logging.FileHandler) for handler in logger.handlers):
-            file_handler = logging.FileHandler(file_path)
-            file_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
-            logger.addHandler(file_handler)
-
-        # Ensure root logger also writes to the file
-        root_logger = logging.getLogger()
-        if not any(isinstance(handler, logging.FileHandler) for handler in root_logger.handlers):
-            root_file_handler = logging.FileHandler(file_path)
-            root_file_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
-            root_logger.addHandler(root_file_handler)
+        _write_to_file(listener, file_path)
 
     if logging_infos:
         for li in logging_infos:
             logging.getLogger(li.name).setLevel(li.level.value)
 
-    return logger
\ No newline at end of file
+    return logger